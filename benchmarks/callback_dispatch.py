@@ -0,0 +1,130 @@
+"""Бенчмарк стоимости диспетчеризации нажатий inline-кнопок.
+
+Сравнивает способы на одном и том же диспетчере aiogram с N зарегистрированными
+кнопками (половина без полей, половина с двумя числовыми полями):
+  filters - прежний: по хендлеру на кнопку с фильтром c.data == ... / startswith(...),
+            поля хендлер разбирает сам через split('-');
+  router  - CallbackRouter: один хендлер, маршрут по префиксу из словаря, поля уже разобраны;
+  legacy  - тот же роутер на данных старого формата (кнопки в старых сообщениях).
+Нажатия распределены по кнопкам равномерно, хендлеры пустые - замеряется только поиск
+хендлера и разбор данных. Результат - микросекунды на апдейт в dp.process_update,
+лучшая из нескольких серий.
+
+Запуск из корня репозитория:
+    python -m benchmarks.callback_dispatch --routes 10,50,100
+
+Код возврата 1, если у роутера время на апдейт при наибольшем N выросло относительно
+наименьшего N больше чем на threshold (поиск маршрута должен быть O(1)).
+"""
+import sys
+import time
+import random
+import asyncio
+import argparse
+
+from aiogram import Bot, Dispatcher, types
+
+from libraries.callbacks import CallbackData, CallbackRouter
+
+def make_routes(count: int):
+    """Кнопки бенчмарка: (CallbackData, данные нового формата, данные старого формата)"""
+    routes = []
+    for index in range(count):
+        if index % 2:
+            data = CallbackData(f'b{index}', ('user_id', int), ('minutes', int), legacy=f'button_{index}')
+            routes.append((data, data.pack(123456789, 60), f'button_{index}-123456789-60'))
+        else:
+            data = CallbackData(f'b{index}', legacy=f'button_{index}')
+            routes.append((data, data.pack(), f'button_{index}'))
+    return routes
+
+def filters_dispatcher(bot: Bot, routes: list):
+    """Прежняя схема: цепочка фильтров, aiogram проверяет их по очереди до первого совпадения"""
+    dp = Dispatcher(bot)
+    for data, _, _ in routes:
+        if data.fields:
+            async def handler(callback: types.CallbackQuery):
+                parts = callback.data.split('-')
+                user_id, minutes = int(parts[1]), int(parts[2])
+            dp.register_callback_query_handler(handler, lambda c, prefix=data.legacy + '-': c.data.startswith(prefix))
+        else:
+            async def handler(callback: types.CallbackQuery):
+                pass
+            dp.register_callback_query_handler(handler, lambda c, legacy=data.legacy: c.data == legacy)
+    return dp
+
+def router_dispatcher(bot: Bot, routes: list):
+    dp = Dispatcher(bot)
+    router = CallbackRouter()
+    router.register(dp)
+    for data, _, _ in routes:
+        if data.fields:
+            async def handler(callback: types.CallbackQuery, user_id: int, minutes: int):
+                pass
+        else:
+            async def handler(callback: types.CallbackQuery):
+                pass
+        router.add(data, handler)
+    return dp
+
+def make_updates(payloads: list, count: int, rng: random.Random):
+    updates = []
+    for update_id in range(count):
+        updates.append(types.Update(**{'update_id': update_id, 'callback_query': {
+            'id': str(update_id), 'chat_instance': '1', 'data': rng.choice(payloads),
+            'from': {'id': 1, 'is_bot': False, 'first_name': 'user'},
+        }}))
+    return updates
+
+async def measure(dp: Dispatcher, updates: list, rounds: int):
+    """Микросекунды на апдейт: лучшая из rounds серий"""
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for update in updates:
+            await dp.process_update(update)
+        elapsed = (time.perf_counter() - started) / len(updates) * 10 ** 6
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+async def run(args):
+    bot = Bot('123456:benchmark')
+    Bot.set_current(bot)
+    results = {}
+    for count in args.routes:
+        routes = make_routes(count)
+        rng = random.Random(args.seed)
+        new_updates = make_updates([new for _, new, _ in routes], args.updates, rng)
+        old_updates = make_updates([old for _, _, old in routes], args.updates, rng)
+        results[count] = {
+            'filters': await measure(filters_dispatcher(bot, routes), old_updates, args.rounds),
+            'router': await measure(router_dispatcher(bot, routes), new_updates, args.rounds),
+            'legacy': await measure(router_dispatcher(bot, routes), old_updates, args.rounds),
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--routes', default='10,50,100', help='числа кнопок через запятую')
+    parser.add_argument('--updates', type=int, default=5000, help='нажатий в серии')
+    parser.add_argument('--rounds', type=int, default=3, help='серий, берется лучшая')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--threshold', type=float, default=0.5, help='допустимый рост у роутера, доля (0.5 = 50%%)')
+    args = parser.parse_args()
+    args.routes = sorted(int(count) for count in args.routes.split(','))
+
+    results = asyncio.run(run(args))
+
+    print(f"{'routes':>7} {'filters, us':>12} {'router, us':>11} {'legacy, us':>11} {'speedup':>8}")
+    for count, times in results.items():
+        speedup = times['filters'] / times['router']
+        print(f"{count:>7} {times['filters']:>12.1f} {times['router']:>11.1f} {times['legacy']:>11.1f} {speedup:>7.1f}x")
+
+    smallest, largest = results[args.routes[0]]['router'], results[args.routes[-1]]['router']
+    growth = largest / smallest - 1
+    if len(args.routes) > 1 and growth > args.threshold:
+        print(f"router dispatch grew by {growth * 100:.0f}% from {args.routes[0]} to {args.routes[-1]} routes")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+"""Локальная заглушка Bot API для проверки бота без сети.
+
+Отвечает на методы, которые вызывает бот (sendMessage, sendDice, deleteMessage и т.д.),
+запоминает все вызовы и умеет доставлять апдейты обоими способами: через getUpdates
+(push) и POST-запросом на вебхук, зарегистрированный через setWebhook (deliver).
+
+Бот направляется на заглушку переменной окружения BOT_API_URL, например:
+    python -m benchmarks.fake_bot_api --port 8081
+    BOT_API_URL=http://127.0.0.1:8081 BOT_TOKEN=123:abc python main.py
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+
+import aiohttp
+from aiohttp import web
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Значения кубиков по эмодзи, как в Telegram
+DICE_VALUES = {'🎰': 64, '🎲': 6, '🎯': 6, '🎳': 6, '🏀': 5, '⚽': 5, '⚽️': 5}
+
+class FakeBotAPI:
+    """Заглушка Bot API на aiohttp.
+
+    latency - искусственная задержка каждого ответа, секунды.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls = []
+        self.updates = []
+        self.webhook_url = None
+        self.webhook_secret = None
+        self.message_ids = itertools.count(1)
+        self.update_ids = itertools.count(1)
+        self._new_updates = asyncio.Event()
+        self._runner = None
+        self._session = None
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def count(self, method: str):
+        return sum(1 for name, _ in self.calls if name == method)
+
+    def message(self, chat_id: int, **fields):
+        result = {
+            'message_id': next(self.message_ids), 'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'supergroup' if chat_id < 0 else 'private', 'title': 'chat'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'bot', 'username': 'bot'},
+        }
+        result.update(fields)
+        return result
+
+    async def handle(self, request: web.Request):
+        method = request.match_info['method']
+        params = dict(await request.post())
+        self.calls.append((method, params))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == 'getUpdates':
+            return self.ok(await self.get_updates(params))
+        if method == 'getMe':
+            return self.ok({'id': 1, 'is_bot': True, 'first_name': 'bot', 'username': 'bot'})
+        if method == 'setWebhook':
+            self.webhook_url = params['url']
+            self.webhook_secret = params.get('secret_token')
+            return self.ok(True)
+        if method == 'getWebhookInfo':
+            return self.ok({'url': self.webhook_url or '', 'has_custom_certificate': False,
+                            'pending_update_count': len(self.updates)})
+        if method == 'deleteWebhook':
+            self.webhook_url = self.webhook_secret = None
+            return self.ok(True)
+
+        chat_id = int(params.get('chat_id', 0))
+        if method in ('sendMessage', 'editMessageText'):
+            return self.ok(self.message(chat_id, text=params.get('text', '')))
+        if method == 'sendDice':
+            emoji = params.get('emoji', '🎲')
+            return self.ok(self.message(chat_id, dice={'emoji': emoji, 'value': random.randint(1, DICE_VALUES.get(emoji, 6))}))
+        return self.ok(True)
+
+    @staticmethod
+    def ok(result):
+        return web.json_response({'ok': True, 'result': result})
+
+    async def get_updates(self, params: dict):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        self.updates = [update for update in self.updates if update['update_id'] >= offset]
+        if not self.updates and int(params.get('timeout') or 0):
+            # Long polling: ждем новых апдейтов, но не дольше секунды
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:limit]
+
+    def message_update(self, user_id: int, chat_id: int, text: str = None, dice: tuple = None):
+        """Апдейт с сообщением пользователя: текст (команды размечаются) или кубик (эмодзи, значение)"""
+        message = self.message(chat_id)
+        message['from'] = {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}', 'username': f'user{user_id}'}
+        if text is not None:
+            message['text'] = text
+            if text.startswith('/'):
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        if dice is not None:
+            message['dice'] = {'emoji': dice[0], 'value': dice[1]}
+        return {'update_id': next(self.update_ids), 'message': message}
+
+    def callback_update(self, user_id: int, chat_id: int, data: str):
+        """Апдейт с нажатием inline-кнопки под сообщением бота"""
+        return {'update_id': next(self.update_ids), 'callback_query': {
+            'id': str(next(self.update_ids)), 'chat_instance': str(chat_id), 'data': data,
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}', 'username': f'user{user_id}'},
+            'message': self.message(chat_id, text='menu'),
+        }}
+
+    def push(self, update: dict):
+        """Отдает апдейт боту через getUpdates"""
+        self.updates.append(update)
+        self._new_updates.set()
+
+    async def deliver(self, update: dict, secret: str = None):
+        """Отправляет апдейт на вебхук бота, возвращает HTTP-статус ответа"""
+        if self.webhook_url is None:
+            raise RuntimeError('Webhook is not set')
+        headers = {SECRET_HEADER: self.webhook_secret if secret is None else secret}
+        async with self._session.post(self.webhook_url, data=json.dumps(update), headers=headers) as response:
+            return response.status
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._session = aiohttp.ClientSession(headers={'Content-Type': 'application/json'})
+        return self.base_url
+
+    async def stop(self):
+        await self._session.close()
+        await self._runner.cleanup()
+
+async def serve(port: int, latency: float):
+    api = FakeBotAPI(port=port, latency=latency)
+    print(f"fake Bot API on {await api.start()}")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await api.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа, секунды')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.port, args.latency))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""Нагрузочный бенчмарк всего диспетчера бота.
+
+Собирает настоящий DP из main.py с MessagesHandler и RatingHandler, направляет Bot на
+локальную заглушку Bot API (FakeBotAPI) и подает через пул воркеров синтетические
+апдейты: броски кубиков, команды и нажатия кнопок рейтинга для заданного числа чатов
+и игроков. База - новая data.db во временном каталоге, с --engine memory - хранилище
+в памяти процесса (MemoryEngine), для сравнения движков хранения.
+
+Отчет: задержка обработки апдейта (p50/p95/p99, в пуле и с ожиданием в очереди),
+SQL-запросов на апдейт, вызовов Bot API на апдейт и устойчивая пропускная способность.
+
+Запуск из корня репозитория (одна и та же команда на разных ветках):
+    python -m benchmarks.load --updates 5000 --chats 50 --users 20 --json load.json
+    python -m benchmarks.load --updates 5000 --chats 50 --users 20 --compare load.json
+
+--rate N подает апдейты с постоянной частотой N в секунду (по умолчанию - так быстро,
+как позволяют очереди воркеров). По умолчанию лимиты Telegram в очереди исходящих
+сняты, чтобы мерить сам бот; --telegram-limits оставляет их.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import importlib
+import tempfile
+import threading
+
+from benchmarks.fake_bot_api import FakeBotAPI, DICE_VALUES
+from libraries.callbacks import RATING_MAIN, RATING_GAME, RATING_PERIOD, RATING_CRITERIA
+
+GAME_EMOJIS = ['🎰', '🎲', '🎯', '🎳', '🏀', '⚽']
+COMMANDS = ['/start', '/mystreak', '/games', '/info']
+CALLBACKS = [
+    RATING_MAIN.pack(), RATING_GAME.pack('dice'), RATING_PERIOD.pack('slots', 'day'),
+    RATING_CRITERIA.pack('slots', 'day', 'wins'), RATING_CRITERIA.pack('dice', 'week', 'tries'),
+    RATING_CRITERIA.pack('bask', 'day', 'winrate'), RATING_CRITERIA.pack('dart', '24h', 'wins'),
+    RATING_CRITERIA.pack('foot', '7d', 'tries'), RATING_CRITERIA.pack('slots', 'week', 'jackpots'),
+    RATING_CRITERIA.pack('bowl', 'day', 'streaks'),
+]
+
+def percentile(values: list, p: float):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+class StatementCounter:
+    """Считает SQL-запросы на всех соединениях базы через sqlite3 trace callback"""
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, statement):
+        with self.lock:
+            self.count += 1
+
+    def attach(self, database):
+        database.conn.set_trace_callback(self)
+        if database.readers is database.writer:
+            return
+        # Каждый поток пула чтения ждет на барьере, поэтому задачи попадут во все потоки
+        workers = database.readers._max_workers
+        barrier = threading.Barrier(workers)
+
+        def attach_reader():
+            database.local.conn.set_trace_callback(self)
+            barrier.wait(timeout=10)
+
+        for future in [database.readers.submit(attach_reader) for _ in range(workers)]:
+            future.result()
+
+def make_updates(api: FakeBotAPI, count: int, chats: int, users: int, mix: dict, rng: random.Random):
+    kinds = list(mix)
+    weights = [mix[kind] for kind in kinds]
+    updates = []
+    for _ in range(count):
+        chat_id = -1000 - rng.randrange(chats)
+        # Игроки чата: свои id у каждого чата, как в разных группах
+        user_id = 10 ** 6 + (-chat_id) * users + rng.randrange(users)
+        kind = rng.choices(kinds, weights)[0]
+        if kind == 'dice':
+            emoji = rng.choice(GAME_EMOJIS)
+            update = api.message_update(user_id, chat_id, dice=(emoji, rng.randint(1, DICE_VALUES[emoji])))
+        elif kind == 'command':
+            update = api.message_update(user_id, chat_id, text=rng.choice(COMMANDS))
+        else:
+            update = api.callback_update(user_id, chat_id, rng.choice(CALLBACKS))
+        updates.append((kind, update))
+    return updates
+
+async def run(args):
+    api = FakeBotAPI(latency=args.latency)
+    await api.start()
+
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.environ.update(BOT_TOKEN='123456:LOAD', BOT_API_URL=api.base_url,
+                      UPDATE_WORKERS=str(args.workers), UPDATE_QUEUE_SIZE=str(args.queue_size),
+                      STORAGE_ENGINE=args.engine)
+    os.environ.pop('WEBHOOK_URL', None)
+    main = importlib.import_module('main')
+    from aiogram import Bot, Dispatcher, types
+    from handlers.messages import MessagesHandler
+    from handlers.rating import RatingHandler
+    from libraries.outbox import TokenBucket
+
+    logging.getLogger().setLevel(logging.WARNING)
+    MessagesHandler(main.DP, main.BOT, main.GAMES, main.USERS, main.OUTBOX)
+    RatingHandler(main.ROUTER, main.BOT, main.USERS, main.RENDER_CACHE)
+    Bot.set_current(main.BOT)
+    Dispatcher.set_current(main.DP)
+
+    if not args.telegram_limits:
+        unlimited = 10 ** 9
+        main.OUTBOX.global_bucket = TokenBucket(unlimited, unlimited)
+        main.OUTBOX.group_rate = main.OUTBOX.group_burst = unlimited
+        main.OUTBOX.private_rate = main.OUTBOX.private_burst = unlimited
+        main.OUTBOX.congrats_limit = unlimited
+
+    rng = random.Random(args.seed)
+    mix = {'dice': args.dice, 'command': args.commands, 'callback': args.callbacks}
+    warmup = make_updates(api, args.warmup, args.chats, args.users, mix, rng)
+    updates = make_updates(api, args.updates, args.chats, args.users, mix, rng)
+
+    enqueued = {}
+    handler_times = {}
+    total_times = {}
+    process_update = main.DP.process_update
+
+    async def timed_process_update(update):
+        started = time.perf_counter()
+        try:
+            return await process_update(update)
+        finally:
+            finished = time.perf_counter()
+            handler_times[update.update_id] = finished - started
+            total_times[update.update_id] = finished - enqueued[update.update_id]
+
+    main.DP.process_update = timed_process_update
+    await main.on_startup(main.DP)
+
+    async def feed(batch):
+        interval = 1 / args.rate if args.rate else 0
+        started = time.perf_counter()
+        for index, (kind, data) in enumerate(batch):
+            if interval:
+                delay = started + index * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            update = types.Update(**data)
+            enqueued[update.update_id] = time.perf_counter()
+            await main.WORKERS.put(update)
+        while len(total_times) < len(enqueued):
+            await asyncio.sleep(0.001)
+
+    # Прогрев: кэши профилей и рейтингов, соединения читателей
+    await feed(warmup)
+    await main.USERS.buffer.flush_async()
+    counter = StatementCounter()
+    # У движка в памяти SQL нет - счетчик запросов остается нулевым
+    if main.DATABASE is not None:
+        await asyncio.get_event_loop().run_in_executor(None, counter.attach, main.DATABASE)
+    enqueued.clear()
+    handler_times.clear()
+    total_times.clear()
+    calls_before = len(api.calls)
+
+    started = time.perf_counter()
+    await feed(updates)
+    elapsed = time.perf_counter() - started
+
+    # Остановка сбрасывает буфер статистики и очередь исходящих - это тоже цена апдейтов
+    await main.on_shutdown(main.DP)
+    await (await main.BOT.get_session()).close()
+    outbound = [name for name, _ in api.calls[calls_before:]]
+    await api.stop()
+
+    by_kind = {}
+    for kind, data in updates:
+        by_kind.setdefault(kind, []).append(handler_times[data['update_id']] * 1000)
+    handler = [value * 1000 for value in handler_times.values()]
+    total = [value * 1000 for value in total_times.values()]
+    return {
+        'updates': len(updates),
+        'chats': args.chats,
+        'users': args.users,
+        'rate': args.rate,
+        'engine': args.engine,
+        'throughput': len(updates) / elapsed,
+        'handler_p50_ms': percentile(handler, 50),
+        'handler_p95_ms': percentile(handler, 95),
+        'handler_p99_ms': percentile(handler, 99),
+        'total_p50_ms': percentile(total, 50),
+        'total_p95_ms': percentile(total, 95),
+        'total_p99_ms': percentile(total, 99),
+        'sql_per_update': counter.count / len(updates),
+        'api_calls_per_update': len(outbound) / len(updates),
+        'api_calls': {name: outbound.count(name) for name in sorted(set(outbound))},
+        'handler_p95_ms_by_kind': {kind: percentile(values, 95) for kind, values in by_kind.items()},
+    }
+
+def report(result: dict, baseline: dict = None):
+    rows = [
+        ('throughput, updates/s', 'throughput'),
+        ('handler p50, ms', 'handler_p50_ms'),
+        ('handler p95, ms', 'handler_p95_ms'),
+        ('handler p99, ms', 'handler_p99_ms'),
+        ('with queue wait p50, ms', 'total_p50_ms'),
+        ('with queue wait p95, ms', 'total_p95_ms'),
+        ('with queue wait p99, ms', 'total_p99_ms'),
+        ('SQL statements / update', 'sql_per_update'),
+        ('Bot API calls / update', 'api_calls_per_update'),
+    ]
+    print(f"{result['updates']} updates, {result['chats']} chats x {result['users']} users, "
+          f"rate {result['rate'] or 'max'}, storage {result.get('engine', 'sqlite')}")
+    for title, key in rows:
+        line = f"  {title:<26} {result[key]:>10.3f}"
+        if baseline is not None and baseline.get(key):
+            line += f"   baseline {baseline[key]:>10.3f} ({(result[key] / baseline[key] - 1) * 100:+.1f}%)"
+        print(line)
+    print(f"  handler p95 by kind, ms    " + ', '.join(
+        f"{kind} {value:.2f}" for kind, value in sorted(result['handler_p95_ms_by_kind'].items())))
+    print(f"  Bot API calls              " + ', '.join(
+        f"{name} {count}" for name, count in result['api_calls'].items()))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--warmup', type=int, default=500)
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--users', type=int, default=20, help='игроков в каждом чате')
+    parser.add_argument('--dice', type=float, default=0.85, help='доля бросков')
+    parser.add_argument('--commands', type=float, default=0.05, help='доля команд')
+    parser.add_argument('--callbacks', type=float, default=0.10, help='доля нажатий кнопок рейтинга')
+    parser.add_argument('--rate', type=float, default=0, help='апдейтов в секунду, 0 - максимум')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--queue-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа заглушки Bot API, секунды')
+    parser.add_argument('--engine', choices=('sqlite', 'memory'), default='sqlite', help='движок хранения')
+    parser.add_argument('--telegram-limits', action='store_true', help='оставить лимиты Telegram в очереди исходящих')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='сохранить результат в файл')
+    parser.add_argument('--compare', help='сравнить с результатом из файла')
+    args = parser.parse_args()
+
+    # main.py и файлы бенчмарка импортируются из корня репозитория, даже после chdir
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    baseline = None
+    if args.compare:
+        with open(os.path.abspath(args.compare)) as f:
+            baseline = json.load(f)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    result = asyncio.run(run(args))
+    report(result, baseline)
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Проверка планов запросов движка SQLite: каждый запрос статистики, загрузки рейтингов
+и лога бросков должен искать по индексу, а не сканировать таблицу целиком.
+
+Проверяется тот SQL, который выполняют методы SQLiteEngine: метод вызывается на пустой
+(или заполненной с --rows) базе, его запросы перехватываются через sqlite3 trace callback,
+и для каждого снимается EXPLAIN QUERY PLAN. Код возврата 1, если какой-то план не совпал
+или метод не выполнил ни одного SELECT.
+
+Рейтинги строятся в памяти (libraries.leaderboards) из period_rows и win_streaks при запуске,
+поэтому отдельных запросов рейтинга с ORDER BY/LIMIT в движке нет - проверяются запросы загрузки.
+
+Запуск из корня репозитория:
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --rows 200000   # плюс время запросов на заполненной базе
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+from database.database import Database
+from database.sqlite_engine import SQLiteEngine
+
+GAMES = ('slots', 'dice', 'dart', 'bask', 'foot', 'bowl')
+BASE_TABLES = (
+    'daily_stats', 'weekly_stats', 'win_streaks', 'tries', 'wins', 'jackpots', 'users',
+    'rolls', 'user_blocks', 'help_messages',
+)
+
+def expected_queries(storage: SQLiteEngine):
+    """Методы движка под проверкой: (название, вызов, индекс, которым обязаны пользоваться его запросы)"""
+    day = '2024-01-01'
+    return [
+        ('get_daily_stats', lambda: storage.period_stats('day', -1, day), 'idx_daily_stats_period'),
+        ('get_weekly_stats', lambda: storage.period_stats('week', -1, day), 'idx_weekly_stats_period'),
+        ('load_leaderboards day', lambda: storage.period_rows('day', day), 'idx_daily_stats_period'),
+        ('load_leaderboards week', lambda: storage.period_rows('week', day), 'idx_weekly_stats_period'),
+        ('get_win_streaks', lambda: storage.win_streaks(-1), 'idx_win_streaks_chat'),
+        ('get_win_streaks game', lambda: storage.win_streaks(-1, 'dice'), 'idx_win_streaks_chat'),
+        ('rolls_since', lambda: storage.rolls_since(int(time.time()) - 7 * 86400), 'idx_rolls_time'),
+        ('roll_counts', lambda: storage.roll_counts(-1, int(time.time()) - 86400, ('win', 'jackpot')), 'idx_rolls_chat'),
+        ('pending_help_messages', storage.pending_help_messages, 'idx_help_messages_status'),
+    ]
+
+def captured_selects(database: Database, call):
+    """SELECT-запросы, которые выполнил вызов метода движка, с подставленными параметрами"""
+    statements = []
+    database.conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        database.conn.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith('SELECT')]
+
+def check_plan(cur, sql: str, params, index: str):
+    """Возвращает (успех, строки плана)"""
+    cur.execute('EXPLAIN QUERY PLAN ' + sql, params)
+    plan = [row[3] for row in cur.fetchall()]
+
+    uses_index = any(f'INDEX {index} ' in line or line.endswith(f'INDEX {index}') for line in plan)
+    full_scan = any(line.startswith(f'SCAN {table}') for line in plan for table in BASE_TABLES)
+    return uses_index and not full_scan, plan
+
+def seed(storage: SQLiteEngine, rows: int, chats: int):
+    """Заполняет таблицы периодов и серий случайной историей за прошедшие дни"""
+    rnd = random.Random(1)
+    per_day = max(1, rows // 365)
+    daily, weekly, streaks = {}, {}, {}
+    for day in range(365):
+        date = time.strftime('%Y-%m-%d', time.localtime(time.time() - day * 86400))
+        for _ in range(per_day):
+            key = (rnd.randint(1, 500), -rnd.randint(1, chats), rnd.choice(GAMES))
+            tries = rnd.randint(1, 50)
+            daily[key + (date,)] = (tries, rnd.randint(0, tries), 0)
+            weekly[key + (date[:8] + '01',)] = (tries, rnd.randint(0, tries), 0)
+            streaks[key] = rnd.randint(0, 8)
+
+    cur = storage.cur
+    cur.execute('BEGIN')
+    cur.executemany(
+        'INSERT OR REPLACE INTO daily_stats (id, chat_id, game_type, date, tries, wins, jackpots) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [key + value for key, value in daily.items()]
+    )
+    cur.executemany(
+        'INSERT OR REPLACE INTO weekly_stats (id, chat_id, game_type, week_start, tries, wins, jackpots) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [key + value for key, value in weekly.items()]
+    )
+    cur.executemany(
+        'INSERT OR REPLACE INTO win_streaks (id, chat_id, game_type, current_streak, max_streak) VALUES (?, ?, ?, 0, ?)',
+        [key + (value,) for key, value in streaks.items()]
+    )
+    cur.execute('COMMIT')
+    cur.execute('ANALYZE')
+    return len(daily)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=0, help='заполнить базу историей и замерить время запросов')
+    parser.add_argument('--chats', type=int, default=100)
+    args = parser.parse_args()
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(os.path.join(directory, 'plans.db'))
+        storage = SQLiteEngine(database)
+
+        if args.rows:
+            print(f"seeded {seed(storage, args.rows, args.chats)} daily_stats rows")
+
+        for name, call, index in expected_queries(storage):
+            statements = captured_selects(database, call)
+            if not statements:
+                print(f"FAIL {name:<26} метод не выполнил ни одного SELECT")
+                failed += 1
+                continue
+            for sql in statements:
+                ok, plan = check_plan(storage.cur, sql, (), index)
+                line = f"{'OK  ' if ok else 'FAIL'} {name:<26}"
+                if args.rows:
+                    started = time.perf_counter()
+                    storage.cur.execute(sql)
+                    storage.cur.fetchall()
+                    line += f" {(time.perf_counter() - started) * 1000:8.3f} ms"
+                print(line)
+                if not ok:
+                    failed += 1
+                    print('     ' + ' '.join(sql.split()))
+                    print('     ' + '\n     '.join(plan))
+
+        database.close()
+
+    if failed:
+        print(f"{failed} queries do not use their index")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Бенчмарк записи броска: сколько SQL-запросов и коммитов уходит на один бросок.
+
+Сравнивает три способа:
+  per-counter  - старая цепочка вызовов из process_dice (increment, update_win_streak,
+                 increment_period_stats), каждый со своим коммитом;
+  record_roll  - Users.record_roll, одна транзакция на UPSERT-ах;
+  buffered     - AsyncUsers.record_roll: серия в памяти, счетчики и серии через буфер отложенной записи.
+
+Запуск из корня репозитория:
+    python -m benchmarks.record_roll --rolls 5000
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+from database.database import Database
+from database.sqlite_engine import SQLiteEngine
+from libraries.users import Users, AsyncUsers
+
+GAMES = {
+    'slots': {'win': [1, 22, 43], 'jackpot': 64, 'values': 64},
+    'dice': {'win': [1], 'values': 6},
+    'dart': {'win': [6], 'values': 6},
+    'bask': {'win': [4, 5], 'values': 5},
+    'foot': {'win': [3, 5], 'values': 5},
+    'bowl': {'win': [6], 'values': 6},
+}
+
+class StatementCounter:
+    """Считает выполненные запросы и коммиты через trace callback соединения"""
+
+    def __init__(self, conn):
+        self.statements = 0
+        self.commits = 0
+        conn.set_trace_callback(self.trace)
+
+    def trace(self, statement: str):
+        keyword = statement.lstrip().split(' ', 1)[0].upper()
+        if keyword == 'COMMIT':
+            self.commits += 1
+        elif keyword != 'BEGIN':
+            self.statements += 1
+
+def generate_rolls(count: int, users: int, chats: int, seed: int = 42):
+    rnd = random.Random(seed)
+    rolls = []
+    for _ in range(count):
+        game = rnd.choice(list(GAMES))
+        info = GAMES[game]
+        value = rnd.randint(1, info['values'])
+        if value == info.get('jackpot'):
+            outcome = 'jackpot'
+        elif value in info['win']:
+            outcome = 'win'
+        else:
+            outcome = 'loss'
+        rolls.append((rnd.randint(1, users), -rnd.randint(1, chats), game, value, outcome))
+    return rolls
+
+def run_per_counter(users: Users, rolls: list):
+    for user_id, chat_id, game, value, outcome in rolls:
+        users.increment('tries', user_id, chat_id, game)
+        if outcome == 'jackpot':
+            users.increment('jackpots', user_id, chat_id, 'slots')
+        if outcome != 'loss':
+            users.increment('wins', user_id, chat_id, game)
+        users.update_win_streak(user_id, chat_id, game, outcome != 'loss')
+        users.increment_period_stats(
+            user_id, chat_id, game, 1, int(outcome != 'loss'), int(outcome == 'jackpot')
+        )
+
+def run_record_roll(users: Users, rolls: list):
+    for roll in rolls:
+        users.record_roll(*roll)
+
+def run_buffered(users: Users, rolls: list):
+    async def run():
+        repository = AsyncUsers(users)
+        repository.buffer.start()
+        for roll in rolls:
+            await repository.record_roll(*roll)
+        await repository.buffer.stop()
+    asyncio.run(run())
+
+SCENARIOS = {
+    'per-counter': run_per_counter,
+    'record_roll': run_record_roll,
+    'buffered': run_buffered,
+}
+
+def measure(name: str, rolls: list):
+    with tempfile.TemporaryDirectory() as directory:
+        database = Database(os.path.join(directory, 'bench.db'))
+        users = Users(SQLiteEngine(database))
+        counter = StatementCounter(database.conn)
+
+        started = time.perf_counter()
+        SCENARIOS[name](users, rolls)
+        elapsed = time.perf_counter() - started
+
+        database.close()
+
+    return {
+        'statements': counter.statements / len(rolls),
+        'commits': counter.commits / len(rolls),
+        'rolls_per_sec': len(rolls) / elapsed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rolls', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--chats', type=int, default=5)
+    parser.add_argument('--scenario', choices=list(SCENARIOS), action='append')
+    args = parser.parse_args()
+
+    rolls = generate_rolls(args.rolls, args.users, args.chats)
+
+    print(f"{'scenario':<12} {'stmts/roll':>10} {'commits/roll':>12} {'rolls/sec':>10}")
+    for name in args.scenario or list(SCENARIOS):
+        result = measure(name, rolls)
+        print(f"{name:<12} {result['statements']:>10.2f} {result['commits']:>12.2f} {result['rolls_per_sec']:>10.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Сквозная проверка и замер шардированного режима (shards.py) на заглушке Bot API.
+
+Запускает фронт с заданным числом шардов во временном каталоге, подает через getUpdates
+апдейты многих чатов (броски и нажатия кнопок рейтинга, последний апдейт каждого чата -
+кнопка) и ждет, пока на все кнопки придут ответы. Затем проверяет координацию: админ
+сбрасывает все рейтинги, и сброс должны подтвердить все шарды. По SIGINT фронт
+дорабатывает очереди и останавливает шарды.
+
+Запуск из корня репозитория, сравнение масштабирования по ядрам:
+    python -m benchmarks.shards_e2e --shards 1,4 --updates 4000 --chats 200
+"""
+import os
+import sys
+import time
+import random
+import signal
+import asyncio
+import argparse
+import tempfile
+
+from benchmarks.fake_bot_api import FakeBotAPI, DICE_VALUES
+from benchmarks.load import GAME_EMOJIS, CALLBACKS
+from benchmarks.webhook_e2e import ROOT, free_port, wait_for
+
+ADMIN_ID = 1773287874
+
+def make_updates(api: FakeBotAPI, count: int, chats: int, users: int, rng: random.Random):
+    """Апдейты по чатам вперемешку; у каждого чата последний апдейт - кнопка рейтинга"""
+    per_chat = {}
+    for _ in range(count):
+        chat_id = -1000 - rng.randrange(chats)
+        user_id = 10 ** 6 + (-chat_id) * users + rng.randrange(users)
+        if rng.random() < 0.8:
+            emoji = rng.choice(GAME_EMOJIS)
+            update = api.message_update(user_id, chat_id, dice=(emoji, rng.randint(1, DICE_VALUES[emoji])))
+        else:
+            update = api.callback_update(user_id, chat_id, rng.choice(CALLBACKS))
+        per_chat.setdefault(chat_id, []).append(update)
+    for chat_id, chat_updates in per_chat.items():
+        chat_updates.append(api.callback_update(10 ** 6 + (-chat_id) * users, chat_id, rng.choice(CALLBACKS)))
+    # Перемешиваем чаты, сохраняя порядок внутри чата
+    updates, callbacks = [], 0
+    queues = list(per_chat.values())
+    while queues:
+        queue = rng.choice(queues)
+        update = queue.pop(0)
+        updates.append(update)
+        callbacks += 'callback_query' in update
+        if not queue:
+            queues.remove(queue)
+    return updates, callbacks
+
+async def run(shards: int, args):
+    api = FakeBotAPI()
+    await api.start()
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ, BOT_TOKEN='123456:SHARDS', BOT_API_URL=api.base_url,
+               SHARDS=str(shards), SHARD_BASE_PORT=str(args.base_port or free_port()),
+               UPDATE_WORKERS=str(args.workers))
+    env.pop('WEBHOOK_URL', None)
+    log_path = os.path.join(workdir, 'shards.log')
+    log = open(log_path, 'wb')
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, 'shards.py'), cwd=workdir, env=env, stdout=log, stderr=log
+    )
+    try:
+        rng = random.Random(args.seed)
+        # Прогрев: по команде в каждый шард, ждем ответы - шарды запущены
+        for index in range(shards):
+            api.push(api.message_update(1, -index - 1 if shards > 1 else -1, text='/start'))
+        await wait_for(lambda: api.count('sendMessage') >= shards, 60, 'shards startup')
+
+        updates, callbacks = make_updates(api, args.updates, args.chats, args.users, rng)
+        answered = api.count('answerCallbackQuery')
+        started = time.monotonic()
+        for update in updates:
+            api.push(update)
+        await wait_for(lambda: api.count('answerCallbackQuery') - answered >= callbacks, 300, 'all callbacks')
+        elapsed = time.monotonic() - started
+        throughput = len(updates) / elapsed
+        print(f"shards {shards}: {len(updates)} updates in {elapsed:.2f}s, {throughput:.0f} updates/s")
+
+        # Координация: сброс всех рейтингов из личного чата админа подтверждают все шарды
+        edits = api.count('editMessageText')
+        api.push(api.callback_update(ADMIN_ID, ADMIN_ID, 'admin-reset-all'))
+        await wait_for(lambda: api.count('editMessageText') > edits, 60, 'reset reply')
+        text = [params for name, params in api.calls if name == 'editMessageText'][-1]['text']
+        assert 'успешно сброшены' in text, text
+        print(f"shards {shards}: admin-reset-all confirmed by all shards")
+
+        process.send_signal(signal.SIGINT)
+        await asyncio.wait_for(process.wait(), 120)
+        assert process.returncode == 0, process.returncode
+        return throughput
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        log.close()
+        if process.returncode != 0:
+            with open(log_path, errors='replace') as f:
+                print(f.read()[-3000:])
+        await api.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', default='1,4', help='числа шардов через запятую')
+    parser.add_argument('--updates', type=int, default=4000)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--users', type=int, default=10, help='игроков в каждом чате')
+    parser.add_argument('--workers', type=int, default=8, help='воркеров в каждом шарде')
+    parser.add_argument('--base-port', type=int, default=0, help='первый порт шардов, 0 - свободный порт')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    results = {}
+    for shards in (int(value) for value in args.shards.split(',')):
+        results[shards] = asyncio.run(run(shards, args))
+    base = results[min(results)]
+    for shards, throughput in results.items():
+        print(f"  {shards:>3} shards  {throughput:>8.0f} updates/s  x{throughput / base:.2f}")
+
+if __name__ == '__main__':
+    main()
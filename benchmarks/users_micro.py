@@ -0,0 +1,218 @@
+"""Микробенчмарки методов Users на базах реалистичного размера с порогами регрессии.
+
+Для каждого размера (число строк daily_stats + weekly_stats) заполняет новую базу историей
+за 35 дней и 8 недель по многим чатам, как после обслуживания, и замеряет время вызова
+методов, от которых зависят задержка броска и рейтингов. Результат метода - медиана
+времени вызова в микросекундах, лучшая из нескольких серий.
+
+Запуск из корня репозитория:
+    python -m benchmarks.users_micro --sizes 10000,100000 --save-baseline
+    python -m benchmarks.users_micro --sizes 10000,100000 --threshold 0.5
+    python -m benchmarks.users_micro --sizes 10000 --engine memory   # движок хранения в памяти
+
+С сохраненной базовой линией (по умолчанию benchmarks/users_micro_baseline.json)
+код возврата 1, если какой-то метод стал медленнее базовой линии больше чем на threshold
+и при этом больше чем на noise-floor микросекунд: у методов в несколько микросекунд
+относительный разброс между запусками сам по себе доходит до десятков процентов.
+Базовая линия зависит от машины: ее сохраняют на той же машине (или раннере CI),
+на которой потом сравнивают.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+from database.database import Database
+from database.engine import GAME_COLUMNS
+from database.sqlite_engine import SQLiteEngine
+from database.memory_engine import MemoryEngine
+from libraries.users import Users
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'users_micro_baseline.json')
+
+KEEP_DAYS = 35
+KEEP_WEEKS = 8
+
+def seed(storage, rows: int, chats: int, players: int, rng: random.Random):
+    """Заполняет дневную и недельную статистику (rows строк на двоих), счетчики и серии игроков.
+
+    Возвращает список чатов. Строки дней равномерно распределены по KEEP_DAYS дням, недель -
+    по KEEP_WEEKS неделям, поэтому на текущий день приходится около 1/35 дневных строк.
+    """
+    today = datetime.now().date()
+    week_start = today - timedelta(days=today.weekday())
+    dates = [(today - timedelta(days=day)).strftime("%Y-%m-%d") for day in range(KEEP_DAYS)]
+    weeks = [(week_start - timedelta(weeks=week)).strftime("%Y-%m-%d") for week in range(KEEP_WEEKS)]
+    chat_ids = [-(10 ** 9) - chat for chat in range(chats)]
+
+    def random_key():
+        chat_id = rng.choice(chat_ids)
+        return rng.randrange(players) + 1, chat_id, rng.choice(GAME_COLUMNS)
+
+    daily, weekly, players_seen = {}, {}, set()
+    while len(daily) < rows * KEEP_DAYS // (KEEP_DAYS + KEEP_WEEKS):
+        key = random_key()
+        daily[key + (rng.choice(dates),)] = None
+        players_seen.add(key)
+    while len(weekly) < rows - len(daily):
+        key = random_key()
+        weekly[key + (rng.choice(weeks),)] = None
+        players_seen.add(key)
+
+    def counters():
+        tries = rng.randint(1, 40)
+        wins = rng.randint(0, tries)
+        return tries, wins, int(rng.random() < 0.05)
+
+    # Заполнение одной транзакцией через интерфейс движка, как пересборка по логу бросков
+    now = int(time.time())
+    keys = sorted(players_seen)
+    storage.replace_aggregates(
+        counters={key: [rng.randint(1, 500), rng.randint(0, 500), rng.randint(0, 5)] for key in keys},
+        last_roll={key[:2]: now for key in keys},
+        daily={key: list(counters()) for key in sorted(daily)},
+        weekly={key: list(counters()) for key in sorted(weekly)},
+        monthly={},
+        streaks=[key + (0, rng.randint(0, 10), None) for key in keys],
+    )
+    return chat_ids, keys
+
+def benchmarks(users: Users, chat_ids: list, keys: list, rng: random.Random):
+    """Методы под замером: имя -> функция одного вызова со случайными аргументами"""
+    def pick():
+        return rng.choice(keys)
+
+    def increment():
+        user_id, chat_id, game = pick()
+        users.increment('tries', user_id, chat_id, game)
+
+    def update_win_streak():
+        user_id, chat_id, game = pick()
+        users.update_win_streak(user_id, chat_id, game, rng.random() < 0.3)
+
+    def increment_period_stats():
+        user_id, chat_id, game = pick()
+        users.increment_period_stats(user_id, chat_id, game, 1, int(rng.random() < 0.3), 0)
+
+    def get_daily_stats():
+        users.get_daily_stats(rng.choice(chat_ids))
+
+    def get_win_streaks():
+        users.get_win_streaks(rng.choice(chat_ids), rng.choice(GAME_COLUMNS))
+
+    def get_all():
+        users.get_all('tries', rng.choice(chat_ids))
+
+    return {
+        'increment': increment,
+        'update_win_streak': update_win_streak,
+        'increment_period_stats': increment_period_stats,
+        'get_daily_stats': get_daily_stats,
+        'get_win_streaks': get_win_streaks,
+        'get_all': get_all,
+    }
+
+def measure(func, calls: int, rounds: int):
+    """Медиана времени вызова в микросекундах: лучшая из rounds серий по calls вызовов"""
+    best = None
+    for _ in range(rounds):
+        times = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - started)
+        median = statistics.median(times) * 10 ** 6
+        best = median if best is None else min(best, median)
+    return best
+
+def make_storage(engine: str, directory: str):
+    if engine == 'memory':
+        return MemoryEngine()
+    return SQLiteEngine(Database(os.path.join(directory, 'micro.db')))
+
+def run_size(rows: int, args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        storage = make_storage(args.engine, directory)
+        started = time.perf_counter()
+        chat_ids, keys = seed(storage, rows, args.chats, args.players, rng)
+        if args.engine == 'sqlite':
+            storage.cur.execute('ANALYZE')
+        seeded = time.perf_counter() - started
+        # Users на заполненной базе - как после перезапуска бота (серии и рейтинги в памяти)
+        users = Users(storage)
+        print(f"{rows} period rows in {len(chat_ids)} chats, {len(keys)} player/game keys (seeded in {seeded:.1f}s)")
+
+        results = {}
+        for name, func in benchmarks(users, chat_ids, keys, rng).items():
+            if args.method and name not in args.method:
+                continue
+            results[name] = measure(func, args.calls, args.rounds)
+        storage.close()
+    return results
+
+def compare(results: dict, baseline: dict, threshold: float, noise_floor: float):
+    """Печатает таблицу, возвращает список регрессий (размер, метод, было, стало)"""
+    regressions = []
+    print(f"{'rows':>8} {'method':<24} {'median, us':>11} {'baseline':>10} {'change':>8}")
+    for size, methods in results.items():
+        for name, value in methods.items():
+            base = baseline.get(size, {}).get(name)
+            line = f"{size:>8} {name:<24} {value:>11.1f}"
+            if base:
+                change = value / base - 1
+                line += f" {base:>10.1f} {change * 100:>+7.1f}%"
+                if change > threshold and value - base > noise_floor:
+                    line += '  REGRESSION'
+                    regressions.append((size, name, base, value))
+            print(line)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000', help='размеры баз через запятую (строк периодов)')
+    parser.add_argument('--chats', type=int, default=500)
+    parser.add_argument('--players', type=int, default=50, help='игроков на чат')
+    parser.add_argument('--calls', type=int, default=1000, help='вызовов в серии')
+    parser.add_argument('--rounds', type=int, default=5, help='серий, берется лучшая медиана')
+    parser.add_argument('--method', action='append', help='замерить только этот метод (можно несколько)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--engine', choices=('sqlite', 'memory'), default='sqlite', help='движок хранения')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='записать результаты как базовую линию')
+    parser.add_argument('--threshold', type=float, default=0.5, help='допустимое замедление, доля (0.5 = 50%%)')
+    parser.add_argument('--noise-floor', type=float, default=5.0,
+                        help='замедление меньше стольких микросекунд не считается регрессией')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    # Базовые линии движков хранятся рядом: ключ sqlite - просто размер, у других - engine:размер
+    results = {}
+    for size in args.sizes.split(','):
+        label = size.strip() if args.engine == 'sqlite' else f"{args.engine}:{size.strip()}"
+        results[label] = run_size(int(size), args)
+
+    regressions = compare(results, {} if args.save_baseline else baseline, args.threshold, args.noise_floor)
+
+    if args.save_baseline:
+        # Размеры и методы, которые не замерялись в этот раз, остаются из старой базовой линии
+        for size, methods in results.items():
+            baseline.setdefault(size, {}).update(methods)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"{len(regressions)} methods regressed by more than {args.threshold * 100:.0f}%")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Сквозная проверка режима вебхука на локальной заглушке Bot API.
+
+Запускает main.py отдельным процессом во временном каталоге (своя data.db) в режиме
+вебхука, направив его на FakeBotAPI. Проверяет, что бот регистрирует вебхук с секретом,
+отвергает запросы с неверным токеном, быстро отвечает 200, обрабатывает все апдейты
+и по SIGINT дорабатывает принятые апдейты перед выходом.
+
+Запуск из корня репозитория:
+    python -m benchmarks.webhook_e2e --updates 200
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def wait_for(condition, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"timeout waiting for {what}")
+        await asyncio.sleep(0.05)
+
+async def run(updates: int, chats: int):
+    api = FakeBotAPI()
+    await api.start()
+    port = free_port()
+    env = dict(
+        os.environ,
+        BOT_TOKEN='123456:TEST', BOT_API_URL=api.base_url,
+        WEBHOOK_URL=f'http://127.0.0.1:{port}/webhook', WEBHOOK_SECRET='e2e-secret',
+        WEBHOOK_HOST='127.0.0.1', WEBHOOK_PORT=str(port),
+    )
+    workdir = tempfile.mkdtemp()
+    log_path = os.path.join(workdir, 'bot.log')
+    log = open(log_path, 'wb')
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, 'main.py'), cwd=workdir, env=env, stdout=log, stderr=log
+    )
+    try:
+        await wait_for(lambda: api.webhook_url is not None, 30, 'setWebhook')
+        assert api.webhook_secret == 'e2e-secret', api.webhook_secret
+        print(f"webhook registered: {api.webhook_url}")
+
+        status = await api.deliver(api.message_update(1, -1, text='/start'), secret='wrong')
+        assert status == 401, status
+        print("wrong secret rejected with 401")
+
+        # Каждый апдейт - команда /start в одном из чатов, на нее бот отвечает одним sendMessage
+        sent_before = api.count('sendMessage')
+        started = time.monotonic()
+        latencies = []
+        for i in range(updates):
+            update = api.message_update(100 + i % chats, -(1 + i % chats), text='/start')
+            t = time.monotonic()
+            status = await api.deliver(update)
+            latencies.append(time.monotonic() - t)
+            assert status == 200, status
+        acked = time.monotonic() - started
+        latencies.sort()
+        print(f"{updates} updates acknowledged in {acked:.2f}s, "
+              f"ack p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+
+        # Сразу останавливаем бот: то, что не успело обработаться, должно доработаться при остановке
+        process.send_signal(signal.SIGINT)
+        await asyncio.wait_for(process.wait(), 60)
+        replies = api.count('sendMessage') - sent_before
+        print(f"bot exited with code {process.returncode}, replies sent: {replies}/{updates}")
+        assert replies == updates, (replies, updates)
+        print("OK")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        log.close()
+        if process.returncode != 0:
+            with open(log_path, errors='replace') as f:
+                print(f.read()[-3000:])
+        print(f"bot log: {log_path}")
+        await api.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--chats', type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.updates, args.chats))
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,90 @@
 import sqlite3
 import time
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from database.profiler import ProfiledCursor
+from libraries.tracing import TracedCursor
+
+logger = logging.getLogger(__name__)
 
 class Database():
-    def __init__(self, name: str = 'database.db'):
+    """Подключение к SQLite: один поток записи и пул потоков чтения.
+
+    Все записи выполняются в единственном потоке writer на основном соединении,
+    чтения - в пуле readers, где у каждого потока свое read-only соединение.
+    Режим WAL позволяет читателям не ждать, пока пишется статистика бросков.
+    Если передан profiler (QueryProfiler), курсоры записи и чтения замеряют каждый запрос,
+    с traced=True каждый запрос трассируемого апдейта становится спаном (libraries.tracing).
+    """
+
+    def __init__(self, name: str = 'database.db', readers: int = 4, profiler=None, traced: bool = False):
+        self.name = name
+        self.profiler = profiler
+        self.traced = traced
         self.conn = sqlite3.connect(name, timeout=10, check_same_thread=False)
-        self.db = self.conn.cursor()
+        # Свободные страницы возвращаются порциями через PRAGMA incremental_vacuum.
+        # Базу, созданную без этого режима, один раз перестраиваем при запуске
+        if self.conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            self.migrate_auto_vacuum()
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.writer_db = self.cursor(self.conn)
+
+        self.local = threading.local()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+
+        # База в памяти не видна другим соединениям - читаем через поток записи
+        if name == ':memory:' or readers < 1:
+            self.readers = self.writer
+        else:
+            self.readers = ThreadPoolExecutor(
+                max_workers=readers, thread_name_prefix='db-reader', initializer=self.open_reader
+            )
+
+    def migrate_auto_vacuum(self):
+        """Одноразовый переход на auto_vacuum=INCREMENTAL: полный VACUUM базы.
+
+        Пустой базе ничего не стоит, большой - блокирует запуск на время перестройки
+        и требует свободного места на диске примерно на размер базы (копия для VACUUM).
+        """
+        pages = self.conn.execute('PRAGMA page_count').fetchone()[0]
+        page_size = self.conn.execute('PRAGMA page_size').fetchone()[0]
+        if pages:
+            logger.warning(
+                f"Перестройка базы {self.name} для incremental vacuum ({pages * page_size / 2 ** 20:.1f} МБ): "
+                f"одноразовый VACUUM, запуск подождет, на диске нужно столько же свободного места"
+            )
+        started = time.perf_counter()
+        self.conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        self.conn.execute('VACUUM')
+        if pages:
+            logger.warning(f"Перестройка базы {self.name} завершена за {time.perf_counter() - started:.1f} с")
+
+    def open_reader(self):
+        """Открывает read-only соединение для текущего потока пула чтения"""
+        uri = Path(self.name).absolute().as_uri() + '?mode=ro'
+        self.local.conn = sqlite3.connect(uri, uri=True, timeout=10)
+        self.local.db = self.cursor(self.local.conn)
+
+    def cursor(self, conn):
+        cursor = conn.cursor()
+        if self.profiler is not None:
+            cursor = ProfiledCursor(cursor, self.profiler)
+        if self.traced:
+            cursor = TracedCursor(cursor)
+        return cursor
+
+    @property
+    def db(self):
+        """Курсор текущего потока: read-only в пуле чтения, иначе курсор записи"""
+        return getattr(self.local, 'db', None) or self.writer_db
+
+    def close(self):
+        """Дожидается завершения запросов и закрывает соединение записи"""
+        if self.readers is not self.writer:
+            self.readers.shutdown(wait=True)
+        self.writer.shutdown(wait=True)
+        self.conn.close()
@@ -0,0 +1,207 @@
+# Колонки игр в таблицах счетчиков tries и wins
+GAME_COLUMNS = ('slots', 'dice', 'dart', 'bask', 'foot', 'bowl')
+
+# Таблицы счетчиков и их колонки
+COUNTER_COLUMNS = {
+    'tries': GAME_COLUMNS,
+    'wins': GAME_COLUMNS,
+    'jackpots': ('slots',),
+}
+
+class StorageEngine:
+    """Интерфейс хранилища, через который Users читает и пишет все данные бота.
+
+    Users держит кэши и индексы в памяти (профили, блокировки, серии, рейтинги),
+    а движок отвечает только за хранение. Строки передаются кортежами в порядке,
+    указанном у метода; методы вызываются в пуле writer (запись) или readers
+    (чтение). Если пул None, методы вызываются прямо из event loop - так работает
+    движок без ввода-вывода.
+
+    Форматы строк:
+      period rows  - (id, chat_id, game_type, date, week_start, tries, wins, jackpots)
+      streak rows  - (id, chat_id, game_type, current_streak, max_streak, last_win_timestamp)
+      roll rows    - (user_id, chat_id, game_type, value, outcome, timestamp)
+    """
+
+    name = None
+    readers = None
+    writer = None
+
+    # --- Пользователи и админы ---
+
+    def add_user(self, id: int, name: str) -> bool:
+        """Добавляет профиль с congratulate = 1, если его нет; True - профиль новый"""
+        raise NotImplementedError
+
+    def set_user_field(self, id: int, parameter: str, value):
+        raise NotImplementedError
+
+    def add_admin(self, user_id: int):
+        raise NotImplementedError
+
+    def is_admin(self, user_id: int) -> bool:
+        raise NotImplementedError
+
+    # --- Строки таблиц users, tries, wins, jackpots целиком ---
+
+    def get_row(self, table: str, id: int, chat_id: int = None):
+        """Строка таблицы словарем {колонка: значение} или None (и для неизвестной таблицы)"""
+        raise NotImplementedError
+
+    def get_rows(self, table: str, chat_id: int = None):
+        raise NotImplementedError
+
+    # --- Счетчики, статистика периодов, серии и лог бросков ---
+
+    def set_counter(self, table: str, id: int, chat_id: int, column: str, value, timestamp: int):
+        """Заменяет строку счетчика: column = value, остальные колонки обнуляются"""
+        raise NotImplementedError
+
+    def increment_counter(self, table: str, column: str, id: int, chat_id: int, amount: int, timestamp: int):
+        raise NotImplementedError
+
+    def add_period_stats(self, rows: list):
+        """Прибавляет приращения period rows к статистике их дня и недели"""
+        raise NotImplementedError
+
+    def apply_stats(self, rows: list, streaks: list, rolls: list, timestamp: int):
+        """Одной транзакцией: счетчики и статистика периодов по period rows,
+        сохранение streak rows и добавление roll rows в лог"""
+        raise NotImplementedError
+
+    def period_stats(self, period: str, chat_id: int, period_key: str):
+        """Статистика чата за день ('day') или неделю ('week'): [(id, game_type, tries, wins, jackpots)]"""
+        raise NotImplementedError
+
+    def period_rows(self, period: str, period_key: str):
+        """Статистика всех чатов за период: [(id, chat_id, game_type, tries, wins, jackpots)]"""
+        raise NotImplementedError
+
+    def load_streaks(self):
+        """Все серии: [streak row]"""
+        raise NotImplementedError
+
+    def win_streaks(self, chat_id: int, game_type: str = None):
+        """Ненулевые максимальные серии чата по убыванию: [(id, game_type, max_streak)]"""
+        raise NotImplementedError
+
+    def rolls_since(self, timestamp: int):
+        """Броски с timestamp и позже по времени: [(user_id, chat_id, game_type, outcome, timestamp)]"""
+        raise NotImplementedError
+
+    def roll_counts(self, chat_id: int, since: int, outcomes: tuple):
+        """Броски чата с исходом из outcomes с момента since:
+        [(user_id, game_type, количество, время последнего)]"""
+        raise NotImplementedError
+
+    def iter_rolls(self, batch_size: int, after: int = 0):
+        """Лог бросков с id больше after по порядку записи порциями [(user_id, chat_id, game_type, outcome, timestamp)]"""
+        raise NotImplementedError
+
+    def replace_aggregates(self, counters: dict, last_roll: dict, daily: dict, weekly: dict, monthly: dict, streaks: list):
+        """Заменяет все счетчики, статистику периодов и серии пересчитанными по логу.
+
+        counters - {(id, chat_id, game_type): [tries, wins, jackpots]}, last_roll - {(id, chat_id): timestamp},
+        daily/weekly/monthly - {(id, chat_id, game_type, ключ периода): [tries, wins, jackpots]}
+        """
+        raise NotImplementedError
+
+    # --- Снимок счетчиков: пересборка = снимок + броски с id больше checkpoint ---
+
+    def roll_checkpoint(self) -> int:
+        """Id последнего броска, учтенного в снимке (0 - в снимке нет бросков)"""
+        raise NotImplementedError
+
+    def rolls_after(self, roll_id: int, limit: int):
+        """До limit бросков с id больше roll_id по порядку: [(id, user_id, chat_id, game_type, outcome, timestamp)]"""
+        raise NotImplementedError
+
+    def load_snapshot(self):
+        """Снимок целиком: (counters, last_roll, daily, weekly, monthly, streak rows) в форматах replace_aggregates"""
+        raise NotImplementedError
+
+    def snapshot_streaks(self, keys):
+        """Серии снимка для ключей (id, chat_id, game_type): [streak row]"""
+        raise NotImplementedError
+
+    def fold_snapshot(self, counters: dict, last_roll: dict, daily: dict, weekly: dict, monthly: dict,
+                      streaks: list, checkpoint: int):
+        """Одной транзакцией прибавляет приращения к снимку, сохраняет серии и сдвигает checkpoint"""
+        raise NotImplementedError
+
+    def delete_rolls(self, before: int, limit: int) -> int:
+        """Удаляет до limit бросков раньше before, уже учтенных в снимке"""
+        raise NotImplementedError
+
+    def compact_snapshot(self, day_cutoff: str, week_cutoff: str, limit: int) -> int:
+        """Сворачивает дни снимка раньше day_cutoff в месяцы и удаляет недели раньше week_cutoff"""
+        raise NotImplementedError
+
+    # --- Блокировки, обращения в помощь, отложенные удаления ---
+
+    def put_block(self, user_id: int, chat_id: int, reason: str, start: int, end: int):
+        raise NotImplementedError
+
+    def delete_block(self, user_id: int, chat_id: int):
+        raise NotImplementedError
+
+    def active_blocks(self, now: int):
+        """Блокировки, которые еще не закончились: [(id, chat_id, reason, start, end)]"""
+        raise NotImplementedError
+
+    def add_help_message(self, user_id: int, chat_id: int, text: str) -> int:
+        raise NotImplementedError
+
+    def pending_help_messages(self):
+        """[(message_id, user_id, chat_id, text, timestamp)] по времени, timestamp - строка UTC"""
+        raise NotImplementedError
+
+    def set_help_status(self, message_id: int, status: str):
+        raise NotImplementedError
+
+    def add_pending_deletion(self, chat_id: int, message_id: int, due: int):
+        raise NotImplementedError
+
+    def pending_deletions(self):
+        """[(chat_id, message_id, due)]"""
+        raise NotImplementedError
+
+    def remove_pending_deletions(self, messages: list):
+        raise NotImplementedError
+
+    # --- Сброс статистики ---
+
+    def reset_user(self, id: int, chat_id: int):
+        raise NotImplementedError
+
+    def reset_chat(self, chat_id: int):
+        raise NotImplementedError
+
+    def reset_all(self):
+        """Удаляет всю статистику, лог бросков и блокировки"""
+        raise NotImplementedError
+
+    # --- Обслуживание: каждый метод обрабатывает до limit строк и возвращает их число ---
+
+    def archive_days(self, cutoff: str, limit: int) -> int:
+        """Сворачивает дни раньше cutoff в помесячный архив"""
+        raise NotImplementedError
+
+    def prune_weeks(self, cutoff: str, limit: int) -> int:
+        raise NotImplementedError
+
+    def delete_expired_blocks(self, now: int, limit: int) -> int:
+        raise NotImplementedError
+
+    def prune_help_messages(self, cutoff: str, limit: int) -> int:
+        """Удаляет обработанные обращения старше cutoff"""
+        raise NotImplementedError
+
+    def vacuum(self, limit: int) -> int:
+        return 0
+
+    def optimize(self) -> int:
+        return 0
+
+    def close(self):
+        pass
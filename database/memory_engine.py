@@ -0,0 +1,414 @@
+from datetime import datetime
+
+from database.engine import StorageEngine, GAME_COLUMNS, COUNTER_COLUMNS
+
+# Периоды статистики: день, неделя и месячный архив
+PERIODS = ('day', 'week', 'month')
+
+def counter_row(table: str, id: int, chat_id: int):
+    """Пустая строка счетчика в порядке колонок таблицы SQLite"""
+    row = {'id': id, 'chat_id': chat_id}
+    row.update((column, 0) for column in COUNTER_COLUMNS[table])
+    row['timestamp'] = None
+    return row
+
+class MemoryEngine(StorageEngine):
+    """Хранилище в словарях процесса, без файлов и потоков.
+
+    Для тестов, бенчмарков и сравнения с SQLite: методы выполняются прямо в event
+    loop, данные теряются при остановке. Семантика совпадает с SQLiteEngine,
+    включая порядок строк.
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        self.users = {}
+        self.admins = set()
+        # {таблица: {chat_id: {id: строка}}}
+        self.counters = {table: {} for table in COUNTER_COLUMNS}
+        # {период: {ключ периода: {chat_id: {(id, game_type): [tries, wins, jackpots]}}}}
+        self.periods = {period: {} for period in PERIODS}
+        # {chat_id: {(id, game_type): [current_streak, max_streak, last_win_timestamp]}}
+        self.streaks = {}
+        # Лог бросков по порядку записи и по чатам: (id, user_id, chat_id, game_type, value, outcome, timestamp)
+        self.rolls = []
+        self.chat_rolls = {}
+        self.last_roll_id = 0
+        # Снимок счетчиков до checkpoint: {(id, chat_id, game_type): [tries, wins, jackpots, timestamp]},
+        # {период: {(id, chat_id, game_type, ключ периода): [tries, wins, jackpots]}} и серии
+        self.counter_snapshot = {}
+        self.period_snapshot = {period: {} for period in PERIODS}
+        self.streak_snapshot = {}
+        self.checkpoint = 0
+        self.blocks = {}
+        # {message_id: [user_id, chat_id, text, timestamp, status]}
+        self.help_messages = {}
+        self.last_help_id = 0
+        self.deletions = {}
+
+    # --- Пользователи и админы ---
+
+    def add_user(self, id: int, name: str):
+        if id in self.users:
+            return False
+        self.users[id] = {'id': id, 'name': name, 'congratulate': 1}
+        return True
+
+    def set_user_field(self, id: int, parameter: str, value):
+        user = self.users.get(id)
+        if user is not None:
+            # Как в SQLite: BOOL хранится числом
+            user[parameter] = int(value) if isinstance(value, bool) else value
+
+    def add_admin(self, user_id: int):
+        self.admins.add(user_id)
+
+    def is_admin(self, user_id: int):
+        return user_id in self.admins
+
+    # --- Строки таблиц целиком ---
+
+    def get_row(self, table: str, id: int, chat_id: int = None):
+        if table == 'users':
+            row = self.users.get(id)
+        elif table in self.counters:
+            if chat_id is not None:
+                row = self.counters[table].get(chat_id, {}).get(id)
+            else:
+                row = next((chat[id] for chat in self.counters[table].values() if id in chat), None)
+        else:
+            return None
+        return dict(row) if row else None
+
+    def get_rows(self, table: str, chat_id: int = None):
+        if table == 'users':
+            rows = self.users.values() if chat_id is None else ()
+        elif table not in self.counters:
+            return []
+        elif chat_id is not None:
+            rows = self.counters[table].get(chat_id, {}).values()
+        else:
+            rows = [row for chat in self.counters[table].values() for row in chat.values()]
+        return [dict(row) for row in rows]
+
+    # --- Счетчики, периоды, серии, лог бросков ---
+
+    def set_counter(self, table: str, id: int, chat_id: int, column: str, value, timestamp: int):
+        if column not in COUNTER_COLUMNS[table]:
+            raise KeyError(f"Unknown column: {table}.{column}")
+        row = counter_row(table, id, chat_id)
+        row[column] = value
+        row['timestamp'] = timestamp
+        self.counters[table].setdefault(chat_id, {})[id] = row
+
+    def increment_counter(self, table: str, column: str, id: int, chat_id: int, amount: int, timestamp: int):
+        if column not in COUNTER_COLUMNS[table]:
+            raise KeyError(f"Unknown column: {table}.{column}")
+        chat = self.counters[table].setdefault(chat_id, {})
+        row = chat.get(id)
+        if row is None:
+            row = chat[id] = counter_row(table, id, chat_id)
+        row[column] = (row[column] or 0) + amount
+        row['timestamp'] = timestamp
+
+    def add_period(self, period: str, period_key: str, id: int, chat_id: int, game_type: str,
+                   tries: int, wins: int, jackpots: int):
+        chat = self.periods[period].setdefault(period_key, {}).setdefault(chat_id, {})
+        totals = chat.get((id, game_type))
+        if totals is None:
+            chat[(id, game_type)] = [tries, wins, jackpots]
+        else:
+            totals[0] += tries
+            totals[1] += wins
+            totals[2] += jackpots
+
+    def add_period_stats(self, rows: list):
+        for id, chat_id, game_type, date, week_start, tries, wins, jackpots in rows:
+            self.add_period('day', date, id, chat_id, game_type, tries, wins, jackpots)
+            self.add_period('week', week_start, id, chat_id, game_type, tries, wins, jackpots)
+
+    def save_streaks(self, streaks: list):
+        for id, chat_id, game_type, current_streak, max_streak, last_win in streaks:
+            self.streaks.setdefault(chat_id, {})[(id, game_type)] = [current_streak, max_streak, last_win]
+
+    def add_rolls(self, rolls: list):
+        for roll in rolls:
+            self.last_roll_id += 1
+            roll = (self.last_roll_id,) + tuple(roll)
+            self.rolls.append(roll)
+            self.chat_rolls.setdefault(roll[2], []).append(roll)
+
+    def apply_stats(self, rows: list, streaks: list, rolls: list, timestamp: int):
+        self.add_rolls(rolls)
+        for id, chat_id, game_type, date, week_start, tries, wins, jackpots in rows:
+            if tries:
+                self.increment_counter('tries', game_type, id, chat_id, tries, timestamp)
+            if wins:
+                self.increment_counter('wins', game_type, id, chat_id, wins, timestamp)
+            if jackpots:
+                self.increment_counter('jackpots', 'slots', id, chat_id, jackpots, timestamp)
+        self.add_period_stats(rows)
+        self.save_streaks(streaks)
+
+    def period_stats(self, period: str, chat_id: int, period_key: str):
+        chat = self.periods[period].get(period_key, {}).get(chat_id, {})
+        return [(id, game_type) + tuple(totals) for (id, game_type), totals in chat.items()]
+
+    def period_rows(self, period: str, period_key: str):
+        return [
+            (id, chat_id, game_type) + tuple(totals)
+            for chat_id, chat in self.periods[period].get(period_key, {}).items()
+            for (id, game_type), totals in chat.items()
+        ]
+
+    def load_streaks(self):
+        return [
+            (id, chat_id, game_type) + tuple(streak)
+            for chat_id, chat in self.streaks.items()
+            for (id, game_type), streak in chat.items()
+        ]
+
+    def win_streaks(self, chat_id: int, game_type: str = None):
+        rows = [
+            (id, game, streak[1]) for (id, game), streak in self.streaks.get(chat_id, {}).items()
+            if streak[1] > 0 and (not game_type or game == game_type)
+        ]
+        # Равные серии - по id и игре, как ORDER BY в SQLite
+        rows.sort(key=lambda row: (-row[2], row[0], row[1]))
+        return rows
+
+    def rolls_since(self, timestamp: int):
+        rows = [(roll[1], roll[2], roll[3], roll[5], roll[6]) for roll in self.rolls if roll[6] >= timestamp]
+        rows.sort(key=lambda row: row[4])
+        return rows
+
+    def roll_counts(self, chat_id: int, since: int, outcomes: tuple):
+        counts = {}
+        for _, user_id, _, game_type, _, outcome, timestamp in self.chat_rolls.get(chat_id, ()):
+            if timestamp < since or outcome not in outcomes:
+                continue
+            count = counts.get((user_id, game_type))
+            if count is None:
+                counts[(user_id, game_type)] = [1, timestamp]
+            else:
+                count[0] += 1
+                count[1] = max(count[1], timestamp)
+        return [(user_id, game_type, count, last) for (user_id, game_type), (count, last) in counts.items()]
+
+    def iter_rolls(self, batch_size: int, after: int = 0):
+        rolls = [roll for roll in self.rolls if roll[0] > after]
+        for start in range(0, len(rolls), batch_size):
+            yield [(roll[1], roll[2], roll[3], roll[5], roll[6]) for roll in rolls[start:start + batch_size]]
+
+    def replace_aggregates(self, counters: dict, last_roll: dict, daily: dict, weekly: dict, monthly: dict, streaks: list):
+        self.counters = {table: {} for table in COUNTER_COLUMNS}
+        self.periods = {period: {} for period in PERIODS}
+        self.streaks = {}
+
+        for (id, chat_id, game_type), (tries, wins, jackpots) in counters.items():
+            timestamp = last_roll[(id, chat_id)]
+            self.increment_counter('tries', game_type, id, chat_id, tries, timestamp)
+            if wins:
+                self.increment_counter('wins', game_type, id, chat_id, wins, timestamp)
+            if jackpots:
+                self.increment_counter('jackpots', 'slots', id, chat_id, jackpots, timestamp)
+        for period, totals in (('day', daily), ('week', weekly), ('month', monthly)):
+            for (id, chat_id, game_type, period_key), delta in totals.items():
+                self.add_period(period, period_key, id, chat_id, game_type, *delta)
+        self.save_streaks(streaks)
+
+    # --- Снимок счетчиков ---
+
+    def roll_checkpoint(self):
+        return self.checkpoint
+
+    def rolls_after(self, roll_id: int, limit: int):
+        rows = []
+        for roll in self.rolls:
+            if roll[0] <= roll_id:
+                continue
+            if len(rows) == limit:
+                break
+            rows.append((roll[0], roll[1], roll[2], roll[3], roll[5], roll[6]))
+        return rows
+
+    def load_snapshot(self):
+        counters, last_roll = {}, {}
+        for (id, chat_id, game_type), (tries, wins, jackpots, timestamp) in self.counter_snapshot.items():
+            counters[(id, chat_id, game_type)] = [tries, wins, jackpots]
+            last_roll[(id, chat_id)] = max(timestamp or 0, last_roll.get((id, chat_id)) or 0) or None
+        periods = {period: {key: list(totals) for key, totals in keys.items()} for period, keys in self.period_snapshot.items()}
+        streaks = [key + tuple(streak) for key, streak in self.streak_snapshot.items()]
+        return counters, last_roll, periods['day'], periods['week'], periods['month'], streaks
+
+    def snapshot_streaks(self, keys):
+        return [key + tuple(self.streak_snapshot[key]) for key in keys if key in self.streak_snapshot]
+
+    def fold_snapshot(self, counters: dict, last_roll: dict, daily: dict, weekly: dict, monthly: dict,
+                      streaks: list, checkpoint: int):
+        for key, (tries, wins, jackpots) in counters.items():
+            row = self.counter_snapshot.setdefault(key, [0, 0, 0, None])
+            row[0] += tries
+            row[1] += wins
+            row[2] += jackpots
+            row[3] = max(row[3] or 0, last_roll[key[:2]])
+        for period, totals in (('day', daily), ('week', weekly), ('month', monthly)):
+            keys = self.period_snapshot[period]
+            for key, delta in totals.items():
+                row = keys.setdefault(key, [0, 0, 0])
+                for index, value in enumerate(delta):
+                    row[index] += value
+        for id, chat_id, game_type, current_streak, max_streak, last_win in streaks:
+            self.streak_snapshot[(id, chat_id, game_type)] = [current_streak, max_streak, last_win]
+        self.checkpoint = checkpoint
+
+    def delete_rolls(self, before: int, limit: int):
+        # Учтенные в снимке броски - начало лога: id растут по порядку записи
+        removed, chats = set(), set()
+        for roll in self.rolls:
+            if roll[0] > self.checkpoint or len(removed) == limit:
+                break
+            if roll[6] < before:
+                removed.add(roll[0])
+                chats.add(roll[2])
+        if removed:
+            self.rolls = [roll for roll in self.rolls if roll[0] not in removed]
+            for chat_id in chats:
+                self.chat_rolls[chat_id] = [roll for roll in self.chat_rolls[chat_id] if roll[0] not in removed]
+        return len(removed)
+
+    def compact_snapshot(self, day_cutoff: str, week_cutoff: str, limit: int):
+        days = [key for key in self.period_snapshot['day'] if key[3] < day_cutoff][:limit]
+        for key in days:
+            totals = self.period_snapshot['day'].pop(key)
+            row = self.period_snapshot['month'].setdefault(key[:3] + (key[3][:7],), [0, 0, 0])
+            for index, value in enumerate(totals):
+                row[index] += value
+        weeks = [key for key in self.period_snapshot['week'] if key[3] < week_cutoff][:limit - len(days)]
+        for key in weeks:
+            del self.period_snapshot['week'][key]
+        return len(days) + len(weeks)
+
+    # --- Блокировки, обращения, отложенные удаления ---
+
+    def put_block(self, user_id: int, chat_id: int, reason: str, start: int, end: int):
+        self.blocks[(user_id, chat_id)] = (reason, start, end)
+
+    def delete_block(self, user_id: int, chat_id: int):
+        self.blocks.pop((user_id, chat_id), None)
+
+    def active_blocks(self, now: int):
+        return [
+            (user_id, chat_id) + block for (user_id, chat_id), block in self.blocks.items() if block[2] > now
+        ]
+
+    def add_help_message(self, user_id: int, chat_id: int, text: str):
+        self.last_help_id += 1
+        # Время UTC строкой, как CURRENT_TIMESTAMP в SQLite
+        timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        self.help_messages[self.last_help_id] = [user_id, chat_id, text, timestamp, 'pending']
+        return self.last_help_id
+
+    def pending_help_messages(self):
+        rows = [
+            (message_id, user_id, chat_id, text, timestamp)
+            for message_id, (user_id, chat_id, text, timestamp, status) in self.help_messages.items()
+            if status == 'pending'
+        ]
+        rows.sort(key=lambda row: row[4])
+        return rows
+
+    def set_help_status(self, message_id: int, status: str):
+        message = self.help_messages.get(message_id)
+        if message is not None:
+            message[4] = status
+
+    def add_pending_deletion(self, chat_id: int, message_id: int, due: int):
+        self.deletions[(chat_id, message_id)] = due
+
+    def pending_deletions(self):
+        return [(chat_id, message_id, due) for (chat_id, message_id), due in self.deletions.items()]
+
+    def remove_pending_deletions(self, messages: list):
+        for chat_id, message_id in messages:
+            self.deletions.pop((chat_id, message_id), None)
+
+    # --- Сброс ---
+
+    def reset_user(self, id: int, chat_id: int):
+        for chats in self.counters.values():
+            chats.get(chat_id, {}).pop(id, None)
+        chat = self.streaks.get(chat_id, {})
+        for game_type in GAME_COLUMNS:
+            chat.pop((id, game_type), None)
+        self.rolls = [roll for roll in self.rolls if roll[1] != id or roll[2] != chat_id]
+        self.chat_rolls[chat_id] = [roll for roll in self.chat_rolls.get(chat_id, ()) if roll[1] != id]
+        for game_type in GAME_COLUMNS:
+            self.counter_snapshot.pop((id, chat_id, game_type), None)
+            self.streak_snapshot.pop((id, chat_id, game_type), None)
+
+    def reset_chat(self, chat_id: int):
+        for chats in self.counters.values():
+            chats.pop(chat_id, None)
+        self.streaks.pop(chat_id, None)
+        self.rolls = [roll for roll in self.rolls if roll[2] != chat_id]
+        self.chat_rolls.pop(chat_id, None)
+        for snapshot in (self.counter_snapshot, self.streak_snapshot):
+            for key in [key for key in snapshot if key[1] == chat_id]:
+                del snapshot[key]
+
+    def reset_all(self):
+        self.counters = {table: {} for table in COUNTER_COLUMNS}
+        self.periods = {period: {} for period in PERIODS}
+        self.streaks = {}
+        self.rolls = []
+        self.chat_rolls = {}
+        self.counter_snapshot = {}
+        self.period_snapshot = {period: {} for period in PERIODS}
+        self.streak_snapshot = {}
+        self.blocks = {}
+
+    # --- Обслуживание порциями ---
+
+    def take_period_rows(self, period: str, cutoff: str, limit: int):
+        """Вынимает до limit строк периода с ключом раньше cutoff"""
+        taken = []
+        keys = self.periods[period]
+        for period_key in sorted(key for key in keys if key < cutoff):
+            chats = keys[period_key]
+            for chat_id in list(chats):
+                chat = chats[chat_id]
+                for id, game_type in list(chat):
+                    if len(taken) == limit:
+                        return taken
+                    taken.append((id, chat_id, game_type, period_key, chat.pop((id, game_type))))
+                if not chat:
+                    del chats[chat_id]
+            if not chats:
+                del keys[period_key]
+        return taken
+
+    def archive_days(self, cutoff: str, limit: int):
+        taken = self.take_period_rows('day', cutoff, limit)
+        for id, chat_id, game_type, date, totals in taken:
+            self.add_period('month', date[:7], id, chat_id, game_type, *totals)
+        return len(taken)
+
+    def prune_weeks(self, cutoff: str, limit: int):
+        return len(self.take_period_rows('week', cutoff, limit))
+
+    def delete_expired_blocks(self, now: int, limit: int):
+        expired = [key for key, block in self.blocks.items() if block[2] <= now][:limit]
+        for key in expired:
+            del self.blocks[key]
+        return len(expired)
+
+    def prune_help_messages(self, cutoff: str, limit: int):
+        pruned = [
+            message_id for message_id, message in self.help_messages.items()
+            if message[4] != 'pending' and message[3] < cutoff
+        ][:limit]
+        for message_id in pruned:
+            del self.help_messages[message_id]
+        return len(pruned)
@@ -0,0 +1,190 @@
+import re
+import time
+import logging
+import threading
+import functools
+
+slow_logger = logging.getLogger('database.slow')
+
+# Литералы в тексте запроса: строки в кавычках и числа вне идентификаторов
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+NAMED_PLACEHOLDER = re.compile(r"[:@$]\w+")
+WHITESPACE = re.compile(r"\s+")
+
+@functools.lru_cache(maxsize=1024)
+def normalize(sql: str):
+    """Текст запроса без литералов и лишних пробелов: одинаковые запросы с разными
+    параметрами (и разной длиной списков IN) попадают в одну строку статистики"""
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NAMED_PLACEHOLDER.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = WHITESPACE.sub(' ', sql).strip()
+    return PLACEHOLDER_LIST.sub('(?, ...)', sql)
+
+class StatementStats:
+    __slots__ = ('sql', 'count', 'total', 'max', 'rows')
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+class QueryProfiler:
+    """Статистика SQL-запросов по нормализованному тексту и журнал медленных запросов.
+
+    Запрос дольше slow_ms миллисекунд (выполнение вместе с чтением строк) пишется
+    в логгер database.slow вместе с EXPLAIN QUERY PLAN. План каждого нормализованного
+    запроса снимается один раз - повторные медленные вызовы пишутся без него.
+    """
+
+    def __init__(self, slow_ms: float = 50.0):
+        self.slow_ms = slow_ms
+        self.stats = {}
+        self.explained = set()
+        self.slow = 0
+        self.lock = threading.Lock()
+
+    def record(self, sql: str, elapsed: float, rows: int, duration: float, count: bool):
+        """Добавляет время и строки к статистике запроса.
+
+        duration - время этого вызова целиком (для максимума), count - новый вызов,
+        а не дочитывание строк уже выполненного.
+        """
+        key = normalize(sql)
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = StatementStats(key)
+            if count:
+                stats.count += 1
+            stats.total += elapsed
+            stats.rows += rows
+            stats.max = max(stats.max, duration)
+
+    def check_slow(self, cursor, sql: str, params, elapsed: float):
+        if elapsed * 1000 < self.slow_ms:
+            return
+        key = normalize(sql)
+        with self.lock:
+            self.slow += 1
+            explain = key not in self.explained
+            self.explained.add(key)
+
+        message = f"Медленный запрос {elapsed * 1000:.1f} мс: {key}"
+        # Для executemany параметров одного запроса нет - пишем без плана
+        if explain and params is not None and sql.split(None, 1)[0].upper() in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE'):
+            try:
+                plan = cursor.connection.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+                message += '\n  ' + '\n  '.join(row[3] for row in plan)
+            except Exception as e:
+                message += f"\n  (план недоступен: {e})"
+        slow_logger.warning(message)
+
+    def top(self, limit: int = 10, order: str = 'total'):
+        """Самые дорогие запросы: список StatementStats, по total, count, max или rows"""
+        with self.lock:
+            stats = list(self.stats.values())
+        return sorted(stats, key=lambda stats: getattr(stats, order), reverse=True)[:limit]
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+            self.explained = set()
+            self.slow = 0
+
+class ProfiledCursor:
+    """Курсор sqlite3, который замеряет каждый запрос вместе с чтением его строк.
+
+    SQLite выполняет SELECT лениво - строки считаются при fetch*, поэтому время
+    и число строк чтения добавляются к тому же запросу. Остальные атрибуты
+    (description, lastrowid, rowcount, connection) берутся у исходного курсора.
+    """
+
+    def __init__(self, cursor, profiler: QueryProfiler):
+        self.cursor = cursor
+        self.profiler = profiler
+        self.sql = None
+        self.params = ()
+        self.elapsed = 0.0
+
+    def __getattr__(self, name: str):
+        return getattr(self.cursor, name)
+
+    def finish(self):
+        """Проверяет на медленность предыдущий запрос курсора"""
+        if self.sql is not None:
+            self.profiler.check_slow(self.cursor, self.sql, self.params, self.elapsed)
+            self.sql = None
+
+    def execute(self, sql: str, params=()):
+        self.finish()
+        started = time.perf_counter()
+        try:
+            self.cursor.execute(sql, params)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.profiler.record(sql, elapsed, 0, elapsed, count=True)
+        self.sql, self.params, self.elapsed = sql, params, elapsed
+        if self.cursor.description is None:
+            # Не SELECT - строк читать не будут, проверяем сразу
+            self.finish()
+        return self
+
+    def executemany(self, sql: str, rows):
+        self.finish()
+        started = time.perf_counter()
+        try:
+            self.cursor.executemany(sql, rows)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.profiler.record(sql, elapsed, 0, elapsed, count=True)
+        self.profiler.check_slow(self.cursor, sql, None, elapsed)
+        return self
+
+    def executescript(self, script: str):
+        self.finish()
+        started = time.perf_counter()
+        try:
+            self.cursor.executescript(script)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.profiler.record(script, elapsed, 0, elapsed, count=True)
+        return self
+
+    def fetched(self, started: float, rows: int, done: bool):
+        if self.sql is None:
+            return
+        elapsed = time.perf_counter() - started
+        self.elapsed += elapsed
+        self.profiler.record(self.sql, elapsed, rows, self.elapsed, count=False)
+        if done:
+            self.finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self.cursor.fetchone()
+        self.fetched(started, 0 if row is None else 1, done=row is None)
+        return row
+
+    def fetchmany(self, size: int = None):
+        started = time.perf_counter()
+        rows = self.cursor.fetchmany(self.cursor.arraysize if size is None else size)
+        self.fetched(started, len(rows), done=not rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self.cursor.fetchall()
+        self.fetched(started, len(rows), done=True)
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
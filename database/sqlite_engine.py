@@ -0,0 +1,857 @@
+import json
+import logging
+
+from database.engine import StorageEngine, GAME_COLUMNS, COUNTER_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        name TEXT,
+        congratulate BOOL
+    );
+
+    CREATE TABLE IF NOT EXISTS tries (
+        id INTEGER,
+        chat_id INTEGER,
+        slots INTEGER DEFAULT 0,
+        dice INTEGER DEFAULT 0,
+        dart INTEGER DEFAULT 0,
+        bask INTEGER DEFAULT 0,
+        foot INTEGER DEFAULT 0,
+        bowl INTEGER DEFAULT 0,
+        timestamp INTEGER,
+        PRIMARY KEY (id, chat_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS wins (
+        id INTEGER,
+        chat_id INTEGER,
+        slots INTEGER DEFAULT 0,
+        dice INTEGER DEFAULT 0,
+        dart INTEGER DEFAULT 0,
+        bask INTEGER DEFAULT 0,
+        foot INTEGER DEFAULT 0,
+        bowl INTEGER DEFAULT 0,
+        timestamp INTEGER,
+        PRIMARY KEY (id, chat_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS jackpots (
+        id INTEGER,
+        chat_id INTEGER,
+        slots INTEGER DEFAULT 0,
+        timestamp INTEGER,
+        PRIMARY KEY (id, chat_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS admins (
+        user_id INTEGER PRIMARY KEY
+    );
+
+    CREATE TABLE IF NOT EXISTS daily_stats (
+        id INTEGER,
+        chat_id INTEGER,
+        game_type TEXT,
+        tries INTEGER DEFAULT 0,
+        wins INTEGER DEFAULT 0,
+        jackpots INTEGER DEFAULT 0,
+        date TEXT,
+        PRIMARY KEY (id, chat_id, game_type, date)
+    );
+
+    CREATE TABLE IF NOT EXISTS weekly_stats (
+        id INTEGER,
+        chat_id INTEGER,
+        game_type TEXT,
+        tries INTEGER DEFAULT 0,
+        wins INTEGER DEFAULT 0,
+        jackpots INTEGER DEFAULT 0,
+        week_start TEXT,
+        PRIMARY KEY (id, chat_id, game_type, week_start)
+    );
+
+    -- АРХИВ: ЗАВЕРШЕННЫЕ ДНИ, СВЕРНУТЫЕ ПО МЕСЯЦАМ (month = YYYY-MM)
+    CREATE TABLE IF NOT EXISTS monthly_stats (
+        id INTEGER,
+        chat_id INTEGER,
+        game_type TEXT,
+        tries INTEGER DEFAULT 0,
+        wins INTEGER DEFAULT 0,
+        jackpots INTEGER DEFAULT 0,
+        month TEXT,
+        PRIMARY KEY (id, chat_id, game_type, month)
+    );
+
+    -- НОВАЯ ТАБЛИЦА ДЛЯ СЕРИЙ ПОБЕД
+    CREATE TABLE IF NOT EXISTS win_streaks (
+        id INTEGER,
+        chat_id INTEGER,
+        game_type TEXT,
+        current_streak INTEGER DEFAULT 0,
+        max_streak INTEGER DEFAULT 0,
+        last_win_timestamp INTEGER,
+        PRIMARY KEY (id, chat_id, game_type)
+    );
+
+    -- ЛОГ БРОСКОВ: КАЖДЫЙ БРОСОК С ВЫПАВШИМ ЗНАЧЕНИЕМ, ТОЛЬКО ДОБАВЛЕНИЕ
+    CREATE TABLE IF NOT EXISTS rolls (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        chat_id INTEGER,
+        game_type TEXT,
+        value INTEGER,
+        outcome TEXT,
+        timestamp INTEGER
+    );
+
+    -- СНИМОК СЧЕТЧИКОВ: ВСЕ БРОСКИ ДО roll_checkpoint. ПЕРЕСБОРКА = СНИМОК + ЛОГ ПОСЛЕ НЕГО
+    CREATE TABLE IF NOT EXISTS snapshot_counters (
+        id INTEGER,
+        chat_id INTEGER,
+        game_type TEXT,
+        tries INTEGER DEFAULT 0,
+        wins INTEGER DEFAULT 0,
+        jackpots INTEGER DEFAULT 0,
+        timestamp INTEGER,
+        PRIMARY KEY (id, chat_id, game_type)
+    );
+
+    -- period: day, week или month; period_key - дата, начало недели или YYYY-MM
+    CREATE TABLE IF NOT EXISTS snapshot_periods (
+        period TEXT,
+        period_key TEXT,
+        id INTEGER,
+        chat_id INTEGER,
+        game_type TEXT,
+        tries INTEGER DEFAULT 0,
+        wins INTEGER DEFAULT 0,
+        jackpots INTEGER DEFAULT 0,
+        PRIMARY KEY (period, period_key, id, chat_id, game_type)
+    );
+
+    CREATE TABLE IF NOT EXISTS snapshot_streaks (
+        id INTEGER,
+        chat_id INTEGER,
+        game_type TEXT,
+        current_streak INTEGER DEFAULT 0,
+        max_streak INTEGER DEFAULT 0,
+        last_win_timestamp INTEGER,
+        PRIMARY KEY (id, chat_id, game_type)
+    );
+
+    -- Одна строка: id последнего броска, учтенного в снимке
+    CREATE TABLE IF NOT EXISTS roll_checkpoint (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        roll_id INTEGER
+    );
+
+    -- ТАБЛИЦА ДЛЯ БЛОКИРОВОК ПОЛЬЗОВАТЕЛЕЙ (ТОЛЬКО РУЧНАЯ)
+    -- block_start и block_end хранятся в epoch-секундах (UTC)
+    CREATE TABLE IF NOT EXISTS user_blocks (
+        id INTEGER,
+        chat_id INTEGER,
+        block_reason TEXT,
+        block_start INTEGER DEFAULT (strftime('%s', 'now')),
+        block_end INTEGER,
+        PRIMARY KEY (id, chat_id)
+    );
+
+    -- ОТЛОЖЕННЫЕ УДАЛЕНИЯ СООБЩЕНИЙ (due - epoch-секунды)
+    CREATE TABLE IF NOT EXISTS pending_deletions (
+        chat_id INTEGER,
+        message_id INTEGER,
+        due INTEGER,
+        PRIMARY KEY (chat_id, message_id)
+    );
+
+    -- ТАБЛИЦА ДЛЯ СООБЩЕНИЙ ПОМОЩИ
+    CREATE TABLE IF NOT EXISTS help_messages (
+        message_id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        chat_id INTEGER,
+        message_text TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        status TEXT DEFAULT 'pending'
+    );
+'''
+
+# 🔥 UPSERT-ЗАПРОСЫ: СЧЕТЧИКИ УВЕЛИЧИВАЮТСЯ ПРЯМО В SQLITE, БЕЗ ЧТЕНИЯ СТРОКИ
+COUNTER_UPSERT = '''
+    INSERT INTO {table} (id, chat_id, {column}, timestamp) VALUES (?, ?, ?, ?)
+    ON CONFLICT(id, chat_id) DO UPDATE SET
+        {column} = COALESCE({table}.{column}, 0) + excluded.{column},
+        timestamp = excluded.timestamp
+'''
+
+DAILY_UPSERT = '''
+    INSERT INTO daily_stats (id, chat_id, game_type, tries, wins, jackpots, date)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id, chat_id, game_type, date)
+    DO UPDATE SET
+        tries = daily_stats.tries + excluded.tries,
+        wins = daily_stats.wins + excluded.wins,
+        jackpots = daily_stats.jackpots + excluded.jackpots
+'''
+
+WEEKLY_UPSERT = '''
+    INSERT INTO weekly_stats (id, chat_id, game_type, tries, wins, jackpots, week_start)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id, chat_id, game_type, week_start)
+    DO UPDATE SET
+        tries = weekly_stats.tries + excluded.tries,
+        wins = weekly_stats.wins + excluded.wins,
+        jackpots = weekly_stats.jackpots + excluded.jackpots
+'''
+
+# Серии считаются в памяти (StreakStore) - в базу пишутся готовые значения
+STREAK_SAVE = '''
+    INSERT INTO win_streaks (id, chat_id, game_type, current_streak, max_streak, last_win_timestamp)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id, chat_id, game_type) DO UPDATE SET
+        current_streak = excluded.current_streak,
+        max_streak = excluded.max_streak,
+        last_win_timestamp = excluded.last_win_timestamp
+'''
+
+# Лог бросков только дополняется - все счетчики выводятся из него и пересобираются по нему
+ROLL_INSERT = '''
+    INSERT INTO rolls (user_id, chat_id, game_type, value, outcome, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+# Свертка старых бросков в снимок: приращения прибавляются, время последнего броска - максимум
+SNAPSHOT_COUNTER_UPSERT = '''
+    INSERT INTO snapshot_counters (id, chat_id, game_type, tries, wins, jackpots, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id, chat_id, game_type) DO UPDATE SET
+        tries = snapshot_counters.tries + excluded.tries,
+        wins = snapshot_counters.wins + excluded.wins,
+        jackpots = snapshot_counters.jackpots + excluded.jackpots,
+        timestamp = MAX(COALESCE(snapshot_counters.timestamp, 0), excluded.timestamp)
+'''
+
+SNAPSHOT_PERIOD_UPSERT = '''
+    INSERT INTO snapshot_periods (period, period_key, id, chat_id, game_type, tries, wins, jackpots)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(period, period_key, id, chat_id, game_type) DO UPDATE SET
+        tries = snapshot_periods.tries + excluded.tries,
+        wins = snapshot_periods.wins + excluded.wins,
+        jackpots = snapshot_periods.jackpots + excluded.jackpots
+'''
+
+SNAPSHOT_STREAK_SAVE = '''
+    INSERT INTO snapshot_streaks (id, chat_id, game_type, current_streak, max_streak, last_win_timestamp)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id, chat_id, game_type) DO UPDATE SET
+        current_streak = excluded.current_streak,
+        max_streak = excluded.max_streak,
+        last_win_timestamp = excluded.last_win_timestamp
+'''
+
+# Дни снимка, вышедшие из хранения, сворачиваются в месяцы снимка
+SNAPSHOT_ARCHIVE_UPSERT = '''
+    INSERT INTO snapshot_periods (period, period_key, id, chat_id, game_type, tries, wins, jackpots)
+    SELECT 'month', substr(period_key, 1, 7), id, chat_id, game_type, SUM(tries), SUM(wins), SUM(jackpots)
+    FROM snapshot_periods
+    WHERE rowid IN (SELECT value FROM json_each(?))
+    GROUP BY id, chat_id, game_type, substr(period_key, 1, 7)
+    ON CONFLICT(period, period_key, id, chat_id, game_type) DO UPDATE SET
+        tries = snapshot_periods.tries + excluded.tries,
+        wins = snapshot_periods.wins + excluded.wins,
+        jackpots = snapshot_periods.jackpots + excluded.jackpots
+'''
+
+# Следующий бросок получает id = MAX(id) + 1: после удаления последних бросков checkpoint
+# опускается, иначе новый бросок считался бы уже учтенным в снимке
+CHECKPOINT_CLAMP = '''
+    UPDATE roll_checkpoint SET roll_id = MIN(roll_id, (SELECT COALESCE(MAX(id), 0) FROM rolls))
+'''
+
+# 🔥 ИНДЕКСЫ ПОД ЗАПРОСЫ СТАТИСТИКИ И ЗАГРУЗКУ РЕЙТИНГОВ: ФИЛЬТР ПО ПЕРИОДУ, ЧАТУ И ИГРЕ БЕЗ ПОЛНОГО СКАНА
+INDEXES = '''
+    CREATE INDEX IF NOT EXISTS idx_daily_stats_period ON daily_stats (date, chat_id, game_type);
+    CREATE INDEX IF NOT EXISTS idx_weekly_stats_period ON weekly_stats (week_start, chat_id, game_type);
+    CREATE INDEX IF NOT EXISTS idx_win_streaks_chat ON win_streaks (chat_id, game_type, max_streak);
+    CREATE INDEX IF NOT EXISTS idx_user_blocks_end ON user_blocks (block_end);
+    CREATE INDEX IF NOT EXISTS idx_help_messages_status ON help_messages (status, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_rolls_chat ON rolls (chat_id, user_id);
+    CREATE INDEX IF NOT EXISTS idx_rolls_time ON rolls (timestamp);
+'''
+
+# Переносит выбранные строки дневной статистики в месячный архив
+ARCHIVE_UPSERT = '''
+    INSERT INTO monthly_stats (id, chat_id, game_type, month, tries, wins, jackpots)
+    SELECT id, chat_id, game_type, substr(date, 1, 7), SUM(tries), SUM(wins), SUM(jackpots)
+    FROM daily_stats
+    WHERE rowid IN (SELECT value FROM json_each(?))
+    GROUP BY id, chat_id, game_type, substr(date, 1, 7)
+    ON CONFLICT(id, chat_id, game_type, month) DO UPDATE SET
+        tries = monthly_stats.tries + excluded.tries,
+        wins = monthly_stats.wins + excluded.wins,
+        jackpots = monthly_stats.jackpots + excluded.jackpots
+'''
+
+# Таблицы статистики периодов и их колонки ключа периода
+SNAPSHOT_PERIOD_TABLES = (
+    ('day', 'daily_stats', 'date'),
+    ('week', 'weekly_stats', 'week_start'),
+    ('month', 'monthly_stats', 'month'),
+)
+
+# Таблица и колонка периода статистики за сутки и неделю
+PERIOD_TABLES = {
+    'day': ('daily_stats', 'date'),
+    'week': ('weekly_stats', 'week_start'),
+}
+
+# Таблицы, которые можно читать строками целиком (get_row, get_rows)
+ROW_TABLES = ('users',) + tuple(COUNTER_COLUMNS)
+
+class SQLiteEngine(StorageEngine):
+    """Хранилище в SQLite поверх Database: записи в потоке writer, чтения в пуле readers"""
+
+    name = 'sqlite'
+
+    def __init__(self, database):
+        self.database = database
+        self.readers = database.readers
+        self.writer = database.writer
+
+        self.cur.executescript(SCHEMA)
+        self.cur.executescript(INDEXES)
+        self.database.conn.commit()
+
+        if self.roll_checkpoint() is None:
+            self.seed_snapshot()
+
+        # Старые блокировки хранили локальное время строкой - переводим в epoch
+        self.cur.execute('''
+            UPDATE user_blocks SET
+                block_start = CAST(strftime('%s', block_start, 'utc') AS INTEGER),
+                block_end = CAST(strftime('%s', block_end, 'utc') AS INTEGER)
+            WHERE typeof(block_end) = 'text'
+        ''')
+        self.database.conn.commit()
+
+    @property
+    def cur(self):
+        """Курсор текущего потока (поток записи или read-only поток пула)"""
+        return self.database.db
+
+    def commit(self):
+        self.database.conn.commit()
+
+    def seed_snapshot(self):
+        """Первый снимок - текущие счетчики целиком.
+
+        База могла вестись до лога бросков, а броски, которые уже есть в логе, в счетчиках
+        учтены - поэтому checkpoint ставится на последний из них.
+        """
+        logger.info("Создание снимка счетчиков для пересборки по логу бросков")
+        try:
+            self.cur.execute("BEGIN")
+            for game_type in GAME_COLUMNS:
+                jackpots = 'COALESCE(j.slots, 0)' if game_type == 'slots' else '0'
+                self.cur.execute(f'''
+                    INSERT INTO snapshot_counters (id, chat_id, game_type, tries, wins, jackpots, timestamp)
+                    SELECT t.id, t.chat_id, ?, t.{game_type}, COALESCE(w.{game_type}, 0), {jackpots}, t.timestamp
+                    FROM tries t
+                    LEFT JOIN wins w ON w.id = t.id AND w.chat_id = t.chat_id
+                    LEFT JOIN jackpots j ON j.id = t.id AND j.chat_id = t.chat_id
+                    WHERE t.{game_type} > 0
+                ''', (game_type,))
+            for period, table, column in SNAPSHOT_PERIOD_TABLES:
+                self.cur.execute(f'''
+                    INSERT INTO snapshot_periods (period, period_key, id, chat_id, game_type, tries, wins, jackpots)
+                    SELECT ?, {column}, id, chat_id, game_type, tries, wins, jackpots FROM {table}
+                ''', (period,))
+            self.cur.execute('''
+                INSERT INTO snapshot_streaks (id, chat_id, game_type, current_streak, max_streak, last_win_timestamp)
+                SELECT id, chat_id, game_type, current_streak, max_streak, last_win_timestamp FROM win_streaks
+            ''')
+            self.cur.execute("INSERT INTO roll_checkpoint (id, roll_id) SELECT 1, COALESCE(MAX(id), 0) FROM rolls")
+            self.cur.execute("COMMIT")
+        except Exception:
+            self.database.conn.rollback()
+            raise
+
+    # --- Пользователи и админы ---
+
+    def add_user(self, id: int, name: str):
+        self.cur.execute("BEGIN")
+        self.cur.execute("INSERT OR IGNORE INTO users (id, name, congratulate) VALUES (?, ?, ?)", (id, name, True))
+        inserted = self.cur.rowcount == 1
+        self.cur.execute("COMMIT")
+        return inserted
+
+    def set_user_field(self, id: int, parameter: str, value):
+        self.cur.execute(f"UPDATE users SET {parameter} = ? WHERE id = ?", (value, id))
+        self.commit()
+
+    def add_admin(self, user_id: int):
+        self.cur.execute("INSERT OR IGNORE INTO admins (user_id) VALUES (?)", (user_id,))
+        self.commit()
+
+    def is_admin(self, user_id: int):
+        self.cur.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,))
+        return self.cur.fetchone() is not None
+
+    # --- Строки таблиц целиком ---
+
+    def get_row(self, table: str, id: int, chat_id: int = None):
+        # Имя таблицы подставляется в текст запроса - только известные таблицы
+        if table not in ROW_TABLES:
+            return None
+        if chat_id is not None:
+            self.cur.execute(f"SELECT * FROM {table} WHERE id = ? AND chat_id = ?", (id, chat_id))
+        else:
+            self.cur.execute(f"SELECT * FROM {table} WHERE id = ?", (id,))
+        columns = [description[0] for description in self.cur.description]
+        row = self.cur.fetchone()
+        return dict(zip(columns, row)) if row else None
+
+    def get_rows(self, table: str, chat_id: int = None):
+        if table not in ROW_TABLES:
+            return []
+        if chat_id is not None:
+            self.cur.execute(f"SELECT * FROM {table} WHERE chat_id = ?", (chat_id,))
+        else:
+            self.cur.execute(f"SELECT * FROM {table}")
+        columns = [description[0] for description in self.cur.description]
+        return [dict(zip(columns, row)) for row in self.cur.fetchall()]
+
+    # --- Счетчики, периоды, серии, лог бросков ---
+
+    def set_counter(self, table: str, id: int, chat_id: int, column: str, value, timestamp: int):
+        if column not in COUNTER_COLUMNS[table]:
+            raise KeyError(f"Unknown column: {table}.{column}")
+        self.cur.execute(
+            f"INSERT OR REPLACE INTO {table} (id, chat_id, {column}, timestamp) VALUES (?, ?, ?, ?)",
+            (id, chat_id, value, timestamp)
+        )
+        self.commit()
+
+    def increment_counter(self, table: str, column: str, id: int, chat_id: int, amount: int, timestamp: int):
+        if column not in COUNTER_COLUMNS[table]:
+            raise KeyError(f"Unknown column: {table}.{column}")
+        self.cur.execute(COUNTER_UPSERT.format(table=table, column=column), (id, chat_id, amount, timestamp))
+        self.commit()
+
+    def add_period_stats(self, rows: list):
+        self.cur.executemany(DAILY_UPSERT, [(r[0], r[1], r[2], r[5], r[6], r[7], r[3]) for r in rows])
+        self.cur.executemany(WEEKLY_UPSERT, [(r[0], r[1], r[2], r[5], r[6], r[7], r[4]) for r in rows])
+        self.commit()
+
+    def apply_stats(self, rows: list, streaks: list, rolls: list, timestamp: int):
+        by_game = {}
+        for row in rows:
+            by_game.setdefault(row[2], []).append(row)
+
+        try:
+            self.cur.execute("BEGIN")
+            self.cur.executemany(ROLL_INSERT, rolls)
+            for game_type, game_rows in by_game.items():
+                self.cur.executemany(
+                    COUNTER_UPSERT.format(table='tries', column=game_type),
+                    [(r[0], r[1], r[5], timestamp) for r in game_rows if r[5]]
+                )
+                self.cur.executemany(
+                    COUNTER_UPSERT.format(table='wins', column=game_type),
+                    [(r[0], r[1], r[6], timestamp) for r in game_rows if r[6]]
+                )
+            self.cur.executemany(
+                COUNTER_UPSERT.format(table='jackpots', column='slots'),
+                [(r[0], r[1], r[7], timestamp) for r in rows if r[7]]
+            )
+            self.cur.executemany(DAILY_UPSERT, [(r[0], r[1], r[2], r[5], r[6], r[7], r[3]) for r in rows])
+            self.cur.executemany(WEEKLY_UPSERT, [(r[0], r[1], r[2], r[5], r[6], r[7], r[4]) for r in rows])
+            self.cur.executemany(STREAK_SAVE, streaks)
+            self.cur.execute("COMMIT")
+        except Exception:
+            self.database.conn.rollback()
+            raise
+
+    def period_stats(self, period: str, chat_id: int, period_key: str):
+        table, column = PERIOD_TABLES[period]
+        self.cur.execute(f'''
+            SELECT id, game_type, tries, wins, jackpots
+            FROM {table}
+            WHERE chat_id = ? AND {column} = ?
+        ''', (chat_id, period_key))
+        return self.cur.fetchall()
+
+    def period_rows(self, period: str, period_key: str):
+        table, column = PERIOD_TABLES[period]
+        self.cur.execute(
+            f"SELECT id, chat_id, game_type, tries, wins, jackpots FROM {table} WHERE {column} = ?",
+            (period_key,)
+        )
+        return self.cur.fetchall()
+
+    def load_streaks(self):
+        self.cur.execute(
+            "SELECT id, chat_id, game_type, current_streak, max_streak, last_win_timestamp FROM win_streaks"
+        )
+        return self.cur.fetchall()
+
+    def win_streaks(self, chat_id: int, game_type: str = None):
+        if game_type:
+            self.cur.execute('''
+                SELECT id, game_type, max_streak
+                FROM win_streaks
+                WHERE chat_id = ? AND game_type = ? AND max_streak > 0
+                ORDER BY max_streak DESC, id, game_type
+            ''', (chat_id, game_type))
+        else:
+            self.cur.execute('''
+                SELECT id, game_type, max_streak
+                FROM win_streaks
+                WHERE chat_id = ? AND max_streak > 0
+                ORDER BY max_streak DESC, id, game_type
+            ''', (chat_id,))
+        return self.cur.fetchall()
+
+    def rolls_since(self, timestamp: int):
+        self.cur.execute(
+            "SELECT user_id, chat_id, game_type, outcome, timestamp FROM rolls WHERE timestamp >= ? ORDER BY timestamp",
+            (timestamp,)
+        )
+        return self.cur.fetchall()
+
+    def roll_counts(self, chat_id: int, since: int, outcomes: tuple):
+        placeholders = ', '.join('?' * len(outcomes))
+        self.cur.execute(f'''
+            SELECT user_id, game_type, COUNT(*), MAX(timestamp)
+            FROM rolls
+            WHERE chat_id = ? AND timestamp >= ? AND outcome IN ({placeholders})
+            GROUP BY user_id, game_type
+        ''', (chat_id, since) + tuple(outcomes))
+        return self.cur.fetchall()
+
+    def iter_rolls(self, batch_size: int, after: int = 0):
+        # Отдельный курсор: пока лог читается порциями, курсор потока свободен
+        cur = self.database.conn.cursor()
+        cur.execute("SELECT user_id, chat_id, game_type, outcome, timestamp FROM rolls WHERE id > ? ORDER BY id", (after,))
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                return
+            yield batch
+
+    def replace_aggregates(self, counters: dict, last_roll: dict, daily: dict, weekly: dict, monthly: dict, streaks: list):
+        db = self.database.writer_db
+        try:
+            db.execute("BEGIN")
+            for table in ('tries', 'wins', 'jackpots', 'daily_stats', 'weekly_stats', 'monthly_stats', 'win_streaks'):
+                db.execute(f"DELETE FROM {table}")
+
+            for game_type in GAME_COLUMNS:
+                game_rows = [(key, delta) for key, delta in counters.items() if key[2] == game_type]
+                db.executemany(
+                    COUNTER_UPSERT.format(table='tries', column=game_type),
+                    [(key[0], key[1], delta[0], last_roll[key[:2]]) for key, delta in game_rows]
+                )
+                db.executemany(
+                    COUNTER_UPSERT.format(table='wins', column=game_type),
+                    [(key[0], key[1], delta[1], last_roll[key[:2]]) for key, delta in game_rows if delta[1]]
+                )
+            db.executemany(
+                COUNTER_UPSERT.format(table='jackpots', column='slots'),
+                [(key[0], key[1], delta[2], last_roll[key[:2]]) for key, delta in counters.items() if delta[2]]
+            )
+            for table, column, totals in (('daily_stats', 'date', daily),
+                                          ('weekly_stats', 'week_start', weekly),
+                                          ('monthly_stats', 'month', monthly)):
+                db.executemany(
+                    f"INSERT INTO {table} (id, chat_id, game_type, {column}, tries, wins, jackpots) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [key + tuple(delta) for key, delta in totals.items()]
+                )
+            db.executemany(STREAK_SAVE, streaks)
+            db.execute("COMMIT")
+        except Exception:
+            self.database.conn.rollback()
+            raise
+
+    # --- Снимок счетчиков ---
+
+    def roll_checkpoint(self):
+        self.cur.execute("SELECT roll_id FROM roll_checkpoint")
+        row = self.cur.fetchone()
+        return row[0] if row else None
+
+    def rolls_after(self, roll_id: int, limit: int):
+        self.cur.execute(
+            "SELECT id, user_id, chat_id, game_type, outcome, timestamp FROM rolls WHERE id > ? ORDER BY id LIMIT ?",
+            (roll_id, limit)
+        )
+        return self.cur.fetchall()
+
+    def load_snapshot(self):
+        counters, last_roll = {}, {}
+        self.cur.execute("SELECT id, chat_id, game_type, tries, wins, jackpots, timestamp FROM snapshot_counters")
+        for id, chat_id, game_type, tries, wins, jackpots, timestamp in self.cur.fetchall():
+            counters[(id, chat_id, game_type)] = [tries, wins, jackpots]
+            last_roll[(id, chat_id)] = max(timestamp or 0, last_roll.get((id, chat_id)) or 0) or None
+
+        periods = {period: {} for period, _, _ in SNAPSHOT_PERIOD_TABLES}
+        self.cur.execute("SELECT period, period_key, id, chat_id, game_type, tries, wins, jackpots FROM snapshot_periods")
+        for period, period_key, id, chat_id, game_type, tries, wins, jackpots in self.cur.fetchall():
+            periods[period][(id, chat_id, game_type, period_key)] = [tries, wins, jackpots]
+
+        self.cur.execute(
+            "SELECT id, chat_id, game_type, current_streak, max_streak, last_win_timestamp FROM snapshot_streaks"
+        )
+        return counters, last_roll, periods['day'], periods['week'], periods['month'], self.cur.fetchall()
+
+    def snapshot_streaks(self, keys):
+        rows = []
+        for key in keys:
+            self.cur.execute('''
+                SELECT id, chat_id, game_type, current_streak, max_streak, last_win_timestamp
+                FROM snapshot_streaks
+                WHERE id = ? AND chat_id = ? AND game_type = ?
+            ''', key)
+            rows.extend(self.cur.fetchall())
+        return rows
+
+    def fold_snapshot(self, counters: dict, last_roll: dict, daily: dict, weekly: dict, monthly: dict,
+                      streaks: list, checkpoint: int):
+        try:
+            self.cur.execute("BEGIN")
+            self.cur.executemany(
+                SNAPSHOT_COUNTER_UPSERT,
+                [key + tuple(totals) + (last_roll[key[:2]],) for key, totals in counters.items()]
+            )
+            for period, totals in (('day', daily), ('week', weekly), ('month', monthly)):
+                self.cur.executemany(
+                    SNAPSHOT_PERIOD_UPSERT,
+                    [(period, key[3]) + key[:3] + tuple(delta) for key, delta in totals.items()]
+                )
+            self.cur.executemany(SNAPSHOT_STREAK_SAVE, streaks)
+            self.cur.execute("UPDATE roll_checkpoint SET roll_id = ?", (checkpoint,))
+            self.cur.execute("COMMIT")
+        except Exception:
+            self.database.conn.rollback()
+            raise
+
+    def delete_rolls(self, before: int, limit: int):
+        rowids = self.select_rowids(
+            "SELECT id FROM rolls WHERE id <= (SELECT roll_id FROM roll_checkpoint) AND timestamp < ?", (before,), limit
+        )
+        if rowids:
+            try:
+                self.cur.execute("BEGIN")
+                self.delete_rowids('rolls', rowids)
+                self.cur.execute(CHECKPOINT_CLAMP)
+                self.cur.execute("COMMIT")
+            except Exception:
+                self.database.conn.rollback()
+                raise
+        return len(rowids)
+
+    def compact_snapshot(self, day_cutoff: str, week_cutoff: str, limit: int):
+        days = self.select_rowids(
+            "SELECT rowid FROM snapshot_periods WHERE period = 'day' AND period_key < ?", (day_cutoff,), limit
+        )
+        if days:
+            try:
+                self.cur.execute("BEGIN")
+                self.cur.execute(SNAPSHOT_ARCHIVE_UPSERT, (json.dumps(days),))
+                self.delete_rowids('snapshot_periods', days)
+                self.cur.execute("COMMIT")
+            except Exception:
+                self.database.conn.rollback()
+                raise
+        weeks = self.select_rowids(
+            "SELECT rowid FROM snapshot_periods WHERE period = 'week' AND period_key < ?", (week_cutoff,), limit - len(days)
+        )
+        if weeks:
+            self.delete_rowids('snapshot_periods', weeks)
+            self.commit()
+        return len(days) + len(weeks)
+
+    # --- Блокировки, обращения, отложенные удаления ---
+
+    def put_block(self, user_id: int, chat_id: int, reason: str, start: int, end: int):
+        self.cur.execute('''
+            INSERT OR REPLACE INTO user_blocks
+            (id, chat_id, block_reason, block_start, block_end)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, chat_id, reason, start, end))
+        self.commit()
+
+    def delete_block(self, user_id: int, chat_id: int):
+        self.cur.execute('''
+            DELETE FROM user_blocks
+            WHERE id = ? AND chat_id = ?
+        ''', (user_id, chat_id))
+        self.commit()
+
+    def active_blocks(self, now: int):
+        self.cur.execute(
+            "SELECT id, chat_id, block_reason, block_start, block_end FROM user_blocks WHERE block_end > ?",
+            (now,)
+        )
+        return self.cur.fetchall()
+
+    def add_help_message(self, user_id: int, chat_id: int, text: str):
+        self.cur.execute('''
+            INSERT INTO help_messages (user_id, chat_id, message_text)
+            VALUES (?, ?, ?)
+        ''', (user_id, chat_id, text))
+        self.commit()
+        return self.cur.lastrowid
+
+    def pending_help_messages(self):
+        self.cur.execute('''
+            SELECT message_id, user_id, chat_id, message_text, timestamp
+            FROM help_messages
+            WHERE status = 'pending'
+            ORDER BY timestamp ASC
+        ''')
+        return self.cur.fetchall()
+
+    def set_help_status(self, message_id: int, status: str):
+        self.cur.execute('''
+            UPDATE help_messages
+            SET status = ?
+            WHERE message_id = ?
+        ''', (status, message_id))
+        self.commit()
+
+    def add_pending_deletion(self, chat_id: int, message_id: int, due: int):
+        self.cur.execute(
+            "INSERT OR REPLACE INTO pending_deletions (chat_id, message_id, due) VALUES (?, ?, ?)",
+            (chat_id, message_id, due)
+        )
+        self.commit()
+
+    def pending_deletions(self):
+        self.cur.execute("SELECT chat_id, message_id, due FROM pending_deletions")
+        return self.cur.fetchall()
+
+    def remove_pending_deletions(self, messages: list):
+        self.cur.executemany("DELETE FROM pending_deletions WHERE chat_id = ? AND message_id = ?", messages)
+        self.commit()
+
+    # --- Сброс ---
+
+    def reset_user(self, id: int, chat_id: int):
+        try:
+            self.cur.execute("BEGIN")
+            self.cur.execute("DELETE FROM tries WHERE id = ? AND chat_id = ?", (id, chat_id))
+            self.cur.execute("DELETE FROM wins WHERE id = ? AND chat_id = ?", (id, chat_id))
+            self.cur.execute("DELETE FROM jackpots WHERE id = ? AND chat_id = ?", (id, chat_id))
+            self.cur.execute("DELETE FROM win_streaks WHERE id = ? AND chat_id = ?", (id, chat_id))
+            # Без бросков в логе и снимке пересборка не вернет сброшенные счетчики
+            self.cur.execute("DELETE FROM rolls WHERE chat_id = ? AND user_id = ?", (chat_id, id))
+            self.cur.execute("DELETE FROM snapshot_counters WHERE id = ? AND chat_id = ?", (id, chat_id))
+            self.cur.execute("DELETE FROM snapshot_streaks WHERE id = ? AND chat_id = ?", (id, chat_id))
+            self.cur.execute(CHECKPOINT_CLAMP)
+            self.cur.execute("COMMIT")
+        except Exception:
+            self.database.conn.rollback()
+            raise
+
+    def reset_chat(self, chat_id: int):
+        try:
+            self.cur.execute("BEGIN")
+            self.cur.execute("DELETE FROM tries WHERE chat_id = ?", (chat_id,))
+            self.cur.execute("DELETE FROM wins WHERE chat_id = ?", (chat_id,))
+            self.cur.execute("DELETE FROM jackpots WHERE chat_id = ?", (chat_id,))
+            self.cur.execute("DELETE FROM win_streaks WHERE chat_id = ?", (chat_id,))
+            self.cur.execute("DELETE FROM rolls WHERE chat_id = ?", (chat_id,))
+            self.cur.execute("DELETE FROM snapshot_counters WHERE chat_id = ?", (chat_id,))
+            self.cur.execute("DELETE FROM snapshot_streaks WHERE chat_id = ?", (chat_id,))
+            self.cur.execute(CHECKPOINT_CLAMP)
+            self.cur.execute("COMMIT")
+        except Exception:
+            self.database.conn.rollback()
+            raise
+
+    def reset_all(self):
+        try:
+            self.cur.execute("BEGIN")
+            self.cur.execute("DELETE FROM tries")
+            self.cur.execute("DELETE FROM wins")
+            self.cur.execute("DELETE FROM jackpots")
+            self.cur.execute("DELETE FROM daily_stats")
+            self.cur.execute("DELETE FROM weekly_stats")
+            self.cur.execute("DELETE FROM monthly_stats")
+            self.cur.execute("DELETE FROM win_streaks")
+            self.cur.execute("DELETE FROM rolls")
+            self.cur.execute("DELETE FROM snapshot_counters")
+            self.cur.execute("DELETE FROM snapshot_periods")
+            self.cur.execute("DELETE FROM snapshot_streaks")
+            self.cur.execute(CHECKPOINT_CLAMP)
+            self.cur.execute("DELETE FROM user_blocks")  # Блокировки тоже снимаются
+            self.cur.execute("COMMIT")
+        except Exception:
+            self.database.conn.rollback()
+            raise
+
+    # --- Обслуживание порциями: одна порция - одна короткая транзакция ---
+
+    def select_rowids(self, sql: str, params: tuple, limit: int):
+        self.cur.execute(sql + ' LIMIT ?', params + (limit,))
+        return [row[0] for row in self.cur.fetchall()]
+
+    def delete_rowids(self, table: str, rowids: list):
+        self.cur.execute(f"DELETE FROM {table} WHERE rowid IN (SELECT value FROM json_each(?))", (json.dumps(rowids),))
+
+    def archive_days(self, cutoff: str, limit: int):
+        rowids = self.select_rowids("SELECT rowid FROM daily_stats WHERE date < ?", (cutoff,), limit)
+        if not rowids:
+            return 0
+        try:
+            self.cur.execute("BEGIN")
+            self.cur.execute(ARCHIVE_UPSERT, (json.dumps(rowids),))
+            self.delete_rowids('daily_stats', rowids)
+            self.cur.execute("COMMIT")
+        except Exception:
+            self.database.conn.rollback()
+            raise
+        return len(rowids)
+
+    def prune_weeks(self, cutoff: str, limit: int):
+        # Броски этих недель уже учтены в дневной статистике и архиве
+        rowids = self.select_rowids("SELECT rowid FROM weekly_stats WHERE week_start < ?", (cutoff,), limit)
+        if rowids:
+            self.delete_rowids('weekly_stats', rowids)
+            self.commit()
+        return len(rowids)
+
+    def delete_expired_blocks(self, now: int, limit: int):
+        rowids = self.select_rowids("SELECT rowid FROM user_blocks WHERE block_end <= ?", (now,), limit)
+        if rowids:
+            self.delete_rowids('user_blocks', rowids)
+            self.commit()
+        return len(rowids)
+
+    def prune_help_messages(self, cutoff: str, limit: int):
+        # cutoff - UTC, как CURRENT_TIMESTAMP
+        rowids = self.select_rowids(
+            "SELECT rowid FROM help_messages WHERE status != 'pending' AND timestamp < ?", (cutoff,), limit
+        )
+        if rowids:
+            self.delete_rowids('help_messages', rowids)
+            self.commit()
+        return len(rowids)
+
+    def vacuum(self, limit: int):
+        """Возвращает в файловую систему до limit свободных страниц"""
+        self.cur.execute("PRAGMA freelist_count")
+        pages = min(self.cur.fetchone()[0], limit)
+        if pages:
+            # execute освобождает одну страницу за шаг - executescript выполняет pragma до конца
+            self.cur.executescript(f"PRAGMA incremental_vacuum({pages})")
+        return pages
+
+    def optimize(self):
+        self.cur.execute("PRAGMA optimize")
+        return 0
+
+    def close(self):
+        self.database.close()
@@ -1,22 +1,25 @@
-import asyncio
 import time
 import logging
 
 from aiogram import Bot, Dispatcher, types
 from aiogram.types import ContentType
 
-from libraries.users import Users
+from libraries.users import AsyncUsers
+from libraries.outbox import Outbox, BLOCK, CONGRATS
 
 # Настраиваем логгер
 logger = logging.getLogger(__name__)
 
 class MessagesHandler:
-    def __init__(self, dp: Dispatcher, bot: Bot, games: dict, database: Users):
+    def __init__(self, dp: Dispatcher, bot: Bot, games: dict, database: AsyncUsers, outbox: Outbox):
+        self.outbox = outbox
         self.register(dp, bot, games, database)
         self.last_dice_time = {}  # Словарь для хранения времени последнего депа по пользователям
         self.special_user_losing_streaks = {}  # Счетчик проигрышных депов для специального пользователя
     
-    def register(self, dp, bot, games: dict, database: Users):
+    def register(self, dp, bot, games: dict, database: AsyncUsers):
+        outbox = self.outbox
+
         # 🔥 СПЕЦИАЛЬНЫЙ ПОЛЬЗОВАТЕЛЬ
         SPECIAL_USER_ID = 751379478  # ID пользователя для специальных сообщений
         
@@ -26,36 +29,23 @@ class MessagesHandler:
             user_id = message.from_user.id
             chat_id = message.chat.id
             
-            # 🔥 ПРОВЕРЯЕМ РУЧНУЮ БЛОКИРОВКУ
-            if database.is_user_blocked(user_id, chat_id):
-                block_info = database.get_block_info(user_id, chat_id)
-                if block_info:
-                    from datetime import datetime
-                    end_time = datetime.strptime(block_info['end'], '%Y-%m-%d %H:%M:%S')
-                    remaining = end_time - datetime.now()
-                    minutes_left = int(remaining.total_seconds() / 60)
-                    
-                    # УПРОЩЕННОЕ СООБЩЕНИЕ О БЛОКИРОВКЕ
-                    warning_msg = await bot.send_message(
-                        chat_id,
-                        f'🚫 Пользователь @{message.from_user.username if message.from_user.username else message.from_user.full_name} заблокирован!\n'
-                        f'⏳ <b>Разблокировка через:</b> {minutes_left} минут',
-                        message_thread_id=message.message_thread_id
-                    )
-                    
-                    # Удаляем оригинальное сообщение
-                    try:
-                        await message.delete()
-                        logger.info(f"✅ Удален dice от заблокированного пользователя {user_id}")
-                    except Exception as e:
-                        logger.error(f"❌ Не удалось удалить dice: {e}")
-                    
-                    # Удаляем предупреждение через 5 секунд
-                    await asyncio.sleep(5)
-                    try:
-                        await warning_msg.delete()
-                    except:
-                        pass
+            # 🔥 ПРОВЕРЯЕМ РУЧНУЮ БЛОКИРОВКУ (индекс в памяти, без запроса к базе)
+            block_info = await database.get_block_info(user_id, chat_id)
+            if block_info:
+                minutes_left = int((block_info['end'] - time.time()) / 60)
+                
+                # УПРОЩЕННОЕ СООБЩЕНИЕ О БЛОКИРОВКЕ, ПРЕДУПРЕЖДЕНИЕ УДАЛЯЕТСЯ ЧЕРЕЗ 5 СЕКУНД
+                outbox.send_message(
+                    chat_id,
+                    f'🚫 Пользователь @{message.from_user.username if message.from_user.username else message.from_user.full_name} заблокирован!\n'
+                    f'⏳ <b>Разблокировка через:</b> {minutes_left} минут',
+                    priority=BLOCK, delete_after=5,
+                    message_thread_id=message.message_thread_id
+                )
+                
+                # Удаляем оригинальное сообщение
+                outbox.delete_message(chat_id, message.message_id)
+                logger.info(f"✅ Удаление dice от заблокированного пользователя {user_id} поставлено в очередь")
                 return  # Полностью прекращаем обработку
             
             # Убрали проверку на быстрые депы
@@ -83,41 +73,29 @@ class MessagesHandler:
                 return
             
             # Проверяем ручную блокировку
-            if database.is_user_blocked(user_id, chat_id):
+            block_info = await database.get_block_info(user_id, chat_id)
+            if block_info:
                 # Отправляем сообщение только для команд /start, /casino
                 if message.text and message.text.lower() in ['/start', '/casino']:
-                    block_info = database.get_block_info(user_id, chat_id)
-                    if block_info:
-                        from datetime import datetime
-                        end_time = datetime.strptime(block_info['end'], '%Y-%m-%d %H:%M:%S')
-                        remaining = end_time - datetime.now()
-                        minutes_left = int(remaining.total_seconds() / 60)
-                        
-                        warning_msg = await bot.send_message(
-                            chat_id,
-                            f'🚫 Пользователь @{message.from_user.username if message.from_user.username else message.from_user.full_name} заблокирован!\n'
-                            f'⏳ <b>Разблокировка через:</b> {minutes_left} минут',
-                            message_thread_id=message.message_thread_id
-                        )
-                        
-                        await asyncio.sleep(5)
-                        try:
-                            await warning_msg.delete()
-                        except:
-                            pass
+                    minutes_left = int((block_info['end'] - time.time()) / 60)
+                    
+                    outbox.send_message(
+                        chat_id,
+                        f'🚫 Пользователь @{message.from_user.username if message.from_user.username else message.from_user.full_name} заблокирован!\n'
+                        f'⏳ <b>Разблокировка через:</b> {minutes_left} минут',
+                        priority=BLOCK, delete_after=5,
+                        message_thread_id=message.message_thread_id
+                    )
                 
                 # Удаляем сообщение от заблокированного пользователя
-                try:
-                    await message.delete()
-                    logger.info(f"✅ Удалено сообщение от заблокированного пользователя {user_id}")
-                except Exception as e:
-                    logger.error(f"❌ Не удалось удалить сообщение: {e}")
+                outbox.delete_message(chat_id, message.message_id)
+                logger.info(f"✅ Удаление сообщения от заблокированного пользователя {user_id} поставлено в очередь")
                 return
 
         async def process_dice(message: types.Message, emoji: str, value: int, user: int):
             # 🔥 РЕГИСТРИРУЕМ ПОЛЬЗОВАТЕЛЬ ЕСЛИ ЕГО НЕТ
-            if not database.get('users', user):
-                database.add(user, message.from_user.full_name)
+            if not await database.get('users', user):
+                await database.add(user, message.from_user.full_name)
 
             # Проверяем, что сообщение не переслано
             if message.forward_date:
@@ -127,42 +105,32 @@ class MessagesHandler:
             game_name = game['name']
             chat_id = message.chat.id
 
-            # Обновляем основную статистику
-            database.increment('tries', user, chat_id, game_name)
-
-            # Обновляем статистику периодов
-            tries = 1
-            wins = 0
-            jackpots = 0
-
-            async def congratulate():
-                await asyncio.sleep(1)
-                await bot.send_message(
+            # Сообщения отправляет очередь исходящих после анимации кубика
+            def congratulate(delay: float = 1):
+                outbox.send_message(
                     message.chat.id,
                     f'🤑 <b>Выигрыш!</b> Поздравляем.',
+                    priority=CONGRATS, delay=delay,
                     message_thread_id=message.message_thread_id
                 )
 
-            is_win = False
+            outcome = 'loss'
             
-            # Проверяем джекпот (только для слотов)
+            # Проверяем джекпот (только для слотов), он учитывается и как выигрыш
             if emoji == '🎰' and value == game.get('jackpot'):
-                database.increment('jackpots', user, chat_id, 'slots')
-                database.increment('wins', user, chat_id, 'slots')  # Учитываем джекпот как выигрыш
-                wins = 1
-                jackpots = 1
-                is_win = True
+                outcome = 'jackpot'
                 
             # Проверяем обычные выигрыши
             elif value in game['win']:
-                database.increment('wins', user, chat_id, game_name)
-                wins = 1
-                is_win = True
+                outcome = 'win'
+
+            is_win = outcome != 'loss'
 
-            # 🔥 ОБНОВЛЯЕМ СЕРИИ ПОБЕД
-            current_streak, max_streak = database.update_win_streak(user, chat_id, game_name, is_win)
+            # 🔥 ЗАПИСЫВАЕМ БРОСОК: СЧЕТЧИКИ, СТАТИСТИКУ ПЕРИОДОВ И СЕРИЮ ПОБЕД
+            current_streak, max_streak = await database.record_roll(user, chat_id, game_name, value, outcome)
             
             # Если установлена новая максимальная серия, уведомляем
+            congratulate_delay = 1
             if is_win and current_streak > 3:  # Уведомляем только при серии от 4 побед
                 streak_message = ""
                 if current_streak == 4:
@@ -173,21 +141,20 @@ class MessagesHandler:
                     streak_message = "🔥🔥🔥"
                 
                 if streak_message:
-                    await asyncio.sleep(1.5)
-                    await bot.send_message(
+                    outbox.send_message(
                         message.chat.id,
                         f'{streak_message} <b>Серия побед!</b> {current_streak} подряд!',
+                        priority=CONGRATS, delay=1.5,
                         message_thread_id=message.message_thread_id
                     )
+                    # Поздравление идет после сообщения о серии, как раньше
+                    congratulate_delay = 2.5
 
        
 
-            # Обновляем периодическую статистику
-            database.increment_period_stats(user, chat_id, game_name, tries, wins, jackpots)
-
             # Поздравляем если это был выигрыш и включены уведомления
-            if is_win and database.get('users', user).get('congratulate'):
-                await congratulate()
+            if is_win and (await database.get('users', user)).get('congratulate'):
+                congratulate(congratulate_delay)
 
         @dp.message_handler(commands=['dice', 'slots', 'bask', 'dart', 'foot', 'bowl'])
         async def roll_dice(message: types.Message):
@@ -195,25 +162,18 @@ class MessagesHandler:
             chat_id = message.chat.id
             
             # Проверяем ручную блокировку
-            if database.is_user_blocked(user_id, chat_id):
-                block_info = database.get_block_info(user_id, chat_id)
-                if block_info:
-                    from datetime import datetime
-                    end_time = datetime.strptime(block_info['end'], '%Y-%m-%d %H:%M:%S')
-                    remaining = end_time - datetime.now()
-                    minutes_left = int(remaining.total_seconds() / 60)
-                    
-                    warning_msg = await message.reply(
-                        f'🚫 Вы заблокированы!\n'
-                        f'⏳ <b>Разблокировка через:</b> {minutes_left} минут',
-                        disable_notification=True
-                    )
-                    
-                    await asyncio.sleep(5)
-                    try:
-                        await warning_msg.delete()
-                    except:
-                        pass
+            block_info = await database.get_block_info(user_id, chat_id)
+            if block_info:
+                minutes_left = int((block_info['end'] - time.time()) / 60)
+                
+                outbox.send_message(
+                    chat_id,
+                    f'🚫 Вы заблокированы!\n'
+                    f'⏳ <b>Разблокировка через:</b> {minutes_left} минут',
+                    priority=BLOCK, delete_after=5,
+                    reply_to_message_id=message.message_id,
+                    disable_notification=True
+                )
                 return
 
             # Убрали проверку анти-спам защиты для команд
@@ -1,30 +1,36 @@
-from aiogram import Bot, Dispatcher, types
+from aiogram import Bot, types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from libraries.users import Users
+from libraries.users import AsyncUsers
+from libraries.render_cache import RenderCache
+from libraries.callbacks import (
+    CallbackRouter, RATING_MAIN, RATING_GAME, RATING_PERIOD, RATING_CRITERIA, BACK_TO_MAIN
+)
 
 class RatingHandler:
-    def __init__(self, dp: Dispatcher, bot: Bot, database: Users):
+    def __init__(self, router: CallbackRouter, bot: Bot, database: AsyncUsers, cache: RenderCache = None):
         self.database = database
-        self.register(dp, bot, database)
+        # 🔥 КЭШ ОТРИСОВАННЫХ РЕЙТИНГОВ, СБРАСЫВАЕТСЯ ПО ВЕРСИИ (ЧАТ, ИГРА)
+        self.cache = cache if cache is not None else RenderCache()
+        self.register(router, bot, database)
     
-    def register(self, dp: Dispatcher, bot: Bot, database: Users):
+    def register(self, router: CallbackRouter, bot: Bot, database: AsyncUsers):
         # Главное меню рейтингов
-        @dp.callback_query_handler(lambda c: c.data == 'rating_main')
+        @router.handler(RATING_MAIN)
         async def rating_main(callback: types.CallbackQuery):
             keyboard = InlineKeyboardMarkup(row_width=2)
             keyboard.add(
-                InlineKeyboardButton('🎰 Слоты', callback_data='rating_game-slots'),
-                InlineKeyboardButton('🎲 Кубик', callback_data='rating_game-dice')
+                InlineKeyboardButton('🎰 Слоты', callback_data=RATING_GAME.pack('slots')),
+                InlineKeyboardButton('🎲 Кубик', callback_data=RATING_GAME.pack('dice'))
             )
             keyboard.add(
-                InlineKeyboardButton('⚽️ Футбол', callback_data='rating_game-foot'),  # 🔥 ИСПРАВЛЕНО: возвращаем ⚽️
-                InlineKeyboardButton('🎳 Боулинг', callback_data='rating_game-bowl')
+                InlineKeyboardButton('⚽️ Футбол', callback_data=RATING_GAME.pack('foot')),  # 🔥 ИСПРАВЛЕНО: возвращаем ⚽️
+                InlineKeyboardButton('🎳 Боулинг', callback_data=RATING_GAME.pack('bowl'))
             )
             keyboard.add(
-                InlineKeyboardButton('🏀 Баскетбол', callback_data='rating_game-bask'),
-                InlineKeyboardButton('🎯 Дартс', callback_data='rating_game-dart')
+                InlineKeyboardButton('🏀 Баскетбол', callback_data=RATING_GAME.pack('bask')),
+                InlineKeyboardButton('🎯 Дартс', callback_data=RATING_GAME.pack('dart'))
             )
-            keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data='back-to-main'))
+            keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data=BACK_TO_MAIN.pack()))
 
             await callback.message.edit_text(
                 "🏆 <b>Рейтинги</b>\n\nВыберите игру:",
@@ -33,10 +39,8 @@ class RatingHandler:
             await callback.answer()
 
         # Выбор игры
-        @dp.callback_query_handler(lambda c: c.data.startswith('rating_game-'))
-        async def rating_select_game(callback: types.CallbackQuery):
-            game = callback.data.split('-')[1]
-            
+        @router.handler(RATING_GAME)
+        async def rating_select_game(callback: types.CallbackQuery, game: str):
             game_emojis = {
                 'slots': '🎰',
                 'dice': '🎲', 
@@ -60,10 +64,15 @@ class RatingHandler:
 
             keyboard = InlineKeyboardMarkup()
             keyboard.add(
-                InlineKeyboardButton('📅 За сутки', callback_data=f'rating_period-{game}-day'),
-                InlineKeyboardButton('📅 За неделю', callback_data=f'rating_period-{game}-week')
+                InlineKeyboardButton('📅 За сутки', callback_data=RATING_PERIOD.pack(game, 'day')),
+                InlineKeyboardButton('📅 За неделю', callback_data=RATING_PERIOD.pack(game, 'week'))
+            )
+            # 🔥 СКОЛЬЗЯЩИЕ ОКНА: ПОСЛЕДНИЕ 24 ЧАСА И 7 ДНЕЙ
+            keyboard.add(
+                InlineKeyboardButton('🕐 24 часа', callback_data=RATING_PERIOD.pack(game, '24h')),
+                InlineKeyboardButton('🕐 7 дней', callback_data=RATING_PERIOD.pack(game, '7d'))
             )
-            keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data='rating_main'))
+            keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data=RATING_MAIN.pack()))
 
             await callback.message.edit_text(
                 f"{emoji} <b>Рейтинги {name}</b>\n\nВыберите период:",
@@ -72,12 +81,8 @@ class RatingHandler:
             await callback.answer()
 
         # Выбор периода
-        @dp.callback_query_handler(lambda c: c.data.startswith('rating_period-'))
-        async def rating_select_period(callback: types.CallbackQuery):
-            data_parts = callback.data.split('-')
-            game = data_parts[1]
-            period = data_parts[2]
-            
+        @router.handler(RATING_PERIOD)
+        async def rating_select_period(callback: types.CallbackQuery, game: str, period: str):
             game_emojis = {
                 'slots': '🎰',
                 'dice': '🎲',
@@ -98,7 +103,9 @@ class RatingHandler:
             
             period_names = {
                 'day': 'сутки',
-                'week': 'неделю'
+                'week': 'неделю',
+                '24h': 'последние 24 часа',
+                '7d': 'последние 7 дней'
             }
             
             emoji = game_emojis.get(game, '🎰')
@@ -109,19 +116,19 @@ class RatingHandler:
             
             # Для всех игр показываем стандартные кнопки
             keyboard.add(
-                InlineKeyboardButton('✅ Выигрыши', callback_data=f'rating_criteria-{game}-{period}-wins'),
-                InlineKeyboardButton('🎯 Попытки', callback_data=f'rating_criteria-{game}-{period}-tries')
+                InlineKeyboardButton('✅ Выигрыши', callback_data=RATING_CRITERIA.pack(game, period, 'wins')),
+                InlineKeyboardButton('🎯 Попытки', callback_data=RATING_CRITERIA.pack(game, period, 'tries'))
             )
             keyboard.add(
-                InlineKeyboardButton('📊 Винрейт', callback_data=f'rating_criteria-{game}-{period}-winrate'),
-                InlineKeyboardButton('🔥 Серии', callback_data=f'rating_criteria-{game}-{period}-streaks')  # 🔥 НОВАЯ КНОПКА
+                InlineKeyboardButton('📊 Винрейт', callback_data=RATING_CRITERIA.pack(game, period, 'winrate')),
+                InlineKeyboardButton('🔥 Серии', callback_data=RATING_CRITERIA.pack(game, period, 'streaks'))  # 🔥 НОВАЯ КНОПКА
             )
             
             # Только для слотов добавляем джекпоты
             if game == 'slots':
-                keyboard.add(InlineKeyboardButton('⭐️ Джекпоты', callback_data=f'rating_criteria-{game}-{period}-jackpots'))
+                keyboard.add(InlineKeyboardButton('⭐️ Джекпоты', callback_data=RATING_CRITERIA.pack(game, period, 'jackpots')))
             
-            keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data=f'rating_game-{game}'))
+            keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data=RATING_GAME.pack(game)))
 
             await callback.message.edit_text(
                 f"{emoji} <b>Рейтинги {name}</b>\n📅 <b>Период:</b> за {period_name}\n\nВыберите критерий:",
@@ -130,13 +137,8 @@ class RatingHandler:
             await callback.answer()
 
         # Отображение рейтинга
-        @dp.callback_query_handler(lambda c: c.data.startswith('rating_criteria-'))
-        async def rating_show(callback: types.CallbackQuery):
-            data_parts = callback.data.split('-')
-            game = data_parts[1]
-            period = data_parts[2]
-            criteria = data_parts[3]
-            
+        @router.handler(RATING_CRITERIA)
+        async def rating_show(callback: types.CallbackQuery, game: str, period: str, criteria: str):
             game_emojis = {
                 'slots': '🎰',
                 'dice': '🎲',
@@ -157,7 +159,9 @@ class RatingHandler:
             
             period_names = {
                 'day': 'сутки',
-                'week': 'неделю'
+                'week': 'неделю',
+                '24h': 'последние 24 часа',
+                '7d': 'последние 7 дней'
             }
             
             criteria_names = {
@@ -173,28 +177,10 @@ class RatingHandler:
             period_name = period_names.get(period, 'сутки')
             criteria_name = criteria_names.get(criteria, 'Выигрыши')
 
-            # Получаем рейтинг
-            if criteria == 'streaks':
-                rating_data = self.build_streak_rating(callback.message.chat.id, game)
-            else:
-                rating_data = self.build_period_rating(callback.message.chat.id, game, criteria, period)
-            
-            user_place = self.find_user_place(callback.from_user.id, rating_data)
-
-            # Формируем текст рейтинга
-            if not rating_data:
-                rating_text = "📊 <i>Пока нет статистики для этого периода</i>"
-            else:
-                rating_lines = []
-                for i, (user_data, value) in enumerate(rating_data[:10]):  # Топ-10
-                    if criteria == 'winrate':
-                        value_text = f"{value:.1%}"
-                    else:
-                        value_text = str(int(value))
-                    
-                    rating_lines.append(f"<b>{i+1}.</b> {user_data['name']} - {value_text}")
-                
-                rating_text = '\n'.join(rating_lines)
+            # Топ-10 берем из кэша, место пользователя считаем на каждый запрос
+            chat_id = callback.message.chat.id
+            rating_text = await self.render_rating(chat_id, game, criteria, period)
+            user_place = self.find_user_place(callback.from_user.id, chat_id, game, criteria, period)
 
             title = f"{emoji} <b>РЕЙТИНГ {game_name.upper()}</b>"
             period_info = f"📅 <b>Период:</b> за {period_name}"
@@ -205,87 +191,51 @@ class RatingHandler:
 
             # Клавиатура для возврата
             keyboard = InlineKeyboardMarkup()
-            keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data=f'rating_period-{game}-{period}'))
+            keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data=RATING_PERIOD.pack(game, period)))
 
             await callback.message.edit_text(text, reply_markup=keyboard)
             await callback.answer()
 
-    def build_streak_rating(self, chat_id: int, game: str):
-        """Строит рейтинг по максимальным сериям побед"""
-        ranking = []
-        user_names = {}
-
-        # Получаем имена пользователей
-        all_users = self.database.get_all('users')
-        for user in all_users:
-            user_names[user['id']] = user.get('name', 'Unknown')
-
-        # Получаем серии побед
-        streaks_data = self.database.get_win_streaks(chat_id, game)
-
-        # Формируем рейтинг
-        for streak in streaks_data:
-            user_id = streak['id']
-            max_streak = streak['max_streak']
+    async def render_rating(self, chat_id: int, game: str, criteria: str, period: str):
+        """Возвращает текст топ-10, перестраивая его только после новых бросков"""
+        leaderboards = self.database.leaderboards
+        key = (chat_id, game, period, leaderboards.current_period_key(period), criteria)
+        version = leaderboards.version(chat_id, game)
+
+        rating_text = self.cache.get(key, version)
+        if rating_text is not None:
+            return rating_text
+
+        rating_data = await self.build_rating(chat_id, game, criteria, period)
+
+        # Формируем текст рейтинга
+        if not rating_data:
+            rating_text = "📊 <i>Пока нет статистики для этого периода</i>"
+        else:
+            rating_lines = []
+            for i, (user_data, value) in enumerate(rating_data):  # Топ-10
+                if criteria == 'winrate':
+                    value_text = f"{value:.1%}"
+                else:
+                    value_text = str(int(value))
+                
+                rating_lines.append(f"<b>{i+1}.</b> {user_data['name']} - {value_text}")
             
-            if max_streak > 0:
-                ranking.append(({'id': user_id, 'name': user_names.get(user_id, 'Unknown')}, max_streak))
+            rating_text = '\n'.join(rating_lines)
 
-        return sorted(ranking, key=lambda x: x[1], reverse=True)
+        self.cache.put(key, version, rating_text)
+        return rating_text
 
-    def build_period_rating(self, chat_id: int, game: str, criteria: str, period: str):
-        """Строит рейтинг из системы периодов"""
+    async def build_rating(self, chat_id: int, game: str, criteria: str, period: str, limit: int = 10):
+        """Строит топ рейтинга по периоду или по сериям из рейтингов в памяти"""
         ranking = []
-        user_names = {}
-
-        # Получаем имена пользователей
-        all_users = self.database.get_all('users')
-        for user in all_users:
-            user_names[user['id']] = user.get('name', 'Unknown')
-
-        # Получаем статистику за период
-        if period == 'day':
-            stats_data = self.database.get_daily_stats(chat_id)
-        else:  # week
-            stats_data = self.database.get_weekly_stats(chat_id)
-
-        # Группируем статистику по пользователям
-        user_stats = {}
-        for stat in stats_data:
-            if stat['game_type'] == game:
-                user_id = stat['id']
-                if user_id not in user_stats:
-                    user_stats[user_id] = {
-                        'tries': 0,
-                        'wins': 0,
-                        'jackpots': 0
-                    }
-                
-                user_stats[user_id]['tries'] += stat['tries']
-                user_stats[user_id]['wins'] += stat['wins']
-                user_stats[user_id]['jackpots'] += stat['jackpots']
-
-        # Формируем рейтинг
-        for user_id, stats in user_stats.items():
-            if criteria == 'wins':
-                value = stats['wins']
-            elif criteria == 'tries':
-                value = stats['tries']
-            elif criteria == 'jackpots':
-                value = stats['jackpots']
-            elif criteria == 'winrate':
-                value = stats['wins'] / stats['tries'] if stats['tries'] > 0 else 0
-            else:
-                value = 0
-
-            if value > 0:
-                ranking.append(({'id': user_id, 'name': user_names.get(user_id, 'Unknown')}, value))
-
-        return sorted(ranking, key=lambda x: x[1], reverse=True)
+        for user_id, value in self.database.leaderboards.top(chat_id, game, period, criteria, limit):
+            # Имена берутся из кэша профилей
+            user = await self.database.get('users', user_id)
+            ranking.append(({'id': user_id, 'name': user.get('name', 'Unknown') if user else 'Unknown'}, value))
+        return ranking
 
-    def find_user_place(self, user_id: int, ranking: list):
+    def find_user_place(self, user_id: int, chat_id: int, game: str, criteria: str, period: str):
         """Находит место пользователя в рейтинге"""
-        for index, (user, _) in enumerate(ranking, start=1):
-            if user['id'] == user_id:
-                return index
-        return '–'
+        place = self.database.leaderboards.rank(chat_id, game, period, criteria, user_id)
+        return place if place is not None else '–'
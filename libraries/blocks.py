@@ -0,0 +1,71 @@
+import time
+import heapq
+import threading
+
+class BlockRegistry:
+    """Индекс ручных блокировок в памяти процесса.
+
+    Хранит действующие блокировки по ключу (пользователь, чат), а истечение
+    отслеживает min-кучей по block_end (epoch-секунды). Проверка блокировки -
+    поиск в словаре без обращения к базе.
+    """
+
+    def __init__(self):
+        self.blocks = {}
+        self.heap = []
+        self.lock = threading.Lock()
+
+    def load(self, rows):
+        """Заполняет индекс строками (id, chat_id, block_reason, block_start, block_end)"""
+        with self.lock:
+            self.blocks = {}
+            self.heap = []
+            for user_id, chat_id, reason, start, end in rows:
+                self.blocks[(user_id, chat_id)] = (reason, start, end)
+                self.heap.append((end, user_id, chat_id))
+            heapq.heapify(self.heap)
+
+    def add(self, user_id: int, chat_id: int, reason: str, start: int, end: int):
+        with self.lock:
+            self.blocks[(user_id, chat_id)] = (reason, start, end)
+            heapq.heappush(self.heap, (end, user_id, chat_id))
+
+    def remove(self, user_id: int, chat_id: int):
+        # Запись в куче удаляется лениво при истечении
+        with self.lock:
+            self.blocks.pop((user_id, chat_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.blocks = {}
+            self.heap = []
+
+    def expire(self, now: int = None):
+        """Убирает истекшие блокировки с вершины кучи"""
+        if now is None:
+            now = int(time.time())
+
+        # Вершину кучи читаем только под блокировкой: clear() и add() меняют ее из других потоков
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                end, user_id, chat_id = heapq.heappop(self.heap)
+                block = self.blocks.get((user_id, chat_id))
+                # Блокировку могли продлить - удаляем, только если срок совпадает
+                if block is not None and block[2] == end:
+                    del self.blocks[(user_id, chat_id)]
+
+    def get(self, user_id: int, chat_id: int):
+        """Возвращает (причина, начало, конец) действующей блокировки или None"""
+        self.expire()
+        return self.blocks.get((user_id, chat_id))
+
+    def active(self, chat_id: int = None):
+        """Возвращает действующие блокировки, отсортированные по времени окончания"""
+        self.expire()
+        with self.lock:
+            items = [
+                (user_id, block_chat_id, reason, start, end)
+                for (user_id, block_chat_id), (reason, start, end) in self.blocks.items()
+                if chat_id is None or block_chat_id == chat_id
+            ]
+        return sorted(items, key=lambda item: item[4])
@@ -0,0 +1,153 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Разделитель полей в данных кнопки: префикс:поле:поле
+SEPARATOR = ':'
+# Старые кнопки (уже отправленные в чаты) разделяли поля дефисом
+LEGACY_SEPARATOR = '-'
+# Лимит Telegram на callback_data, байты
+MAX_LENGTH = 64
+
+GAMES = ('slots', 'dice', 'foot', 'bowl', 'bask', 'dart')
+PERIODS = ('day', 'week', '24h', '7d')
+CRITERIA = ('wins', 'tries', 'winrate', 'streaks', 'jackpots')
+
+class CallbackData:
+    """Тип данных inline-кнопки: короткий префикс и типизированные поля.
+
+    Поле - (имя, int) или (имя, кортеж допустимых строк). pack собирает строку
+    для callback_data, unpack разбирает поля обратно в словарь с типами.
+    legacy - прежний префикс или строка целиком, чтобы кнопки в старых сообщениях
+    продолжали работать.
+    """
+
+    def __init__(self, prefix: str, *fields, legacy: str = None):
+        if SEPARATOR in prefix or LEGACY_SEPARATOR in prefix:
+            raise ValueError(f"Недопустимый префикс кнопки: {prefix}")
+        self.prefix = prefix
+        self.fields = fields
+        self.legacy = legacy
+
+    def pack(self, *values):
+        if len(values) != len(self.fields):
+            raise ValueError(f"{self.prefix}: ожидается {len(self.fields)} полей, передано {len(values)}")
+        parts = [self.prefix]
+        for (name, kind), value in zip(self.fields, values):
+            value = str(value)
+            if SEPARATOR in value or (kind is not int and value not in kind):
+                raise ValueError(f"{self.prefix}: недопустимое значение {name}={value}")
+            parts.append(value)
+        data = SEPARATOR.join(parts)
+        if len(data.encode()) > MAX_LENGTH:
+            raise ValueError(f"{self.prefix}: callback_data длиннее {MAX_LENGTH} байт")
+        return data
+
+    def unpack(self, parts: list):
+        """Поля из частей строки после префикса; ValueError, если данные не подходят"""
+        if len(parts) != len(self.fields):
+            raise ValueError(f"{self.prefix}: ожидается {len(self.fields)} полей, получено {len(parts)}")
+        values = {}
+        for (name, kind), part in zip(self.fields, parts):
+            if kind is int:
+                values[name] = int(part)
+            elif part in kind:
+                values[name] = part
+            else:
+                raise ValueError(f"{self.prefix}: недопустимое значение {name}={part}")
+        return values
+
+# 🔥 ВСЕ КНОПКИ БОТА: ПРЕФИКСЫ УНИКАЛЬНЫ, ПОЛЯ ТИПИЗИРОВАНЫ
+RATING_MAIN = CallbackData('rm', legacy='rating_main')
+RATING_GAME = CallbackData('rg', ('game', GAMES), legacy='rating_game')
+RATING_PERIOD = CallbackData('rp', ('game', GAMES), ('period', PERIODS), legacy='rating_period')
+RATING_CRITERIA = CallbackData('rc', ('game', GAMES), ('period', PERIODS), ('criteria', CRITERIA), legacy='rating_criteria')
+HELP_REQUEST = CallbackData('help', legacy='help_send_request')
+ADMIN_PANEL = CallbackData('adm', legacy='admin')
+ADMIN_BLOCK = CallbackData('ab', legacy='admin-block-user')
+ADMIN_UNBLOCK = CallbackData('au', legacy='admin-unblock-user')
+ADMIN_RESET_ALL = CallbackData('ar', legacy='admin-reset-all')
+BLOCK_SELECT = CallbackData('bs', ('user_id', int), legacy='block_select_user')
+BLOCK_CONFIRM = CallbackData('bc', ('user_id', int), ('minutes', int), legacy='block_confirm')
+UNBLOCK_USER = CallbackData('ub', ('user_id', int), legacy='unblock_user')
+BACK_TO_MAIN = CallbackData('main', legacy='back-to-main')
+
+class Route:
+    __slots__ = ('data', 'handler')
+
+    def __init__(self, data: CallbackData, handler):
+        self.data = data
+        self.handler = handler
+
+class CallbackRouter:
+    """Один хендлер колбэков вместо цепочки фильтров startswith.
+
+    Маршрут ищется по префиксу в словаре - O(1) при любом числе кнопок, поля
+    разбираются один раз и передаются хендлеру именованными аргументами:
+    handler(callback, **поля). Старые кнопки находятся по legacy: строка целиком
+    для кнопок без полей, префикс до дефиса для кнопок с полями.
+    """
+
+    def __init__(self):
+        self.routes = []
+        self.prefixes = {}
+        self.legacy = {}
+
+    def add(self, data: CallbackData, handler):
+        if data.prefix in self.prefixes:
+            raise ValueError(f"Префикс кнопки уже занят: {data.prefix}")
+        route = Route(data, handler)
+        self.routes.append(route)
+        self.prefixes[data.prefix] = route
+        if data.legacy is not None:
+            self.legacy[data.legacy] = route
+        return route
+
+    def handler(self, data: CallbackData):
+        """Декоратор: @router.handler(RATING_GAME) async def handler(callback, game)"""
+        def decorator(handler):
+            self.add(data, handler)
+            return handler
+        return decorator
+
+    def resolve(self, data: str):
+        """(маршрут, поля) для callback_data или None"""
+        if not data:
+            return None
+        prefix, _, rest = data.partition(SEPARATOR)
+        route = self.prefixes.get(prefix)
+        if route is not None:
+            parts = rest.split(SEPARATOR) if rest else []
+        else:
+            route = self.legacy.get(data)
+            if route is not None and not route.data.fields:
+                parts = []
+            else:
+                prefix, _, rest = data.partition(LEGACY_SEPARATOR)
+                route = self.legacy.get(prefix)
+                if route is None:
+                    return None
+                parts = rest.split(LEGACY_SEPARATOR)
+        try:
+            return route, route.data.unpack(parts)
+        except ValueError as e:
+            logger.warning(f"Некорректные данные кнопки {data!r}: {e}")
+            return None
+
+    def match(self, callback):
+        """Фильтр aiogram: разобранный маршрут уходит в dispatch аргументом callback_route"""
+        resolved = self.resolve(callback.data)
+        return {'callback_route': resolved} if resolved is not None else False
+
+    async def dispatch(self, callback, callback_route):
+        route, values = callback_route
+        return await route.handler(callback, **values)
+
+    def register(self, dp):
+        """Регистрирует роутер в диспетчере; маршруты можно добавлять и после этого"""
+        dp.register_callback_query_handler(self.dispatch, self.match)
+
+    def instrument(self, wrap):
+        """Оборачивает хендлеры маршрутов (замер времени в libraries.metrics)"""
+        for route in self.routes:
+            route.handler = wrap(route.handler)
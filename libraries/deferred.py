@@ -0,0 +1,114 @@
+import time
+import heapq
+import asyncio
+import logging
+
+from libraries.outbox import BLOCK
+
+logger = logging.getLogger(__name__)
+
+class DeferredDeletions:
+    """Отложенное удаление сообщений (предупреждения о блокировке и т.п.).
+
+    Задачи "удалить сообщение X в чате Y в момент T" лежат в min-куче по T и
+    в таблице pending_deletions, поэтому после перезапуска просроченные
+    предупреждения удаляются сразу. Хендлеры не ждут - они только ставят задачу.
+    Когда срок наступил, цикл ждет еще batch_window секунд: сообщения одного чата,
+    срок которых наступил за это время, удаляются одним вызовом deleteMessages
+    через очередь исходящих. Раньше срока сообщение не удаляется.
+    """
+
+    def __init__(self, database, outbox, batch_window: float = 0.5):
+        self.database = database
+        self.outbox = outbox
+        self.batch_window = batch_window
+        self.heap = []
+        self.deleted = 0
+        self.batches = 0
+        self._wakeup = None
+        self._task = None
+        # Запись в pending_deletions и удаления пачек: stop() дожидается их
+        self._tasks = set()
+
+    def spawn(self, coroutine):
+        task = asyncio.get_event_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def schedule(self, chat_id: int, message_id: int, delay: float):
+        """Ставит удаление сообщения через delay секунд"""
+        due = time.time() + delay
+        heapq.heappush(self.heap, (due, chat_id, message_id))
+        self.spawn(self.database.add_pending_deletion(chat_id, message_id, int(due)))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def take_due(self, now: float):
+        """Забирает задачи, срок которых наступил, сгруппированные по чатам"""
+        by_chat = {}
+        while self.heap and self.heap[0][0] <= now:
+            _, chat_id, message_id = heapq.heappop(self.heap)
+            by_chat.setdefault(chat_id, []).append(message_id)
+        return by_chat
+
+    async def delete(self, by_chat: dict):
+        futures = [
+            self.outbox.delete_messages(chat_id, message_ids, priority=BLOCK)
+            for chat_id, message_ids in by_chat.items()
+        ]
+        # Неудачное удаление (сообщение уже удалено) не повторяем - задачу все равно убираем
+        await asyncio.gather(*futures, return_exceptions=True)
+        await self.database.remove_pending_deletions(
+            [(chat_id, message_id) for chat_id, message_ids in by_chat.items() for message_id in message_ids]
+        )
+        self.batches += len(by_chat)
+        self.deleted += sum(len(message_ids) for message_ids in by_chat.values())
+
+    async def run(self):
+        """Фоновый цикл: спит до ближайшего срока и удаляет наступившие пачкой"""
+        while True:
+            timeout = None
+            if self.heap:
+                timeout = max(self.heap[0][0] - time.time(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            if self.heap and self.heap[0][0] <= time.time():
+                # Ждем окно пачки, чтобы захватить сообщения, срок которых наступает следом
+                await asyncio.sleep(self.batch_window)
+                self.spawn(self.delete(self.take_due(time.time())))
+
+    async def start(self):
+        """Загружает сохраненные задачи и запускает цикл в текущем event loop"""
+        if self._task is None:
+            for chat_id, message_id, due in await self.database.get_pending_deletions():
+                heapq.heappush(self.heap, (due, chat_id, message_id))
+            if self.heap:
+                logger.info(f"Загружено отложенных удалений: {len(self.heap)}")
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_event_loop().create_task(self.run())
+
+    async def stop(self, timeout: float = 5.0):
+        """Останавливает цикл и дожидается начатых записей и удалений (не дольше timeout);
+        невыполненные задачи остаются в базе до следующего запуска"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+
+        tasks = list(self._tasks)
+        if tasks:
+            try:
+                await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Отложенные удаления не завершились к остановке: {len(tasks)}")
+
+    def __len__(self):
+        return len(self.heap)
@@ -0,0 +1,275 @@
+import random
+import threading
+from datetime import datetime, timedelta
+
+from libraries.windows import WINDOWS, RollingWindows
+
+# Критерии рейтингов за период (серии считаются отдельно, за все время)
+PERIOD_CRITERIA = ('wins', 'tries', 'jackpots', 'winrate')
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.next = [None] * level
+        self.width = [1] * level
+
+class RankedSet:
+    """Индексируемый skip list: вставка, удаление и поиск места за O(log n),
+    первые k элементов - за O(k)."""
+
+    MAX_LEVEL = 20
+
+    def __init__(self):
+        self.head = _Node(None, self.MAX_LEVEL)
+        self.size = 0
+
+    def _path(self, key):
+        """Для каждого уровня находит последний узел с ключом меньше key"""
+        chain = [None] * self.MAX_LEVEL
+        steps = [0] * self.MAX_LEVEL
+        node = self.head
+        for level in reversed(range(self.MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].key < key:
+                steps[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        return chain, steps
+
+    def add(self, key):
+        chain, steps = self._path(key)
+
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < 0.5:
+            level += 1
+
+        node = _Node(key, level)
+        passed = 0
+        for i in range(level):
+            prev = chain[i]
+            node.next[i] = prev.next[i]
+            prev.next[i] = node
+            node.width[i] = prev.width[i] - passed
+            prev.width[i] = passed + 1
+            passed += steps[i]
+        for i in range(level, self.MAX_LEVEL):
+            chain[i].width[i] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain, _ = self._path(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+
+        for i in range(len(node.next)):
+            prev = chain[i]
+            prev.width[i] += node.width[i] - 1
+            prev.next[i] = node.next[i]
+        for i in range(len(node.next), self.MAX_LEVEL):
+            chain[i].width[i] -= 1
+        self.size -= 1
+
+    def rank(self, key):
+        """Возвращает место ключа (с 1) или None, если его нет"""
+        chain, steps = self._path(key)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            return None
+        return sum(steps) + 1
+
+    def first(self, k: int):
+        result = []
+        node = self.head.next[0]
+        while node is not None and len(result) < k:
+            result.append(node.key)
+            node = node.next[0]
+        return result
+
+    def __len__(self):
+        return self.size
+
+class Leaderboard:
+    """Рейтинг по одному критерию: очки игроков и их порядок по убыванию"""
+
+    def __init__(self):
+        self.scores = {}
+        self.ranked = RankedSet()
+
+    def set(self, user_id: int, score):
+        old = self.scores.pop(user_id, None)
+        if old is not None:
+            self.ranked.remove((-old, user_id))
+        # Игроки с нулевым значением в рейтинг не попадают
+        if score > 0:
+            self.scores[user_id] = score
+            self.ranked.add((-score, user_id))
+
+    def remove(self, user_id: int):
+        self.set(user_id, 0)
+
+    def top(self, k: int):
+        return [(user_id, -score) for score, user_id in self.ranked.first(k)]
+
+    def rank(self, user_id: int):
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.ranked.rank((-score, user_id))
+
+    def __len__(self):
+        return len(self.scores)
+
+class Leaderboards:
+    """Рейтинги чатов, которые обновляются при каждом броске.
+
+    Для каждого (чат, игра, период, критерий) держит Leaderboard текущих суток или недели,
+    для серий - Leaderboard максимальных серий по (чат, игра). Открытие рейтинга - это
+    чтение первых k мест и поиск места игрока, без пересчета по всей статистике.
+
+    Скользящие окна '24h' и '7d' сдвигаются со временем и без бросков, поэтому их
+    рейтинг сортируется при чтении из сумм часовых колец (RollingWindows).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.boards = {}
+        self.streaks = {}
+        self.period_keys = {}
+        # Версии (чат, игра) растут при каждом изменении рейтингов - по ним сбрасывается кэш отрисовки
+        self.versions = {}
+        self.generation = 0
+        self.windows = RollingWindows()
+
+    @staticmethod
+    def current_period_key(period: str):
+        """Ключ текущего периода: дата дня, дата понедельника недели или час для окон"""
+        if period in WINDOWS:
+            return datetime.now().strftime("%Y-%m-%d %H")
+        today = datetime.now().date()
+        if period == 'week':
+            today = today - timedelta(days=today.weekday())
+        return today.strftime("%Y-%m-%d")
+
+    def _rotate(self, period: str, period_key: str):
+        # Период сменился - рейтинги прошлого дня/недели больше не нужны
+        if self.period_keys.get(period) == period_key:
+            return
+        self.period_keys[period] = period_key
+        self.totals = {key: value for key, value in self.totals.items() if key[2] != period or key[3] == period_key}
+        self.boards = {key: value for key, value in self.boards.items() if key[2] != period or key[3] == period_key}
+
+    def _board(self, chat_id: int, game: str, period: str, period_key: str, criterion: str):
+        key = (chat_id, game, period, period_key, criterion)
+        board = self.boards.get(key)
+        if board is None:
+            board = self.boards[key] = Leaderboard()
+        return board
+
+    def add(self, user_id: int, chat_id: int, game: str, period: str, period_key: str,
+            tries: int = 0, wins: int = 0, jackpots: int = 0):
+        """Добавляет приращения к статистике игрока за период и обновляет рейтинги"""
+        with self.lock:
+            self._rotate(period, period_key)
+            totals = self.totals.setdefault((chat_id, game, period, period_key), {})
+            stats = totals.setdefault(user_id, [0, 0, 0])
+            stats[0] += tries
+            stats[1] += wins
+            stats[2] += jackpots
+            self.versions[(chat_id, game)] = self.versions.get((chat_id, game), 0) + 1
+
+            values = {
+                'tries': stats[0],
+                'wins': stats[1],
+                'jackpots': stats[2],
+                'winrate': stats[1] / stats[0] if stats[0] > 0 else 0
+            }
+            for criterion in PERIOD_CRITERIA:
+                self._board(chat_id, game, period, period_key, criterion).set(user_id, values[criterion])
+
+    def record(self, user_id: int, chat_id: int, game: str, tries: int = 0, wins: int = 0, jackpots: int = 0):
+        """Учитывает бросок в рейтингах текущих суток и недели и в скользящих окнах"""
+        for period in ('day', 'week'):
+            self.add(user_id, chat_id, game, period, self.current_period_key(period), tries, wins, jackpots)
+        self.add_window(user_id, chat_id, game, tries, wins, jackpots)
+
+    def add_window(self, user_id: int, chat_id: int, game: str, tries: int = 0, wins: int = 0, jackpots: int = 0,
+                   timestamp: float = None):
+        """Учитывает бросок (по умолчанию - текущий) в скользящих окнах"""
+        with self.lock:
+            self.windows.add(user_id, chat_id, game, tries, wins, jackpots, timestamp)
+            self.versions[(chat_id, game)] = self.versions.get((chat_id, game), 0) + 1
+
+    def set_streak(self, user_id: int, chat_id: int, game: str, max_streak: int):
+        with self.lock:
+            board = self.streaks.get((chat_id, game))
+            if board is None:
+                board = self.streaks[(chat_id, game)] = Leaderboard()
+            if board.scores.get(user_id, 0) != max_streak:
+                board.set(user_id, max_streak)
+                self.versions[(chat_id, game)] = self.versions.get((chat_id, game), 0) + 1
+
+    def version(self, chat_id: int, game: str):
+        """Версия рейтингов (чат, игра): меняется при любом их изменении"""
+        return (self.generation, self.versions.get((chat_id, game), 0))
+
+    def _lookup(self, chat_id: int, game: str, period: str, criterion: str):
+        if criterion == 'streaks':
+            return self.streaks.get((chat_id, game))
+        period_key = self.current_period_key(period)
+        return self.boards.get((chat_id, game, period, period_key, criterion))
+
+    def _window_ranking(self, chat_id: int, game: str, window: str, criterion: str):
+        """Рейтинг скользящего окна: [(id пользователя, значение)] по убыванию"""
+        ranking = []
+        for user_id, (tries, wins, jackpots) in self.windows.values(chat_id, game, window).items():
+            value = {
+                'tries': tries,
+                'wins': wins,
+                'jackpots': jackpots,
+                'winrate': wins / tries if tries > 0 else 0
+            }[criterion]
+            if value > 0:
+                ranking.append((user_id, value))
+        ranking.sort(key=lambda item: (-item[1], item[0]))
+        return ranking
+
+    def top(self, chat_id: int, game: str, period: str, criterion: str, k: int = 10):
+        """Первые k мест: список (id пользователя, значение)"""
+        with self.lock:
+            if period in WINDOWS and criterion != 'streaks':
+                return self._window_ranking(chat_id, game, period, criterion)[:k]
+            board = self._lookup(chat_id, game, period, criterion)
+            return board.top(k) if board else []
+
+    def rank(self, chat_id: int, game: str, period: str, criterion: str, user_id: int):
+        """Место игрока (с 1) или None, если его нет в рейтинге"""
+        with self.lock:
+            if period in WINDOWS and criterion != 'streaks':
+                for place, (ranked_id, _) in enumerate(self._window_ranking(chat_id, game, period, criterion), 1):
+                    if ranked_id == user_id:
+                        return place
+                return None
+            board = self._lookup(chat_id, game, period, criterion)
+            return board.rank(user_id) if board else None
+
+    def remove_streaks(self, chat_id: int, user_id: int = None):
+        """Убирает серии и скользящие окна чата (или одного игрока в чате) после сброса статистики"""
+        with self.lock:
+            self.windows.remove(chat_id, user_id)
+            for key in [key for key in self.streaks if key[0] == chat_id]:
+                if user_id is None:
+                    del self.streaks[key]
+                else:
+                    self.streaks[key].remove(user_id)
+                self.versions[key] = self.versions.get(key, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.totals = {}
+            self.boards = {}
+            self.streaks = {}
+            self.windows.clear()
+            self.generation += 1
@@ -0,0 +1,91 @@
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from libraries.windows import WINDOWS
+from libraries.rolls_log import fold_rolls
+
+logger = logging.getLogger(__name__)
+
+class Maintenance:
+    """Обслуживание базы: архив старых дней, свертка старых бросков в снимок счетчиков,
+    очистка блокировок и обращений, vacuum.
+
+    Каждая задача работает порциями по chunk_size строк (или страниц): одна порция -
+    одна короткая транзакция движка в потоке записи. Между порциями поток записи
+    свободен для бросков, поэтому блокировка записи не держится долго.
+    """
+
+    def __init__(self, users, chunk_size: int = 500, keep_days: int = 35, keep_weeks: int = 8,
+                 keep_help_days: int = 30, keep_roll_hours: int = WINDOWS['7d'], pause: float = 0.05):
+        self.users = users
+        self.storage = users.storage
+        self.chunk_size = chunk_size
+        self.keep_days = keep_days
+        self.keep_weeks = keep_weeks
+        self.keep_help_days = keep_help_days
+        # Лог нужен только скользящим окнам рейтингов - более старые броски живут в снимке
+        self.keep_roll_hours = keep_roll_hours
+        self.pause = pause
+
+    def cutoffs(self):
+        """Границы хранения: (первый день daily_stats, первая неделя weekly_stats)"""
+        today = datetime.now().date()
+        week_start = today - timedelta(days=today.weekday())
+        day_cutoff = (today - timedelta(days=self.keep_days)).strftime("%Y-%m-%d")
+        week_cutoff = (week_start - timedelta(weeks=self.keep_weeks)).strftime("%Y-%m-%d")
+        return day_cutoff, week_cutoff
+
+    def jobs(self):
+        """Задачи обслуживания: (название, функция одной порции)"""
+        day_cutoff, week_cutoff = self.cutoffs()
+        help_cutoff = (datetime.utcnow() - timedelta(days=self.keep_help_days)).strftime("%Y-%m-%d %H:%M:%S")
+        now = int(time.time())
+        roll_cutoff = now - self.keep_roll_hours * 3600
+
+        storage, limit = self.storage, self.chunk_size
+
+        return [
+            ('archived_days', lambda: storage.archive_days(day_cutoff, limit)),
+            ('pruned_weeks', lambda: storage.prune_weeks(week_cutoff, limit)),
+            ('folded_rolls', lambda: fold_rolls(storage, roll_cutoff, day_cutoff, week_cutoff, limit)),
+            ('pruned_rolls', lambda: storage.delete_rolls(roll_cutoff, limit)),
+            ('compacted_snapshot', lambda: storage.compact_snapshot(day_cutoff, week_cutoff, limit)),
+            ('expired_blocks', lambda: storage.delete_expired_blocks(now, limit)),
+            ('pruned_help', lambda: storage.prune_help_messages(help_cutoff, limit)),
+            ('vacuumed_pages', lambda: storage.vacuum(limit)),
+            ('optimize', storage.optimize),
+        ]
+
+    def run(self):
+        """Выполняет обслуживание из стороннего потока, отдавая каждую порцию потоку записи"""
+        stats = {}
+        for name, job in self.jobs():
+            stats[name] = 0
+            while True:
+                count = self.storage.writer.submit(job).result() if self.storage.writer else job()
+                stats[name] += count
+                if count < self.chunk_size:
+                    break
+                time.sleep(self.pause)
+        logger.info(f"Обслуживание базы завершено: {stats}")
+        return stats
+
+    async def run_async(self):
+        """То же, что run, но из event loop"""
+        loop = asyncio.get_running_loop()
+        stats = {}
+        for name, job in self.jobs():
+            stats[name] = 0
+            while True:
+                if self.storage.writer is None:
+                    count = job()
+                else:
+                    count = await loop.run_in_executor(self.storage.writer, job)
+                stats[name] += count
+                if count < self.chunk_size:
+                    break
+                await asyncio.sleep(self.pause)
+        logger.info(f"Обслуживание базы завершено: {stats}")
+        return stats
@@ -0,0 +1,217 @@
+import time
+import bisect
+import logging
+import functools
+
+from aiohttp import web
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from libraries import tracing
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержки, секунды
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def format_labels(names, values, extra: str = ''):
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class Counter:
+    """Счетчик Prometheus с метками: значения по кортежу меток"""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {} if labels else {(): 0}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in list(self.values.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, labels)} {value}')
+        return lines
+
+class Histogram:
+    """Гистограмма Prometheus: наблюдение - один поиск корзины и три сложения"""
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, value: float, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            # [счетчики по корзинам + корзина +Inf, сумма, количество]
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in list(self.values.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket
+                le = f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, labels)} {total}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, labels)} {count}')
+        return lines
+
+class Gauge:
+    """Значение, которое считается в момент выгрузки: func() -> число или {кортеж меток: число}"""
+
+    def __init__(self, name: str, help: str, func, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.labels = labels
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        try:
+            values = self.func()
+        except Exception as e:
+            logger.error(f"Ошибка расчета метрики {self.name}: {e}")
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labels, value in values.items():
+            lines.append(f'{self.name}{format_labels(self.labels, labels)} {value}')
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.register(Histogram(
+    'bot_handler_seconds', 'Время работы хендлера aiogram', ('handler',)))
+HANDLER_ERRORS = REGISTRY.register(Counter(
+    'bot_handler_errors_total', 'Исключения в хендлерах aiogram', ('handler',)))
+MIDDLEWARE_SECONDS = REGISTRY.register(Histogram(
+    'bot_middleware_seconds', 'Время работы мидлваря', ('middleware', 'action')))
+USERS_CALL_SECONDS = REGISTRY.register(Histogram(
+    'bot_users_call_seconds', 'Вызовы методов Users из event loop (с ожиданием пула потоков)', ('method',)))
+SQLITE_COMMITS = REGISTRY.register(Counter(
+    'bot_sqlite_commits_total', 'Коммиты на соединении записи SQLite'))
+SQLITE_WRITE_STATEMENTS = REGISTRY.register(Counter(
+    'bot_sqlite_write_statements_total', 'Запросы на соединении записи SQLite'))
+API_SECONDS = REGISTRY.register(Histogram(
+    'bot_api_request_seconds', 'Задержка вызовов Bot API', ('method',)))
+API_REQUESTS = REGISTRY.register(Counter(
+    'bot_api_requests_total', 'Вызовы Bot API по результату (ok или класс ошибки)', ('method', 'status')))
+
+def instrument_handlers(dp):
+    """Оборачивает зарегистрированные хендлеры сообщений и колбэков замером времени.
+
+    Вызывается после регистрации всех хендлеров. spec хендлера остается прежним,
+    поэтому aiogram передает обертке те же аргументы, что и хендлеру. У роутера
+    колбэков (libraries.callbacks) замеряются хендлеры его маршрутов.
+    """
+    for handlers in (dp.message_handlers, dp.callback_query_handlers):
+        for handler_obj in handlers.handlers:
+            router = getattr(handler_obj.handler, '__self__', None)
+            if hasattr(router, 'instrument'):
+                router.instrument(timed_handler)
+            else:
+                handler_obj.handler = timed_handler(handler_obj.handler)
+
+def timed_handler(handler):
+    name = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            with tracing.span('handler ' + name):
+                return await handler(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
+class TimedMiddleware(BaseMiddleware):
+    """Базовый класс мидлваря, время каждого его шага пишется в bot_middleware_seconds"""
+
+    async def trigger(self, action, args):
+        handler = getattr(self, f'on_{action}', None)
+        if handler is None:
+            return None
+        started = time.perf_counter()
+        try:
+            with tracing.span(f'{type(self).__name__} {action}'):
+                await handler(*args)
+        finally:
+            # CancelHandler (блокировка) тоже учитывается
+            MIDDLEWARE_SECONDS.observe(time.perf_counter() - started, type(self).__name__, action)
+
+def instrument_bot(bot):
+    """Замеряет все вызовы Bot API: все методы aiogram проходят через bot.request"""
+    request = bot.request
+
+    @functools.wraps(request)
+    async def timed_request(method, data=None, files=None, **kwargs):
+        started = time.perf_counter()
+        status = 'ok'
+        try:
+            with tracing.span('telegram ' + method, tracing.CLIENT, **{'rpc.method': method}):
+                return await request(method, data, files, **kwargs)
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - started, method)
+            API_REQUESTS.inc(method, status)
+
+    bot.request = timed_request
+
+def count_commits(database):
+    """Считает запросы и коммиты соединения записи через trace callback.
+
+    Callback вызывается только в потоке записи, поэтому счетчики без блокировки.
+    """
+    def trace(statement: str):
+        SQLITE_WRITE_STATEMENTS.inc()
+        if statement.startswith('COMMIT'):
+            SQLITE_COMMITS.inc()
+
+    database.conn.set_trace_callback(trace)
+
+async def handle_metrics(request: web.Request):
+    return web.Response(body=REGISTRY.render().encode(),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+async def start_server(host: str, port: int):
+    """Запускает HTTP-сервер с /metrics в текущем event loop, возвращает runner для остановки"""
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики: http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,319 @@
+import time
+import json
+import heapq
+import asyncio
+import logging
+import itertools
+
+from aiogram.utils.exceptions import RetryAfter
+
+from libraries import tracing
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета исходящих сообщений: меньше - важнее
+ADMIN = 0
+BLOCK = 1
+CONGRATS = 2
+PRIORITY_NAMES = {ADMIN: 'admin', BLOCK: 'block', CONGRATS: 'congrats'}
+# Удаления не расходуют лимит отправки в чат (20 в минуту в группе), только общий лимит бота
+UNTHROTTLED = frozenset({'delete_message', 'delete_messages'})
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now: float):
+        """Когда появится целый токен (now, если он уже есть)"""
+        self.refill(now)
+        if self.tokens >= 1:
+            return now
+        return now + (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self.refill(now)
+        self.tokens -= 1
+
+class OutboundJob:
+    __slots__ = ('chat_id', 'method', 'kwargs', 'priority', 'not_before', 'delete_after', 'future', 'sequence', 'span')
+
+    def __init__(self, chat_id: int, method: str, kwargs: dict, priority: int, not_before: float, delete_after: float):
+        self.chat_id = chat_id
+        self.method = method
+        self.kwargs = kwargs
+        self.priority = priority
+        self.not_before = not_before
+        self.delete_after = delete_after
+        self.sequence = None
+        # Спан хендлера, поставившего сообщение: вызов Bot API попадет в тот же трейс
+        self.span = tracing.CURRENT.get()
+        self.future = asyncio.get_event_loop().create_future()
+        # Ошибку отправки логируем сами - результат могут и не ждать
+        self.future.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+class Outbox:
+    """Единая очередь исходящих вызовов Bot API с ограничением частоты.
+
+    Хендлеры ставят сообщение в очередь и сразу возвращаются. Фоновая задача
+    отправляет его, когда есть токены в ведре чата и в глобальном ведре, выбирая
+    среди готовых чатов сообщение с наивысшим приоритетом (админские уведомления,
+    затем предупреждения о блокировке, затем поздравления). Удаления ждут только
+    глобального ведра. На 429 чат откладывается на retry_after, а сообщение
+    возвращается в очередь.
+
+    Поздравления не копятся без предела: у чата в очереди не больше congrats_limit
+    поздравлений, а пролежавшие дольше congrats_ttl после срока отправки выбрасываются.
+    Выброшенные считаются в dropped.
+    """
+
+    def __init__(self, bot, global_rate: float = 30, group_rate: float = 20 / 60, group_burst: float = 3,
+                 private_rate: float = 1, private_burst: float = 1, max_in_flight: int = 8,
+                 congrats_limit: int = 10, congrats_ttl: float = 60):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.buckets = {}
+        self.queues = {}
+        self.delayed = []
+        self.blocked_until = {}
+        self.sequence = itertools.count()
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.sent = 0
+        self.retries = 0
+        self.failures = 0
+        self.congrats_limit = congrats_limit
+        self.congrats_ttl = congrats_ttl
+        # Поздравлений чата в очереди и в отправке
+        self.congrats = {}
+        self.dropped = {'full': 0, 'expired': 0}
+        # Сервис отложенного удаления (DeferredDeletions); без него удаление
+        # после delete_after просто ставится в эту очередь с задержкой
+        self.deferred = None
+        self._wakeup = None
+        self._task = None
+        # Идущие отправки: stop() дожидается их, а не бросает на полпути
+        self._deliveries = set()
+
+    def bucket(self, chat_id: int):
+        bucket = self.buckets.get(chat_id)
+        if bucket is None:
+            # Группы (отрицательный id) ограничены сильнее личных чатов
+            if chat_id < 0:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.private_rate, self.private_burst)
+            self.buckets[chat_id] = bucket
+        return bucket
+
+    def submit(self, method: str, kwargs: dict, priority: int = CONGRATS, delay: float = 0,
+               delete_after: float = None):
+        """Ставит вызов метода бота с аргументами kwargs (в них есть chat_id) в очередь,
+        возвращает future с его результатом.
+
+        delay - не отправлять раньше чем через delay секунд,
+        delete_after - удалить отправленное сообщение через столько секунд.
+        """
+        job = OutboundJob(kwargs['chat_id'], method, kwargs, priority, time.monotonic() + delay, delete_after)
+        self.push(job)
+        return job.future
+
+    def send_message(self, chat_id: int, text: str, priority: int = CONGRATS, delay: float = 0,
+                     delete_after: float = None, **kwargs):
+        return self.submit('send_message', dict(kwargs, chat_id=chat_id, text=text), priority, delay, delete_after)
+
+    def delete_message(self, chat_id: int, message_id: int, priority: int = BLOCK, delay: float = 0):
+        return self.submit('delete_message', {'chat_id': chat_id, 'message_id': message_id}, priority, delay)
+
+    def delete_messages(self, chat_id: int, message_ids: list, priority: int = BLOCK):
+        """Удаляет несколько сообщений чата одним вызовом deleteMessages"""
+        if len(message_ids) == 1:
+            return self.delete_message(chat_id, message_ids[0], priority)
+        return self.submit('delete_messages', {'chat_id': chat_id, 'message_ids': json.dumps(message_ids)}, priority)
+
+    async def call(self, job: OutboundJob):
+        method = getattr(self.bot, job.method, None)
+        if method is None:
+            # Метода нет в этой версии aiogram - вызываем Bot API по имени (delete_messages -> deleteMessages)
+            head, *tail = job.method.split('_')
+            return await self.bot.request(head + ''.join(part.title() for part in tail), job.kwargs)
+        return await method(**job.kwargs)
+
+    def droppable(self, job: OutboundJob):
+        """Поздравление, которое можно выбросить (удаления с приоритетом CONGRATS не выбрасываются)"""
+        return job.priority == CONGRATS and job.method not in UNTHROTTLED
+
+    def drop(self, job: OutboundJob, reason: str):
+        self.dropped[reason] += 1
+        job.future.cancel()
+
+    def release_congrats(self, chat_id: int):
+        count = self.congrats.pop(chat_id) - 1
+        if count:
+            self.congrats[chat_id] = count
+
+    def push(self, job: OutboundJob):
+        if type(job.priority) is not int:
+            raise TypeError(f"Приоритет сообщения должен быть int (ADMIN, BLOCK, CONGRATS), получено {job.priority!r}")
+        # Повтор после 429 сохраняет исходный порядок сообщения
+        if job.sequence is None:
+            if self.droppable(job):
+                count = self.congrats.get(job.chat_id, 0)
+                if count >= self.congrats_limit:
+                    self.drop(job, 'full')
+                    return
+                self.congrats[job.chat_id] = count + 1
+                # Поздравление покидает очередь, когда его future завершен: отправлено, ошибка или выброшено
+                job.future.add_done_callback(lambda future, chat_id=job.chat_id: self.release_congrats(chat_id))
+            job.sequence = next(self.sequence)
+        if job.not_before > time.monotonic():
+            heapq.heappush(self.delayed, (job.not_before, job.sequence, job))
+        else:
+            heapq.heappush(self.queues.setdefault(job.chat_id, []), (job.priority, job.sequence, job))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def release_delayed(self, now: float):
+        while self.delayed and self.delayed[0][0] <= now:
+            job = heapq.heappop(self.delayed)[2]
+            heapq.heappush(self.queues.setdefault(job.chat_id, []), (job.priority, job.sequence, job))
+
+    def next_job(self, now: float):
+        """Выбирает готовое к отправке сообщение или возвращает (None, время следующей проверки)"""
+        best = None
+        wake = self.delayed[0][0] if self.delayed else None
+        stale = now - self.congrats_ttl
+        empty = []
+        for chat_id, queue in self.queues.items():
+            # Устаревшие поздравления в начале очереди выбрасываем, не тратя на них токены
+            while queue and self.droppable(queue[0][2]) and queue[0][2].not_before < stale:
+                self.drop(heapq.heappop(queue)[2], 'expired')
+            if not queue:
+                empty.append(chat_id)
+                continue
+            ready = self.blocked_until.get(chat_id, 0)
+            if queue[0][2].method not in UNTHROTTLED:
+                ready = max(ready, self.bucket(chat_id).ready_at(now))
+            if ready > now:
+                wake = ready if wake is None else min(wake, ready)
+            elif best is None or queue[0][:2] < self.queues[best][0][:2]:
+                best = chat_id
+        for chat_id in empty:
+            del self.queues[chat_id]
+
+        if best is None:
+            return None, wake
+
+        ready = self.global_bucket.ready_at(now)
+        if ready > now:
+            return None, ready
+
+        queue = self.queues[best]
+        job = heapq.heappop(queue)[2]
+        if not queue:
+            del self.queues[best]
+        if job.method not in UNTHROTTLED:
+            self.bucket(best).take(now)
+        self.global_bucket.take(now)
+        return job, None
+
+    async def deliver(self, job: OutboundJob):
+        if job.span is not None:
+            tracing.CURRENT.set(job.span)
+        try:
+            result = await self.call(job)
+        except RetryAfter as e:
+            # Telegram просит подождать - откладываем весь чат и повторяем сообщение
+            self.retries += 1
+            self.blocked_until[job.chat_id] = time.monotonic() + e.timeout
+            logger.warning(f"429 для чата {job.chat_id}: повтор через {e.timeout} с")
+            self.push(job)
+            return
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Ошибка отправки {job.method} в чат {job.chat_id}: {e}")
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        finally:
+            self.in_flight.release()
+
+        self.sent += 1
+        if not job.future.done():
+            job.future.set_result(result)
+        if job.delete_after is not None and result is not None:
+            if self.deferred is not None:
+                self.deferred.schedule(job.chat_id, result.message_id, job.delete_after)
+            else:
+                self.delete_message(job.chat_id, result.message_id, priority=job.priority, delay=job.delete_after)
+
+    async def run(self):
+        """Фоновый цикл: отправляет готовые сообщения в пределах лимитов"""
+        loop = asyncio.get_event_loop()
+        while True:
+            now = time.monotonic()
+            self.release_delayed(now)
+            job, wake = self.next_job(now)
+            if job is None:
+                timeout = None if wake is None else max(wake - now, 0)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            await self.in_flight.acquire()
+            task = loop.create_task(self.deliver(job))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    def depth(self):
+        """Глубина очереди: готовые к отправке по классам приоритета и отложенные"""
+        result = {name: 0 for name in PRIORITY_NAMES.values()}
+        for queue in self.queues.values():
+            for priority, _, _ in queue:
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                result[name] = result.get(name, 0) + 1
+        result['delayed'] = len(self.delayed)
+        return result
+
+    def start(self):
+        """Запускает отправку в текущем event loop"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_event_loop().create_task(self.run())
+
+    async def stop(self, timeout: float = 5.0):
+        """Дает очереди и идущим отправкам дойти до конца (не дольше timeout) и останавливает отправку"""
+        deadline = time.monotonic() + timeout
+        while (self.queues or self.delayed) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+
+        # Новых отправок уже не будет - ждем начатые, не успевшие к сроку отменяем
+        tasks = list(self._deliveries)
+        if tasks:
+            try:
+                await asyncio.wait_for(asyncio.gather(*tasks), timeout=max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                logger.warning(f"Отправки не завершились к остановке: {len(tasks)}")
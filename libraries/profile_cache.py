@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+
+class ProfileCache:
+    """Ограниченный LRU-кэш профилей пользователей (id, name, congratulate).
+
+    Заполняется при чтении из таблицы users и обновляется при записи (write-through),
+    поэтому известные игроки не обращаются к базе. Считает попадания и промахи.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self.profiles = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int):
+        """Возвращает копию профиля или None при промахе"""
+        with self.lock:
+            profile = self.profiles.get(user_id)
+            if profile is None:
+                self.misses += 1
+                return None
+            self.profiles.move_to_end(user_id)
+            self.hits += 1
+            return dict(profile)
+
+    def put(self, profile: dict):
+        with self.lock:
+            self.profiles[profile['id']] = dict(profile)
+            self.profiles.move_to_end(profile['id'])
+            while len(self.profiles) > self.capacity:
+                self.profiles.popitem(last=False)
+
+    def update(self, user_id: int, field: str, value):
+        """Обновляет поле профиля, если он есть в кэше"""
+        with self.lock:
+            profile = self.profiles.get(user_id)
+            if profile is not None:
+                profile[field] = value
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self.profiles)
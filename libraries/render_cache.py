@@ -0,0 +1,41 @@
+import threading
+from collections import OrderedDict
+
+class RenderCache:
+    """Кэш отрисованных рейтингов с версионной инвалидацией.
+
+    Запись хранится вместе с версией данных, из которых она построена. Если текущая
+    версия отличается, запись считается устаревшей. Размер ограничен (LRU).
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        """Возвращает закэшированное значение, если оно построено для этой версии"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, value):
+        with self.lock:
+            self.entries[key] = (version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,156 @@
+"""Пересборка счетчиков по снимку и логу бросков.
+
+Таблицы tries, wins, jackpots, daily_stats, weekly_stats, monthly_stats и win_streaks
+выводятся из снимка счетчиков и лога rolls после него. Снимок создается из текущих
+счетчиков при первом открытии базы (в том числе базы, которая велась до лога), а
+обслуживание сворачивает в него броски старше недели и удаляет их из лога. Если счетчики
+разошлись, их можно пересчитать заново: снимок плюс лог, пройденный потоком (порциями),
+записываются одной транзакцией движка хранения.
+
+Запуск из корня репозитория (лучше при остановленном боте):
+    python -m libraries.rolls_log data.db
+"""
+import sys
+import logging
+from datetime import datetime, timedelta
+
+from database.database import Database
+from database.sqlite_engine import SQLiteEngine
+from libraries.streaks import StreakStore
+
+logger = logging.getLogger(__name__)
+
+def add_delta(totals: dict, key, wins: int, jackpots: int):
+    delta = totals.get(key)
+    if delta is None:
+        totals[key] = [1, wins, jackpots]
+    else:
+        delta[0] += 1
+        delta[1] += wins
+        delta[2] += jackpots
+
+def add_totals(totals: dict, key, values):
+    current = totals.get(key)
+    if current is None:
+        totals[key] = list(values)
+    else:
+        for index, value in enumerate(values):
+            current[index] += value
+
+class RollTotals:
+    """Счетчики, статистика периодов и серии, накопленные по броскам.
+
+    Дни старше day_cutoff сразу попадают в месячный архив, недели старше week_cutoff
+    отбрасываются - как после обслуживания.
+    """
+
+    def __init__(self, day_cutoff: str, week_cutoff: str):
+        self.day_cutoff = day_cutoff
+        self.week_cutoff = week_cutoff
+        self.counters, self.last_roll = {}, {}
+        self.daily, self.weekly, self.monthly = {}, {}, {}
+        self.streaks = StreakStore()
+
+    def add_snapshot(self, counters: dict, last_roll: dict, daily: dict, weekly: dict, monthly: dict, streaks: list):
+        """Начальное состояние - снимок движка хранения (форматы replace_aggregates)"""
+        for key, values in counters.items():
+            add_totals(self.counters, key, values)
+        self.last_roll.update(last_roll)
+        for (user_id, chat_id, game_type, date), values in daily.items():
+            if date >= self.day_cutoff:
+                add_totals(self.daily, (user_id, chat_id, game_type, date), values)
+            else:
+                add_totals(self.monthly, (user_id, chat_id, game_type, date[:7]), values)
+        for key, values in weekly.items():
+            if key[3] >= self.week_cutoff:
+                add_totals(self.weekly, key, values)
+        for key, values in monthly.items():
+            add_totals(self.monthly, key, values)
+        self.streaks.load(streaks)
+
+    def add_roll(self, user_id: int, chat_id: int, game_type: str, outcome: str, timestamp: int):
+        wins = 0 if outcome == 'loss' else 1
+        jackpots = 1 if outcome == 'jackpot' else 0
+
+        # Дата и начало недели броска в локальном времени, как при записи
+        day = datetime.fromtimestamp(timestamp).date()
+        date = day.strftime("%Y-%m-%d")
+        week_start = (day - timedelta(days=day.weekday())).strftime("%Y-%m-%d")
+
+        add_delta(self.counters, (user_id, chat_id, game_type), wins, jackpots)
+        self.last_roll[(user_id, chat_id)] = timestamp
+        if date >= self.day_cutoff:
+            add_delta(self.daily, (user_id, chat_id, game_type, date), wins, jackpots)
+        else:
+            add_delta(self.monthly, (user_id, chat_id, game_type, date[:7]), wins, jackpots)
+        if week_start >= self.week_cutoff:
+            add_delta(self.weekly, (user_id, chat_id, game_type, week_start), wins, jackpots)
+        self.streaks.record(user_id, chat_id, game_type, bool(wins), timestamp)
+
+def fold_rolls(storage, before: int, day_cutoff: str, week_cutoff: str, limit: int):
+    """Сворачивает в снимок до limit бросков раньше before, идущих подряд за checkpoint.
+
+    Одна порция обслуживания в потоке записи. Возвращает число свернутых бросков; из лога
+    их потом удаляет storage.delete_rolls.
+    """
+    checkpoint = storage.roll_checkpoint()
+    batch = storage.rolls_after(checkpoint, limit)
+
+    totals = RollTotals(day_cutoff, week_cutoff)
+    totals.streaks.load(storage.snapshot_streaks({(roll[1], roll[2], roll[3]) for roll in batch}))
+    count = 0
+    for roll_id, user_id, chat_id, game_type, outcome, timestamp in batch:
+        # Снимок - это все броски до checkpoint: сворачиваем только начало лога без пропусков
+        if timestamp >= before:
+            break
+        totals.add_roll(user_id, chat_id, game_type, outcome, timestamp)
+        checkpoint = roll_id
+        count += 1
+
+    if count:
+        storage.fold_snapshot(totals.counters, totals.last_roll, totals.daily, totals.weekly, totals.monthly,
+                              totals.streaks.take(), checkpoint)
+    return count
+
+def rebuild_aggregates(users, batch_size: int = 10000):
+    """Пересчитывает все счетчики по снимку и логу бросков, возвращает число бросков лога.
+
+    Выполняется в потоке записи: буфер сбрасывается заранее, чтобы все броски были в логе.
+    """
+    users.buffer.flush()
+    storage = users.storage
+
+    totals = RollTotals(*users.maintenance.cutoffs())
+    checkpoint = storage.roll_checkpoint()
+    totals.add_snapshot(*storage.load_snapshot())
+    count = 0
+    for batch in storage.iter_rolls(batch_size, after=checkpoint):
+        for user_id, chat_id, game_type, outcome, timestamp in batch:
+            totals.add_roll(user_id, chat_id, game_type, outcome, timestamp)
+        count += len(batch)
+
+    streak_rows = totals.streaks.rows()
+    storage.replace_aggregates(totals.counters, totals.last_roll, totals.daily, totals.weekly, totals.monthly, streak_rows)
+
+    # Состояние в памяти должно совпасть с пересобранными таблицами
+    users.streaks.load(streak_rows)
+    users.load_leaderboards()
+    logger.info(f"Счетчики пересобраны по снимку и логу: {count} бросков после снимка")
+    return count
+
+def main():
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+
+    # Users импортирует обслуживание, а обслуживание - этот модуль
+    from libraries.users import Users
+
+    storage = SQLiteEngine(Database(sys.argv[1]))
+    users = Users(storage)
+    count = storage.writer.submit(rebuild_aggregates, users).result()
+    print(f"rebuilt aggregates from snapshot and {count} rolls")
+    storage.close()
+
+if __name__ == '__main__':
+    main()
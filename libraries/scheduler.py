@@ -0,0 +1,163 @@
+import time
+import heapq
+import random
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Периоды, к границам которых привязываются задачи
+PERIODS = ('hour', 'day', 'week', 'month')
+
+def next_boundary(period: str, now: datetime):
+    """Ближайшая граница периода строго после now (локальное время)"""
+    if period == 'hour':
+        return now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'day':
+        return midnight + timedelta(days=1)
+    if period == 'week':
+        return midnight + timedelta(days=7 - now.weekday())
+    if period == 'month':
+        if now.month == 12:
+            return midnight.replace(year=now.year + 1, month=1, day=1)
+        return midnight.replace(month=now.month + 1, day=1)
+    raise ValueError(f"Unknown period: {period}")
+
+class Job:
+    """Задача планировщика и статистика ее запусков"""
+
+    def __init__(self, name: str, func, period: str, jitter: float = 0.0):
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period: {period}")
+        self.name = name
+        self.func = func
+        self.period = period
+        self.jitter = jitter
+        self.task = None
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_duration = 0.0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def next_run(self, now: datetime):
+        """Время следующего запуска: граница периода плюс случайный сдвиг до jitter секунд"""
+        return next_boundary(self.period, now).timestamp() + random.uniform(0, self.jitter)
+
+class Scheduler:
+    """Планировщик задач в event loop.
+
+    Задачи запускаются точно на границах часа, суток, недели или месяца: время
+    следующего запуска каждой задачи лежит в min-куче, и цикл спит ровно до вершины
+    кучи, без периодического опроса. Задача выполняется корутиной; если предыдущий
+    запуск еще идет, новый пропускается. Для каждой задачи считаются длительность
+    и опоздание запуска относительно расписания.
+    """
+
+    # Длинный сон режем на части, чтобы сверяться с часами после перевода времени или сна машины
+    MAX_SLEEP = 3600
+
+    def __init__(self):
+        self.jobs = {}
+        self.heap = []
+        self._wakeup = None
+        self._task = None
+
+    def add(self, name: str, func, period: str, jitter: float = 0.0):
+        """Регистрирует корутинную функцию func на границы периода"""
+        if name in self.jobs:
+            raise ValueError(f"Job already registered: {name}")
+        job = self.jobs[name] = Job(name, func, period, jitter)
+        heapq.heappush(self.heap, (job.next_run(datetime.now()), name))
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def run_job(self, job: Job, scheduled: float):
+        started = time.time()
+        job.last_lag = started - scheduled
+        job.max_lag = max(job.max_lag, job.last_lag)
+        try:
+            await job.func()
+        except Exception as e:
+            job.failures += 1
+            logger.error(f"Ошибка задачи планировщика {job.name}: {e}")
+        finally:
+            job.runs += 1
+            job.last_duration = time.time() - started
+            job.task = None
+            logger.info(
+                f"Задача {job.name}: длительность {job.last_duration:.3f} с, опоздание {job.last_lag:.3f} с"
+            )
+
+    def dispatch(self, name: str, scheduled: float):
+        job = self.jobs.get(name)
+        if job is None:
+            return
+
+        # После долгого простоя (сон машины) пропущенные границы не догоняем
+        heapq.heappush(self.heap, (job.next_run(datetime.fromtimestamp(max(scheduled, time.time()))), name))
+
+        # Защита от наложения: прошлый запуск еще не закончился
+        if job.task is not None:
+            job.skipped += 1
+            logger.warning(f"Задача {job.name} пропущена: предыдущий запуск еще выполняется")
+            return
+        job.task = asyncio.get_event_loop().create_task(self.run_job(job, scheduled))
+
+    async def run(self):
+        """Фоновый цикл: спит до ближайшего запуска и запускает наступившие задачи"""
+        while True:
+            delay = self.MAX_SLEEP
+            if self.heap:
+                delay = min(max(self.heap[0][0] - time.time(), 0), self.MAX_SLEEP)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                scheduled, name = heapq.heappop(self.heap)
+                self.dispatch(name, scheduled)
+
+    def start(self):
+        """Запускает планировщик в текущем event loop"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_event_loop().create_task(self.run())
+
+    async def stop(self):
+        """Останавливает планировщик и дожидается выполняющихся задач"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+
+        running = [job.task for job in self.jobs.values() if job.task is not None]
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+    def stats(self):
+        """Статистика задач: запуски, пропуски, ошибки, длительность и опоздание"""
+        return {
+            name: {
+                'period': job.period,
+                'runs': job.runs,
+                'skipped': job.skipped,
+                'failures': job.failures,
+                'last_duration': job.last_duration,
+                'last_lag': job.last_lag,
+                'max_lag': job.max_lag,
+            }
+            for name, job in self.jobs.items()
+        }
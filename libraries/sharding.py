@@ -0,0 +1,147 @@
+import hmac
+import json
+import asyncio
+import logging
+
+import aiohttp
+from aiohttp import web
+
+from libraries.webhook import SECRET_HEADER
+
+logger = logging.getLogger(__name__)
+
+def shard_for(chat_id: int, shards: int):
+    """Номер шарда чата: один и тот же чат всегда попадает в один процесс"""
+    return chat_id % shards
+
+def raw_chat_id(update: dict):
+    """Чат апдейта из сырого JSON, без разбора в types.Update (как update_chat_id в workers)"""
+    message = update.get('message')
+    if message is not None:
+        return message['chat']['id']
+    callback_query = update.get('callback_query')
+    if callback_query is not None:
+        if callback_query.get('message') is not None:
+            return callback_query['message']['chat']['id']
+        return callback_query['from']['id']
+    return update['update_id']
+
+class ShardRouter:
+    """Фронтовая часть шардирования: раскладывает апдейты по процессам-шардам.
+
+    У каждого шарда своя ограниченная очередь и одна задача доставки, которая
+    отправляет апдейты POST-запросами на /update шарда строго по одному - так
+    сохраняется порядок внутри чата. Пока шард недоступен (запускается или
+    перезапускается), доставка повторяется. Заполненная очередь шарда
+    останавливает прием новых апдейтов, как и очереди воркеров.
+    """
+
+    def __init__(self, urls: list, secret: str, queue_size: int = 1000, retry_delay: float = 0.5):
+        self.urls = urls
+        self.secret = secret
+        self.retry_delay = retry_delay
+        self.queues = [asyncio.Queue(maxsize=queue_size) for _ in urls]
+        self.forwarded = [0] * len(urls)
+        self.retries = [0] * len(urls)
+        self._session = None
+        self._tasks = []
+
+    async def route(self, update: dict):
+        await self.queues[shard_for(raw_chat_id(update), len(self.urls))].put(update)
+
+    async def forward(self, index: int):
+        queue = self.queues[index]
+        url = self.urls[index] + '/update'
+        headers = {SECRET_HEADER: self.secret, 'Content-Type': 'application/json'}
+        while True:
+            update = await queue.get()
+            body = json.dumps(update)
+            while True:
+                try:
+                    async with self._session.post(url, data=body, headers=headers) as response:
+                        if response.status == 200:
+                            break
+                        # 503 - шард останавливается, 400 повторять бессмысленно
+                        if response.status == 400:
+                            logger.error(f"Шард {index} не принял апдейт {update.get('update_id')}")
+                            break
+                except aiohttp.ClientError:
+                    pass
+                self.retries[index] += 1
+                await asyncio.sleep(self.retry_delay)
+            self.forwarded[index] += 1
+            queue.task_done()
+
+    def start(self):
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=len(self.urls)))
+        self._tasks = [asyncio.get_event_loop().create_task(self.forward(index)) for index in range(len(self.urls))]
+
+    async def stop(self, timeout: float = 10):
+        """Дожидается доставки очередей (не дольше timeout) и закрывает соединения"""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Не доставлены апдейты шардам: {[queue.qsize() for queue in self.queues]}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._session.close()
+
+    def stats(self):
+        return [{'depth': queue.qsize(), 'forwarded': forwarded, 'retries': retries}
+                for queue, forwarded, retries in zip(self.queues, self.forwarded, self.retries)]
+
+class ShardCoordinator:
+    """Путь координации между шардами для действий, затрагивающих все чаты.
+
+    Действие регистрируется во всех шардах одинаково (register), а шард, где его
+    выполнил админ, рассылает его остальным (broadcast) POST-запросом на
+    /shard/command. Возвращает число шардов, выполнивших действие успешно,
+    включая текущий.
+    """
+
+    def __init__(self, urls: list, index: int, secret: str, timeout: float = 30):
+        self.urls = urls
+        self.index = index
+        self.secret = secret
+        self.timeout = timeout
+        self.actions = {}
+
+    def register(self, name: str, action):
+        """action - корутина, принимающая аргументы действия как именованные"""
+        self.actions[name] = action
+
+    async def broadcast(self, name: str, **kwargs):
+        """Выполняет действие в остальных шардах (в текущем его выполняет вызывающий)"""
+        body = json.dumps({'action': name, 'kwargs': kwargs})
+        headers = {SECRET_HEADER: self.secret, 'Content-Type': 'application/json'}
+
+        async def send(url: str):
+            try:
+                async with session.post(url + '/shard/command', data=body, headers=headers) as response:
+                    return response.status == 200 and (await response.json()).get('ok', False)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.error(f"Шард {url} не выполнил {name}: {e}")
+                return False
+
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            results = await asyncio.gather(*(send(url) for i, url in enumerate(self.urls) if i != self.index))
+        return sum(results)
+
+    async def handle(self, request: web.Request):
+        token = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(token.encode(), self.secret.encode()):
+            return web.Response(status=401)
+        try:
+            command = await request.json()
+            action = self.actions[command['action']]
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Неизвестная команда шарда: {e}")
+            return web.Response(status=400)
+
+        try:
+            result = await action(**command.get('kwargs', {}))
+        except Exception as e:
+            logger.error(f"Ошибка команды шарда {command['action']}: {e}")
+            return web.json_response({'ok': False})
+        return web.json_response({'ok': result is not False})
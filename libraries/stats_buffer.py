@@ -0,0 +1,172 @@
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+class StatsBuffer:
+    """Буфер отложенной записи счетчиков (write-behind).
+
+    Копит приращения tries/wins/jackpots по ключу (пользователь, чат, игра, день, неделя)
+    и сбрасывает их в базу одной транзакцией по размеру буфера или по таймеру.
+    В ту же транзакцию попадают серии, измененные в памяти (users.streaks), и сами
+    броски для лога rolls - одним executemany на пачку.
+    Если передан executor, фоновый сброс выполняется в нем (в потоке записи).
+
+    Неудачный сброс возвращает данные в буфер. После max_failures неудач подряд буфер
+    записывается по одной строке: строки, которые не записываются и поодиночке, уходят
+    в карантин (quarantined) с записью в лог, остальные сохраняются.
+    """
+
+    def __init__(self, users, max_pending: int = 256, flush_interval: float = 1.0, executor=None,
+                 max_failures: int = 3):
+        self.users = users
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.executor = executor
+        self.max_failures = max_failures
+        self.pending = {}
+        self.rolls = []
+        self.lock = threading.Lock()
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.failures = 0
+        self.quarantined = []
+        self._wakeup = None
+        self._task = None
+
+    def add(self, user_id: int, chat_id: int, game_type: str, tries: int = 0, wins: int = 0, jackpots: int = 0):
+        """Добавляет приращения в буфер без обращения к базе"""
+        now = datetime.now()
+        date = now.strftime("%Y-%m-%d")
+        week_start = (now.date() - timedelta(days=now.weekday())).strftime("%Y-%m-%d")
+
+        key = (user_id, chat_id, game_type, date, week_start)
+        with self.lock:
+            delta = self.pending.get(key)
+            if delta is None:
+                self.pending[key] = [tries, wins, jackpots]
+            else:
+                delta[0] += tries
+                delta[1] += wins
+                delta[2] += jackpots
+
+        # Буфер переполнен - будим фоновую задачу, сами на диск не ходим
+        full = len(self.pending) >= self.max_pending or len(self.rolls) >= self.max_pending
+        if full and self._wakeup is not None:
+            self._wakeup.set()
+
+    def add_roll(self, user_id: int, chat_id: int, game_type: str, value: int, outcome: str):
+        """Добавляет бросок в лог и его приращения в счетчики"""
+        wins = 0 if outcome == 'loss' else 1
+        jackpots = 1 if outcome == 'jackpot' else 0
+        with self.lock:
+            self.rolls.append((user_id, chat_id, game_type, value, outcome, int(time.time())))
+        self.add(user_id, chat_id, game_type, 1, wins, jackpots)
+
+    def take(self):
+        """Забирает накопленные приращения и броски, оставляя буфер пустым"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            rolls, self.rolls = self.rolls, []
+        return [key + tuple(delta) for key, delta in pending.items()], rolls
+
+    def flush(self):
+        """Синхронно записывает накопленные приращения одной транзакцией"""
+        rows, rolls = self.take()
+        streaks = self.users.streaks.take()
+        if not rows and not streaks and not rolls:
+            return 0
+
+        try:
+            self.users.apply_stats(rows, streaks, rolls)
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Ошибка при сбросе буфера статистики ({self.failures} подряд): {e}")
+            if self.failures >= self.max_failures:
+                return self.flush_separately(rows, streaks, rolls)
+            self.requeue(rows, streaks, rolls)
+            return 0
+
+        self.failures = 0
+        self.flushes += 1
+        self.flushed_rows += len(rows)
+        return len(rows)
+
+    def requeue(self, rows: list, streaks: list, rolls: list):
+        """Возвращает строки в буфер, чтобы не потерять статистику"""
+        self.users.streaks.restore(streaks)
+        with self.lock:
+            self.rolls[:0] = rolls
+            for user_id, chat_id, game_type, date, week_start, tries, wins, jackpots in rows:
+                key = (user_id, chat_id, game_type, date, week_start)
+                delta = self.pending.setdefault(key, [0, 0, 0])
+                delta[0] += tries
+                delta[1] += wins
+                delta[2] += jackpots
+
+    def flush_separately(self, rows: list, streaks: list, rolls: list):
+        """Записывает строки по одной и отправляет в карантин те, что не записываются.
+
+        Если не записалась ни одна строка, дело не в данных, а в базе: все возвращается в буфер.
+        """
+        items = [('stats', row, ([row], (), ())) for row in rows]
+        items += [('streak', row, ((), [row], ())) for row in streaks]
+        items += [('roll', row, ((), (), [row])) for row in rolls]
+
+        written, failed = 0, []
+        for kind, row, args in items:
+            try:
+                self.users.apply_stats(*args)
+                written += 1
+            except Exception as e:
+                failed.append((kind, row, e))
+
+        if not written:
+            self.requeue(rows, streaks, rolls)
+            return 0
+
+        self.failures = 0
+        for kind, row, e in failed:
+            logger.error(f"Строка {kind} не записывается и отправлена в карантин: {row}: {e}")
+            self.quarantined.append((kind, row))
+        self.flushes += 1
+        written_rows = len(rows) - sum(1 for kind, _, _ in failed if kind == 'stats')
+        self.flushed_rows += written_rows
+        return written_rows
+
+    async def flush_async(self):
+        """Сбрасывает буфер, не блокируя event loop"""
+        if self.executor is None:
+            return self.flush()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.flush)
+
+    async def run(self):
+        """Фоновый цикл: сбрасывает буфер по таймеру или при переполнении"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush_async()
+
+    def start(self):
+        """Запускает фоновый сброс в текущем event loop"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_event_loop().create_task(self.run())
+
+    async def stop(self):
+        """Останавливает фоновый сброс и гарантированно записывает остаток"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+        await self.flush_async()
@@ -0,0 +1,122 @@
+import time
+import threading
+from datetime import datetime
+
+class Streak:
+    """Состояние серии одного игрока в одной игре чата"""
+
+    __slots__ = ('current', 'max', 'last_win', 'last_day')
+
+    def __init__(self, current: int = 0, max_streak: int = 0, last_win: int = None):
+        self.current = current
+        self.max = max_streak
+        self.last_win = last_win
+        # День последней победы (локальный), чтобы не переводить timestamp при каждом броске
+        self.last_day = datetime.fromtimestamp(last_win).strftime("%Y-%m-%d") if last_win else None
+
+class StreakStore:
+    """Серии побед в памяти процесса.
+
+    Бросок меняет запись (пользователь, чат, игра) без обращения к базе. Смена дня
+    обрабатывается лениво: первая победа нового дня начинает серию с 1. Измененные
+    записи помечаются и сохраняются пачкой вместе с буфером статистики.
+    """
+
+    def __init__(self):
+        self.streaks = {}
+        self.dirty = set()
+        self.lock = threading.Lock()
+
+    def load(self, rows):
+        """Заполняет хранилище строками (id, chat_id, game_type, current_streak, max_streak, last_win_timestamp)"""
+        with self.lock:
+            self.streaks = {}
+            self.dirty = set()
+            for user_id, chat_id, game_type, current, max_streak, last_win in rows:
+                self.streaks[(user_id, chat_id, game_type)] = Streak(current or 0, max_streak or 0, last_win)
+
+    def record(self, user_id: int, chat_id: int, game_type: str, is_win: bool, now: int = None):
+        """Учитывает бросок, возвращает (текущая серия, максимальная серия)"""
+        if now is None:
+            now = int(time.time())
+        key = (user_id, chat_id, game_type)
+
+        with self.lock:
+            streak = self.streaks.get(key)
+            if streak is None:
+                streak = self.streaks[key] = Streak()
+
+            if is_win:
+                today = datetime.fromtimestamp(now).strftime("%Y-%m-%d")
+                streak.current = streak.current + 1 if streak.last_day == today else 1
+                streak.max = max(streak.max, streak.current)
+                streak.last_win = now
+                streak.last_day = today
+            else:
+                streak.current = 0
+                streak.last_win = None
+                streak.last_day = None
+
+            self.dirty.add(key)
+            return streak.current, streak.max
+
+    def get(self, user_id: int, chat_id: int, game_type: str):
+        """Состояние серии (current, max, last_win) или None, если записи нет"""
+        with self.lock:
+            streak = self.streaks.get((user_id, chat_id, game_type))
+            return None if streak is None else (streak.current, streak.max, streak.last_win)
+
+    def put(self, user_id: int, chat_id: int, game_type: str, state):
+        """Возвращает серию к состоянию из get (None - записи не было), например после неудачной записи"""
+        key = (user_id, chat_id, game_type)
+        with self.lock:
+            if state is None:
+                self.streaks.pop(key, None)
+                self.dirty.discard(key)
+            else:
+                self.streaks[key] = Streak(*state)
+
+    def max_streaks(self, user_id: int, chat_id: int, games):
+        """Максимальные серии игрока по играм чата: {игра: серия}, без нулевых"""
+        result = {}
+        with self.lock:
+            for game_type in games:
+                streak = self.streaks.get((user_id, chat_id, game_type))
+                if streak is not None and streak.max > 0:
+                    result[game_type] = streak.max
+        return result
+
+    def take(self):
+        """Забирает измененные записи для сохранения:
+        список (id, chat_id, game_type, current_streak, max_streak, last_win_timestamp)"""
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            return [
+                key + (self.streaks[key].current, self.streaks[key].max, self.streaks[key].last_win)
+                for key in dirty if key in self.streaks
+            ]
+
+    def rows(self):
+        """Все записи в формате take, без снятия пометок"""
+        with self.lock:
+            return [key + (streak.current, streak.max, streak.last_win) for key, streak in self.streaks.items()]
+
+    def restore(self, rows):
+        """Снова помечает записи измененными после неудачного сохранения"""
+        with self.lock:
+            self.dirty.update(row[:3] for row in rows)
+
+    def remove(self, chat_id: int, user_id: int = None):
+        """Убирает серии чата (или одного игрока в чате) после сброса статистики"""
+        with self.lock:
+            for key in [key for key in self.streaks if key[1] == chat_id and (user_id is None or key[0] == user_id)]:
+                del self.streaks[key]
+                self.dirty.discard(key)
+
+    def clear(self):
+        with self.lock:
+            self.streaks = {}
+            self.dirty = set()
+
+    def __len__(self):
+        return len(self.streaks)
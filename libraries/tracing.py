@@ -0,0 +1,282 @@
+import json
+import time
+import random
+import threading
+import functools
+import contextvars
+
+from database.profiler import normalize
+
+# Виды спанов OpenTelemetry
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+
+# Текущий спан задачи (или потока пула, куда контекст передан явно); None - апдейт не трассируется
+CURRENT = contextvars.ContextVar('current_span', default=None)
+
+def update_type(update):
+    """Тип апдейта для выбора доли трассировки: dice, command, message, callback_query, other"""
+    if update.message is not None:
+        if update.message.dice is not None:
+            return 'dice'
+        if update.message.text and update.message.text.startswith('/'):
+            return 'command'
+        return 'message'
+    if update.callback_query is not None:
+        return 'callback_query'
+    return 'other'
+
+def parse_sample_rates(spec: str):
+    """'dice=0.01,command=1,default=0.1' -> {'dice': 0.01, 'command': 1.0, 'default': 0.1}"""
+    rates = {}
+    for part in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = part.partition('=')
+        rates[name.strip()] = float(value)
+    return rates
+
+def attribute_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+class Span:
+    __slots__ = ('trace', 'name', 'kind', 'span_id', 'parent_id', 'start', 'end', 'attributes', 'error')
+
+    def __init__(self, trace, name: str, parent_id: str = None, kind: int = INTERNAL, attributes: dict = None):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = f'{random.getrandbits(64):016x}'
+        self.parent_id = parent_id
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def finish(self):
+        self.end = time.time_ns()
+        self.trace.finish(self)
+
+    def to_json(self):
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end),
+            'attributes': [{'key': key, 'value': attribute_value(value)} for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+class Trace:
+    """Спаны одного апдейта. Выгружаются вместе, когда заканчивается корневой спан;
+    спаны, закончившиеся позже (отправка из очереди исходящих), выгружаются отдельно"""
+
+    __slots__ = ('tracer', 'trace_id', 'spans', 'exported')
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+        self.trace_id = f'{random.getrandbits(128):032x}'
+        self.spans = []
+        self.exported = False
+
+    def finish(self, span: Span):
+        if self.exported:
+            self.tracer.export([span])
+            return
+        self.spans.append(span)
+        if span.parent_id is None:
+            self.exported = True
+            self.tracer.export(self.spans)
+            self.spans = []
+
+class span:
+    """Дочерний спан текущего: with span('name', attr=value) as current.
+
+    Вне трассируемого апдейта ничего не создает и возвращает None, поэтому
+    вызовы можно оставлять в коде при выключенной трассировке.
+    """
+
+    __slots__ = ('name', 'kind', 'attributes', 'span', 'token')
+
+    def __init__(self, name: str, kind: int = INTERNAL, **attributes):
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.span = None
+
+    def __enter__(self):
+        parent = CURRENT.get()
+        if parent is None:
+            return None
+        self.span = Span(parent.trace, self.name, parent.span_id, self.kind, self.attributes)
+        self.token = CURRENT.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is None:
+            return False
+        CURRENT.reset(self.token)
+        if exc_type is not None:
+            if exc_type.__name__ in ('CancelHandler', 'SkipHandler'):
+                # Штатное прерывание обработки в aiogram - не ошибка
+                self.span.attributes['aiogram.cancelled'] = True
+            else:
+                self.span.error = f'{exc_type.__name__}: {exc}'
+        self.span.finish()
+        return False
+
+def run_in_context(func):
+    """Оборачивает функцию для пула потоков так, чтобы она выполнялась в текущем контексте
+    (run_in_executor контекст не переносит, а без него SQL-спаны потеряют родителя)"""
+    if CURRENT.get() is None:
+        return func
+    return functools.partial(contextvars.copy_context().run, func)
+
+class TracedCursor:
+    """Курсор sqlite3, который пишет каждый запрос трассируемого апдейта отдельным спаном"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.span = None
+
+    def __getattr__(self, name: str):
+        return getattr(self.cursor, name)
+
+    def traced(self, method: str, sql: str, *args):
+        parent = CURRENT.get()
+        if parent is None:
+            self.span = None
+            return getattr(self.cursor, method)(sql, *args)
+
+        current = Span(parent.trace, 'sqlite ' + sql.split(None, 1)[0].upper(), parent.span_id, CLIENT,
+                       {'db.system': 'sqlite', 'db.statement': normalize(sql)})
+        try:
+            getattr(self.cursor, method)(sql, *args)
+        except Exception as e:
+            current.error = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            current.finish()
+        self.span = current
+        return self
+
+    def execute(self, sql: str, params=()):
+        return self.traced('execute', sql, params)
+
+    def executemany(self, sql: str, rows):
+        return self.traced('executemany', sql, rows)
+
+    def executescript(self, script: str):
+        return self.traced('executescript', script)
+
+    def fetched(self, rows: int):
+        # Строки SELECT читаются после execute - продлеваем спан, пока апдейт не выгружен
+        if self.span is not None and not self.span.trace.exported:
+            self.span.end = time.time_ns()
+            self.span.attributes['db.rows'] = self.span.attributes.get('db.rows', 0) + rows
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        self.fetched(0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size: int = None):
+        rows = self.cursor.fetchmany(self.cursor.arraysize if size is None else size)
+        self.fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.fetched(len(rows))
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+class Tracer:
+    """Трассировка апдейтов: один трейс на апдейт, спаны в формате OTLP JSON.
+
+    Каждая выгрузка - строка JSON {"resourceSpans": [...]} в файле path (JSON Lines),
+    такой файл читает otelcol (filelog/otlpjson) и его можно отправить в Jaeger/Tempo.
+    sample_rates - доля трассируемых апдейтов по типу (см. update_type), остальные
+    типы берут долю 'default'.
+    """
+
+    def __init__(self, path: str, sample_rates: dict = None, service: str = 'casino-bot'):
+        self.path = path
+        self.sample_rates = dict(sample_rates or {})
+        self.default_rate = self.sample_rates.pop('default', 1.0)
+        self.resource = {'attributes': [{'key': 'service.name', 'value': {'stringValue': service}}]}
+        self.file = open(path, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.traces = 0
+        self.exported = 0
+
+    def sampled(self, kind: str):
+        rate = self.sample_rates.get(kind, self.default_rate)
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def export(self, spans: list):
+        line = json.dumps({'resourceSpans': [{
+            'resource': self.resource,
+            'scopeSpans': [{'scope': {'name': 'casino-bot'}, 'spans': [span.to_json() for span in spans]}],
+        }]}, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.exported += len(spans)
+
+    def instrument(self, dp):
+        """Оборачивает dp.process_update: апдейт, попавший в выборку, получает корневой спан"""
+        process_update = dp.process_update
+
+        @functools.wraps(process_update)
+        async def traced_process_update(update):
+            kind = update_type(update)
+            if not self.sampled(kind):
+                return await process_update(update)
+
+            self.traces += 1
+            chat = update.message.chat if update.message else (
+                update.callback_query.message.chat if update.callback_query and update.callback_query.message else None)
+            user = update.message.from_user if update.message else (
+                update.callback_query.from_user if update.callback_query else None)
+            attributes = {'telegram.update_id': update.update_id, 'telegram.update_type': kind}
+            if chat is not None:
+                attributes['telegram.chat_id'] = chat.id
+            if user is not None:
+                attributes['telegram.user_id'] = user.id
+
+            root = Span(Trace(self), f'update {kind}', None, SERVER, attributes)
+            token = CURRENT.set(root)
+            try:
+                return await process_update(update)
+            except Exception as e:
+                root.error = f'{type(e).__name__}: {e}'
+                raise
+            finally:
+                CURRENT.reset(token)
+                root.finish()
+
+        dp.process_update = traced_process_update
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
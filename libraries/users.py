@@ -1,7 +1,23 @@
 import time
+import asyncio
 import datetime
+import functools
 from datetime import datetime, timedelta
 
+from libraries.stats_buffer import StatsBuffer
+from libraries.blocks import BlockRegistry
+from libraries.profile_cache import ProfileCache
+from libraries.leaderboards import Leaderboards
+from libraries.maintenance import Maintenance
+from libraries.streaks import StreakStore
+from libraries.windows import WINDOWS
+from libraries.metrics import USERS_CALL_SECONDS
+from libraries import tracing
+from database.engine import GAME_COLUMNS
+
+# Исходы броска для record_roll
+ROLL_OUTCOMES = ('loss', 'win', 'jackpot')
+
 class UserError(Exception):
     pass
 
@@ -9,158 +25,90 @@ class UserNotFound(Exception):
     pass
 
 class Users:
-    def __init__(self, database):
-        self.database = database
-        self.cur = self.database.db
-
-        # Создаем таблицы с упрощенной структурой
-        self.cur.executescript('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY,
-                name TEXT, 
-                congratulate BOOL
-            );
-
-            CREATE TABLE IF NOT EXISTS tries (
-                id INTEGER,
-                chat_id INTEGER,
-                slots INTEGER DEFAULT 0,
-                dice INTEGER DEFAULT 0, 
-                dart INTEGER DEFAULT 0,
-                bask INTEGER DEFAULT 0,
-                foot INTEGER DEFAULT 0,
-                bowl INTEGER DEFAULT 0,
-                timestamp INTEGER,
-                PRIMARY KEY (id, chat_id)
-            );
-
-            CREATE TABLE IF NOT EXISTS wins (
-                id INTEGER,
-                chat_id INTEGER,
-                slots INTEGER DEFAULT 0,
-                dice INTEGER DEFAULT 0,
-                dart INTEGER DEFAULT 0,
-                bask INTEGER DEFAULT 0,
-                foot INTEGER DEFAULT 0,
-                bowl INTEGER DEFAULT 0,
-                timestamp INTEGER,
-                PRIMARY KEY (id, chat_id)
-            );
-
-            CREATE TABLE IF NOT EXISTS jackpots (
-                id INTEGER,
-                chat_id INTEGER,
-                slots INTEGER DEFAULT 0,
-                timestamp INTEGER,
-                PRIMARY KEY (id, chat_id)
-            );
-
-            CREATE TABLE IF NOT EXISTS admins (
-                user_id INTEGER PRIMARY KEY
-            );
-
-            CREATE TABLE IF NOT EXISTS daily_stats (
-                id INTEGER,
-                chat_id INTEGER,
-                game_type TEXT,
-                tries INTEGER DEFAULT 0,
-                wins INTEGER DEFAULT 0,
-                jackpots INTEGER DEFAULT 0,
-                date TEXT,
-                PRIMARY KEY (id, chat_id, game_type, date)
-            );
-            
-            CREATE TABLE IF NOT EXISTS weekly_stats (
-                id INTEGER,
-                chat_id INTEGER,
-                game_type TEXT,
-                tries INTEGER DEFAULT 0,
-                wins INTEGER DEFAULT 0,
-                jackpots INTEGER DEFAULT 0,
-                week_start TEXT,
-                PRIMARY KEY (id, chat_id, game_type, week_start)
-            );
-
-            -- НОВАЯ ТАБЛИЦА ДЛЯ СЕРИЙ ПОБЕД
-            CREATE TABLE IF NOT EXISTS win_streaks (
-                id INTEGER,
-                chat_id INTEGER,
-                game_type TEXT,
-                current_streak INTEGER DEFAULT 0,
-                max_streak INTEGER DEFAULT 0,
-                last_win_timestamp INTEGER,
-                PRIMARY KEY (id, chat_id, game_type)
-            );
-
-            -- ТАБЛИЦА ДЛЯ БЛОКИРОВОК ПОЛЬЗОВАТЕЛЕЙ (ТОЛЬКО РУЧНАЯ)
-            CREATE TABLE IF NOT EXISTS user_blocks (
-                id INTEGER,
-                chat_id INTEGER,
-                block_reason TEXT,
-                block_start TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                block_end TIMESTAMP,
-                PRIMARY KEY (id, chat_id)
-            );
-
-            -- ТАБЛИЦА ДЛЯ СООБЩЕНИЙ ПОМОЩИ
-            CREATE TABLE IF NOT EXISTS help_messages (
-                message_id INTEGER PRIMARY KEY,
-                user_id INTEGER,
-                chat_id INTEGER,
-                message_text TEXT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'pending'
-            );
-        ''')
-        self.database.conn.commit()
+    """Пользователи, статистика и рейтинги поверх движка хранения (database.engine).
+
+    Кэши и индексы держатся в памяти, а чтение и запись данных идут через storage -
+    SQLiteEngine или MemoryEngine, выбранный при запуске.
+    """
+
+    def __init__(self, storage, profile_cache_size: int = 10000):
+        self.storage = storage
+
+        # 🔥 СЕРИИ ПОБЕД В ПАМЯТИ, СОХРАНЯЮТСЯ ВМЕСТЕ С БУФЕРОМ
+        self.streaks = StreakStore()
+        self.streaks.load(self.storage.load_streaks())
+
+        # 🔥 БУФЕР ОТЛОЖЕННОЙ ЗАПИСИ СЧЕТЧИКОВ БРОСКОВ
+        self.buffer = StatsBuffer(self, executor=self.storage.writer)
+
+        # 🔥 КЭШ ПРОФИЛЕЙ ПОЛЬЗОВАТЕЛЕЙ
+        self.profiles = ProfileCache(profile_cache_size)
+
+        # 🔥 ИНДЕКС БЛОКИРОВОК В ПАМЯТИ
+        self.blocks = BlockRegistry()
+        self.blocks.load(self.storage.active_blocks(int(time.time())))
+
+        # 🔥 РЕЙТИНГИ В ПАМЯТИ, ОБНОВЛЯЮТСЯ ПРИ КАЖДОМ БРОСКЕ
+        self.leaderboards = Leaderboards()
+        self.load_leaderboards()
+
+        # 🔥 АРХИВАЦИЯ И ОЧИСТКА УСТАРЕВШИХ ДАННЫХ ПОРЦИЯМИ
+        self.maintenance = Maintenance(self)
+
+    def load_leaderboards(self):
+        """Заполняет рейтинги статистикой текущих суток и недели, скользящими окнами
+        по броскам за последнюю неделю и максимальными сериями"""
+        self.leaderboards.clear()
+
+        for period in ('day', 'week'):
+            period_key = self.leaderboards.current_period_key(period)
+            for user_id, chat_id, game_type, tries, wins, jackpots in self.storage.period_rows(period, period_key):
+                self.leaderboards.add(user_id, chat_id, game_type, period, period_key, tries or 0, wins or 0, jackpots or 0)
+
+        # Окна заполняются из лога бросков, по порядку времени
+        for user_id, chat_id, game_type, outcome, timestamp in self.storage.rolls_since(int(time.time()) - WINDOWS['7d'] * 3600):
+            self.leaderboards.add_window(
+                user_id, chat_id, game_type, 1, int(outcome != 'loss'), int(outcome == 'jackpot'), timestamp
+            )
+
+        for user_id, chat_id, game_type, current_streak, max_streak, last_win in self.storage.load_streaks():
+            if max_streak > 0:
+                self.leaderboards.set_streak(user_id, chat_id, game_type, max_streak)
 
     def add(self, id: int, name: str):
         try:
-            self.cur.execute("BEGIN")
-            self.cur.execute("INSERT OR IGNORE INTO users (id, name, congratulate) VALUES (?, ?, ?)", (id, name, True))
-            self.cur.execute("COMMIT")
+            inserted = self.storage.add_user(id, name)
         except Exception as e: 
             raise UserError(e)
 
+        # Существующий профиль не перезаписываем - он подгрузится из базы при чтении
+        if inserted:
+            self.profiles.put({'id': id, 'name': name, 'congratulate': 1})
+
     def add_admin(self, user_id: int):
         try:
-            self.cur.execute("INSERT OR IGNORE INTO admins (user_id) VALUES (?)", (user_id,))
-            self.database.conn.commit()
+            self.storage.add_admin(user_id)
         except Exception as e: 
             raise UserError(e)
 
     def is_admin(self, user_id: int) -> bool:
         try:
-            self.cur.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,))
-            return self.cur.fetchone() is not None
+            return self.storage.is_admin(user_id)
         except Exception as e: 
             raise UserError(e)
 
     def is_user_blocked(self, user_id: int, chat_id: int) -> bool:
         """Проверяет, заблокирован ли пользователь в данном чате (только ручная блокировка)"""
-        try:
-            self.cur.execute('''
-                SELECT 1 FROM user_blocks 
-                WHERE id = ? AND chat_id = ? AND block_end > datetime('now')
-            ''', (user_id, chat_id))
-            return self.cur.fetchone() is not None
-        except Exception as e:
-            print(f"Error checking user block: {e}")
-            return False
+        return self.blocks.get(user_id, chat_id) is not None
 
     def block_user(self, user_id: int, chat_id: int, reason: str, duration_minutes: int = 15):
         """Блокирует пользователя на указанное время (только ручная блокировка админом)"""
         try:
-            block_start = datetime.now()
-            block_end = block_start + timedelta(minutes=duration_minutes)
-            
-            self.cur.execute('''
-                INSERT OR REPLACE INTO user_blocks 
-                (id, chat_id, block_reason, block_start, block_end)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, chat_id, reason, block_start, block_end))
-            
-            self.database.conn.commit()
+            block_start = int(time.time())
+            block_end = block_start + duration_minutes * 60
+
+            self.storage.put_block(user_id, chat_id, reason, block_start, block_end)
+            self.blocks.add(user_id, chat_id, reason, block_start, block_end)
             return True
         except Exception as e:
             print(f"Error blocking user: {e}")
@@ -169,85 +117,41 @@ class Users:
     def unblock_user(self, user_id: int, chat_id: int):
         """Снимает блокировку с пользователя"""
         try:
-            self.cur.execute('''
-                DELETE FROM user_blocks 
-                WHERE id = ? AND chat_id = ?
-            ''', (user_id, chat_id))
-            
-            self.database.conn.commit()
+            self.storage.delete_block(user_id, chat_id)
+            self.blocks.remove(user_id, chat_id)
             return True
         except Exception as e:
             print(f"Error unblocking user: {e}")
             return False
 
     def get_block_info(self, user_id: int, chat_id: int):
-        """Получает информацию о блокировке пользователя"""
-        try:
-            self.cur.execute('''
-                SELECT block_reason, block_start, block_end 
-                FROM user_blocks 
-                WHERE id = ? AND chat_id = ? AND block_end > datetime('now')
-            ''', (user_id, chat_id))
-            result = self.cur.fetchone()
-            
-            if result:
-                return {
-                    'reason': result[0],
-                    'start': result[1],
-                    'end': result[2]
-                }
-            return None
-        except Exception as e:
-            print(f"Error getting block info: {e}")
-            return None
+        """Получает информацию о блокировке пользователя (start и end - epoch-секунды)"""
+        block = self.blocks.get(user_id, chat_id)
+        if block:
+            return {
+                'reason': block[0],
+                'start': block[1],
+                'end': block[2]
+            }
+        return None
 
     def get_all_blocked_users(self, chat_id: int = None):
         """Получает список всех заблокированных пользователей"""
-        try:
-            query = '''
-                SELECT id, chat_id, block_reason, block_start, block_end 
-                FROM user_blocks 
-                WHERE block_end > datetime('now')
-            '''
-            params = []
-            
-            if chat_id:
-                query += ' AND chat_id = ?'
-                params.append(chat_id)
-            
-            query += ' ORDER BY block_end ASC'
-            
-            self.cur.execute(query, params)
-            
-            results = []
-            for row in self.cur.fetchall():
-                results.append({
-                    'user_id': row[0],
-                    'chat_id': row[1],
-                    'reason': row[2],
-                    'start': row[3],
-                    'end': row[4]
-                })
-            return results
-        except Exception as e:
-            print(f"Error getting blocked users: {e}")
-            return []
+        results = []
+        for user_id, block_chat_id, reason, start, end in self.blocks.active(chat_id):
+            results.append({
+                'user_id': user_id,
+                'chat_id': block_chat_id,
+                'reason': reason,
+                'start': start,
+                'end': end
+            })
+        return results
 
     def add_help_message(self, user_id: int, chat_id: int, message_text: str):
         """Добавляет сообщение помощи от пользователя"""
         try:
-            self.cur.execute('''
-                INSERT INTO help_messages (user_id, chat_id, message_text)
-                VALUES (?, ?, ?)
-            ''', (user_id, chat_id, message_text))
-            
-            self.database.conn.commit()
-            
-            # Получаем ID последнего сообщения
-            self.cur.execute('SELECT last_insert_rowid()')
-            message_id = self.cur.fetchone()[0]
-            
-            return message_id
+            return self.storage.add_help_message(user_id, chat_id, message_text)
         except Exception as e:
             print(f"Error adding help message: {e}")
             return None
@@ -255,15 +159,8 @@ class Users:
     def get_pending_help_messages(self):
         """Получает все ожидающие сообщения помощи"""
         try:
-            self.cur.execute('''
-                SELECT message_id, user_id, chat_id, message_text, timestamp 
-                FROM help_messages 
-                WHERE status = 'pending'
-                ORDER BY timestamp ASC
-            ''')
-            
             results = []
-            for row in self.cur.fetchall():
+            for row in self.storage.pending_help_messages():
                 results.append({
                     'message_id': row[0],
                     'user_id': row[1],
@@ -279,134 +176,80 @@ class Users:
     def update_help_message_status(self, message_id: int, status: str):
         """Обновляет статус сообщения помощи"""
         try:
-            self.cur.execute('''
-                UPDATE help_messages 
-                SET status = ? 
-                WHERE message_id = ?
-            ''', (status, message_id))
-            
-            self.database.conn.commit()
+            self.storage.set_help_status(message_id, status)
             return True
         except Exception as e:
             print(f"Error updating help message status: {e}")
             return False
 
+    def add_pending_deletion(self, chat_id: int, message_id: int, due: int):
+        """Сохраняет задачу отложенного удаления сообщения"""
+        try:
+            self.storage.add_pending_deletion(chat_id, message_id, due)
+            return True
+        except Exception as e:
+            print(f"Error adding pending deletion: {e}")
+            return False
+
+    def get_pending_deletions(self):
+        """Получает все задачи отложенного удаления: (chat_id, message_id, due)"""
+        try:
+            return self.storage.pending_deletions()
+        except Exception as e:
+            print(f"Error getting pending deletions: {e}")
+            return []
+
+    def remove_pending_deletions(self, messages: list):
+        """Удаляет выполненные задачи одной транзакцией, messages - список (chat_id, message_id)"""
+        try:
+            self.storage.remove_pending_deletions(messages)
+            return True
+        except Exception as e:
+            print(f"Error removing pending deletions: {e}")
+            return False
+
     def reset_user(self, id: int, chat_id: int):
         try:
-            self.cur.execute("BEGIN")
-            self.cur.execute("DELETE FROM tries WHERE id = ? AND chat_id = ?", (id, chat_id))
-            self.cur.execute("DELETE FROM wins WHERE id = ? AND chat_id = ?", (id, chat_id))
-            self.cur.execute("DELETE FROM jackpots WHERE id = ? AND chat_id = ?", (id, chat_id))
-            self.cur.execute("DELETE FROM win_streaks WHERE id = ? AND chat_id = ?", (id, chat_id))
-            self.cur.execute("COMMIT")
+            self.buffer.flush()
+            self.storage.reset_user(id, chat_id)
+            self.streaks.remove(chat_id, id)
+            self.leaderboards.remove_streaks(chat_id, id)
         except Exception as e: 
             raise UserError(e)
 
     def reset_chat(self, chat_id: int):
         try:
-            self.cur.execute("BEGIN")
-            self.cur.execute("DELETE FROM tries WHERE chat_id = ?", (chat_id,))
-            self.cur.execute("DELETE FROM wins WHERE chat_id = ?", (chat_id,))
-            self.cur.execute("DELETE FROM jackpots WHERE chat_id = ?", (chat_id,))
-            self.cur.execute("DELETE FROM win_streaks WHERE chat_id = ?", (chat_id,))
-            self.cur.execute("COMMIT")
+            self.buffer.flush()
+            self.storage.reset_chat(chat_id)
+            self.streaks.remove(chat_id)
+            self.leaderboards.remove_streaks(chat_id)
         except Exception as e: 
             raise UserError(e)
 
     def reset_all_stats(self):
         """Сбрасывает всю статистику"""
         try:
-            self.cur.execute("BEGIN")
-            self.cur.execute("DELETE FROM tries")
-            self.cur.execute("DELETE FROM wins")
-            self.cur.execute("DELETE FROM jackpots")
-            self.cur.execute("DELETE FROM daily_stats")
-            self.cur.execute("DELETE FROM weekly_stats")
-            self.cur.execute("DELETE FROM win_streaks")
-            self.cur.execute("DELETE FROM user_blocks")  # Оставляем блокировки
-            self.cur.execute("COMMIT")
-            self.database.conn.commit()
+            self.buffer.flush()
+            self.storage.reset_all()
+            self.blocks.clear()
+            self.streaks.clear()
+            self.leaderboards.clear()
             return True
         except Exception as e:
             print(f"Error resetting all stats: {e}")
             return False
 
     def update_win_streak(self, user_id: int, chat_id: int, game_type: str, is_win: bool):
-        """Обновляет серию побед для пользователя с проверкой смены дня"""
-        try:
-            # Проверяем, не сменился ли день для обнуления daily серий
-            current_date = self.get_current_date()
-            
-            # Получаем дату последнего обновления серии
-            self.cur.execute(
-                "SELECT last_win_timestamp FROM win_streaks WHERE id = ? AND chat_id = ? AND game_type = ?",
-                (user_id, chat_id, game_type)
-            )
-            result = self.cur.fetchone()
-            
-            # Если последнее обновление было не сегодня - сбрасываем current_streak
-            if result and result[0]:
-                last_update_date = datetime.fromtimestamp(result[0]).strftime("%Y-%m-%d")
-                if last_update_date != current_date:
-                    # Сменился день - сбрасываем текущую серию
-                    self.cur.execute(
-                        "UPDATE win_streaks SET current_streak = 0 WHERE id = ? AND chat_id = ? AND game_type = ?",
-                        (user_id, chat_id, game_type)
-                    )
-            
-            # Продолжаем обычную логику обновления серии
-            self.cur.execute(
-                "SELECT current_streak, max_streak FROM win_streaks WHERE id = ? AND chat_id = ? AND game_type = ?",
-                (user_id, chat_id, game_type)
-            )
-            result = self.cur.fetchone()
-            
-            current_streak = 0
-            max_streak = 0
-            
-            if result:
-                current_streak, max_streak = result
-            
-            if is_win:
-                current_streak += 1
-                if current_streak > max_streak:
-                    max_streak = current_streak
-            else:
-                current_streak = 0
-            
-            self.cur.execute('''
-                INSERT OR REPLACE INTO win_streaks 
-                (id, chat_id, game_type, current_streak, max_streak, last_win_timestamp) 
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, chat_id, game_type, current_streak, max_streak, int(time.time()) if is_win else None))
-            
-            self.database.conn.commit()
-            return current_streak, max_streak
-            
-        except Exception as e:
-            print(f"Error updating win streak: {e}")
-            return 0, 0
+        """Обновляет серию побед в памяти с проверкой смены дня, в базу она попадет со сбросом буфера"""
+        current_streak, max_streak = self.streaks.record(user_id, chat_id, game_type, is_win)
+        self.leaderboards.set_streak(user_id, chat_id, game_type, max_streak)
+        return current_streak, max_streak
 
     def get_win_streaks(self, chat_id: int, game_type: str = None):
         """Получает максимальные серии побед"""
         try:
-            if game_type:
-                self.cur.execute('''
-                    SELECT id, game_type, max_streak 
-                    FROM win_streaks 
-                    WHERE chat_id = ? AND game_type = ? AND max_streak > 0
-                    ORDER BY max_streak DESC
-                ''', (chat_id, game_type))
-            else:
-                self.cur.execute('''
-                    SELECT id, game_type, max_streak 
-                    FROM win_streaks 
-                    WHERE chat_id = ? AND max_streak > 0
-                    ORDER BY max_streak DESC
-                ''', (chat_id,))
-            
             results = []
-            for row in self.cur.fetchall():
+            for row in self.storage.win_streaks(chat_id, game_type):
                 results.append({
                     'id': row[0],
                     'game_type': row[1],
@@ -417,6 +260,10 @@ class Users:
             print(f"Error getting win streaks: {e}")
             return []
 
+    def get_user_streaks(self, user_id: int, chat_id: int):
+        """Получает максимальные серии пользователя по всем играм чата из памяти"""
+        return self.streaks.max_streaks(user_id, chat_id, GAME_COLUMNS)
+
     def get_current_date(self):
         """Возвращает текущую дату в формате YYYY-MM-DD"""
         return datetime.now().strftime("%Y-%m-%d")
@@ -431,51 +278,76 @@ class Users:
     def increment_period_stats(self, user_id: int, chat_id: int, game_type: str, tries: int = 0, wins: int = 0, jackpots: int = 0):
         """Увеличивает статистику для текущих дня и недели"""
         try:
-            current_date = self.get_current_date()
-            week_start = self.get_current_week_start()
-            
-            # Обновляем дневную статистику
-            self.cur.execute('''
-                INSERT INTO daily_stats (id, chat_id, game_type, tries, wins, jackpots, date)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(id, chat_id, game_type, date) 
-                DO UPDATE SET 
-                    tries = daily_stats.tries + excluded.tries,
-                    wins = daily_stats.wins + excluded.wins,
-                    jackpots = daily_stats.jackpots + excluded.jackpots
-            ''', (user_id, chat_id, game_type, tries, wins, jackpots, current_date))
-            
-            # Обновляем недельную статистику
-            self.cur.execute('''
-                INSERT INTO weekly_stats (id, chat_id, game_type, tries, wins, jackpots, week_start)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                ON CONFLICT(id, chat_id, game_type, week_start) 
-                DO UPDATE SET 
-                    tries = weekly_stats.tries + excluded.tries,
-                    wins = weekly_stats.wins + excluded.wins,
-                    jackpots = weekly_stats.jackpots + excluded.jackpots
-            ''', (user_id, chat_id, game_type, tries, wins, jackpots, week_start))
-            
-            self.database.conn.commit()
+            # Обновляем дневную и недельную статистику
+            self.storage.add_period_stats([(
+                user_id, chat_id, game_type, self.get_current_date(), self.get_current_week_start(),
+                tries, wins, jackpots
+            )])
+            self.leaderboards.record(user_id, chat_id, game_type, tries, wins, jackpots)
             return True
         except Exception as e:
             print(f"Error updating period stats: {e}")
             return False
 
+    def record_roll(self, user_id: int, chat_id: int, game_type: str, value: int, outcome: str):
+        """Записывает бросок одной транзакцией: счетчики, статистику периодов и серию.
+
+        value - выпавшее значение, outcome - 'loss', 'win' или 'jackpot'
+        (джекпот учитывается и как выигрыш). Возвращает (текущая серия, максимальная серия).
+        """
+        if game_type not in GAME_COLUMNS:
+            raise UserError(f"Unknown game type: {game_type}")
+        if outcome not in ROLL_OUTCOMES:
+            raise UserError(f"Unknown roll outcome: {outcome}")
+
+        wins = 0 if outcome == 'loss' else 1
+        jackpots = 1 if outcome == 'jackpot' else 0
+        timestamp = int(time.time())
+        previous = self.streaks.get(user_id, chat_id, game_type)
+        current_streak, max_streak = self.streaks.record(user_id, chat_id, game_type, bool(wins), timestamp)
+        last_win = timestamp if wins else None
+
+        try:
+            self.storage.apply_stats(
+                [(user_id, chat_id, game_type, self.get_current_date(), self.get_current_week_start(), 1, wins, jackpots)],
+                [(user_id, chat_id, game_type, current_streak, max_streak, last_win)],
+                [(user_id, chat_id, game_type, value, outcome, timestamp)],
+                timestamp
+            )
+        except Exception as e:
+            # Бросок не записан - серия в памяти не должна его учитывать
+            self.streaks.put(user_id, chat_id, game_type, previous)
+            raise UserError(e)
+
+        self.leaderboards.record(user_id, chat_id, game_type, 1, wins, jackpots)
+        self.leaderboards.set_streak(user_id, chat_id, game_type, max_streak)
+        return current_streak, max_streak
+
+    def apply_stats(self, rows: list, streaks: list = (), rolls: list = ()):
+        """Применяет накопленные приращения счетчиков, измененные серии и новые броски
+        одной транзакцией.
+
+        rows - список (id, chat_id, game_type, date, week_start, tries, wins, jackpots),
+        streaks - список (id, chat_id, game_type, current_streak, max_streak, last_win_timestamp),
+        rolls - список (user_id, chat_id, game_type, value, outcome, timestamp) для лога бросков
+        """
+        for row in rows:
+            if row[2] not in GAME_COLUMNS:
+                raise UserError(f"Unknown game type: {row[2]}")
+
+        try:
+            self.storage.apply_stats(rows, streaks, rolls, int(time.time()))
+        except Exception as e:
+            raise UserError(e)
+
     def get_daily_stats(self, chat_id: int, date: str = None):
         """Получает дневную статистику"""
         if date is None:
             date = self.get_current_date()
         
         try:
-            self.cur.execute('''
-                SELECT id, game_type, tries, wins, jackpots 
-                FROM daily_stats 
-                WHERE chat_id = ? AND date = ?
-            ''', (chat_id, date))
-            
             results = []
-            for row in self.cur.fetchall():
+            for row in self.storage.period_stats('day', chat_id, date):
                 results.append({
                     'id': row[0],
                     'game_type': row[1],
@@ -494,14 +366,8 @@ class Users:
             week_start = self.get_current_week_start()
         
         try:
-            self.cur.execute('''
-                SELECT id, game_type, tries, wins, jackpots 
-                FROM weekly_stats 
-                WHERE chat_id = ? AND week_start = ?
-            ''', (chat_id, week_start))
-            
             results = []
-            for row in self.cur.fetchall():
+            for row in self.storage.period_stats('week', chat_id, week_start):
                 results.append({
                     'id': row[0],
                     'game_type': row[1],
@@ -515,145 +381,55 @@ class Users:
             return []
 
     def get(self, table: str, id: int, chat_id: int = None):
+        # 🔥 ПРОФИЛИ ПОЛЬЗОВАТЕЛЕЙ ОТДАЕМ ИЗ КЭША
+        if table == 'users' and chat_id is None:
+            profile = self.profiles.get(id)
+            if profile is not None:
+                return profile
+        return self.fetch(table, id, chat_id)
+
+    def fetch(self, table: str, id: int, chat_id: int = None):
+        """Читает строку из базы в обход кэша и кладет профиль в кэш"""
         try:
-            if chat_id is not None:
-                self.cur.execute(f"SELECT * FROM {table} WHERE id = ? AND chat_id = ?", (id, chat_id))
-            else:
-                self.cur.execute(f"SELECT * FROM {table} WHERE id = ?", (id,))
-            
-            columns = [description[0] for description in self.cur.description]
-            result = self.cur.fetchone()
-            if result:
-                data = dict(zip(columns, result))
+            data = self.storage.get_row(table, id, chat_id)
+            if data:
                 # Заменяем None на 0 для числовых полей
                 for key in list(data.keys()):
                     if key not in ['id', 'chat_id', 'name', 'congratulate', 'timestamp'] and data[key] is None:
                         data[key] = 0
+                if table == 'users':
+                    self.profiles.put(data)
                 return data
             return None
         except Exception as e: 
-            # Если таблица не существует, возвращаем None
-            if "no such table" in str(e):
-                return None
             raise UserError(e)
 
     def set(self, table: str, id: int, chat_id: int, parameter: str, value):
         try:
             if table == 'users':
-                self.cur.execute(
-                    f"UPDATE {table} SET {parameter} = ? WHERE id = ?",
-                    (value, id)
-                )
+                self.storage.set_user_field(id, parameter, value)
+                # Движки хранят BOOL как 0/1 - кэш должен отдавать то же самое
+                self.profiles.update(id, parameter, int(value) if isinstance(value, bool) else value)
             else:
-                self.cur.execute(
-                    f"INSERT OR REPLACE INTO {table} (id, chat_id, {parameter}, timestamp) VALUES (?, ?, ?, ?)",
-                    (id, chat_id, value, int(time.time()))
-                )
-            self.database.conn.commit()
+                self.storage.set_counter(table, id, chat_id, parameter, value, int(time.time()))
         except Exception as e: 
             raise UserError(e)
 
     def increment(self, table: str, id: int, chat_id: int, parameter: str):
+        # Один UPSERT вместо чтения строки и перезаписи всех колонок
+        columns = ('slots',) if table == 'jackpots' else GAME_COLUMNS
+        if table not in ('tries', 'wins', 'jackpots') or parameter not in columns:
+            raise UserError(f"Cannot increment {table}.{parameter}")
+
         try:
-            # Сначала получаем текущую запись целиком
-            self.cur.execute(
-                f"SELECT * FROM {table} WHERE id = ? AND chat_id = ?",
-                (id, chat_id)
-            )
-            result = self.cur.fetchone()
-            
-            if result:
-                # Если запись существует, обновляем только нужное поле
-                columns = [description[0] for description in self.cur.description]
-                current_data = dict(zip(columns, result))
-                
-                # Увеличиваем только нужный параметр, остальные сохраняем
-                current_value = current_data.get(parameter, 0) or 0
-                updated_value = current_value + 1
-                current_data[parameter] = updated_value
-                current_data['timestamp'] = int(time.time())
-                
-                # Создаем запрос INSERT OR REPLACE со всеми полями
-                if table == 'tries':
-                    self.cur.execute(
-                        "INSERT OR REPLACE INTO tries (id, chat_id, slots, dice, dart, bask, foot, bowl, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                        (id, chat_id, 
-                         current_data.get('slots', 0), 
-                         current_data.get('dice', 0),
-                         current_data.get('dart', 0),
-                         current_data.get('bask', 0),
-                         current_data.get('foot', 0),
-                         current_data.get('bowl', 0),
-                         current_data['timestamp'])
-                    )
-                elif table == 'wins':
-                    self.cur.execute(
-                        "INSERT OR REPLACE INTO wins (id, chat_id, slots, dice, dart, bask, foot, bowl, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                        (id, chat_id,
-                         current_data.get('slots', 0),
-                         current_data.get('dice', 0),
-                         current_data.get('dart', 0),
-                         current_data.get('bask', 0),
-                         current_data.get('foot', 0),
-                         current_data.get('bowl', 0),
-                         current_data['timestamp'])
-                    )
-                elif table == 'jackpots':
-                    self.cur.execute(
-                        "INSERT OR REPLACE INTO jackpots (id, chat_id, slots, timestamp) VALUES (?, ?, ?, ?)",
-                        (id, chat_id, current_data.get('slots', 0), current_data['timestamp'])
-                    )
-            else:
-                # Если записи нет, создаем новую запись со всеми полями
-                if table == 'tries':
-                    base_values = {'slots': 0, 'dice': 0, 'dart': 0, 'bask': 0, 'foot': 0, 'bowl': 0}
-                    base_values[parameter] = 1
-                    self.cur.execute(
-                        "INSERT INTO tries (id, chat_id, slots, dice, dart, bask, foot, bowl, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                        (id, chat_id,
-                         base_values['slots'],
-                         base_values['dice'],
-                         base_values['dart'],
-                         base_values['bask'],
-                         base_values['foot'],
-                         base_values['bowl'],
-                         int(time.time()))
-                    )
-                elif table == 'wins':
-                    base_values = {'slots': 0, 'dice': 0, 'dart': 0, 'bask': 0, 'foot': 0, 'bowl': 0}
-                    base_values[parameter] = 1
-                    self.cur.execute(
-                        "INSERT INTO wins (id, chat_id, slots, dice, dart, bask, foot, bowl, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                        (id, chat_id,
-                         base_values['slots'],
-                         base_values['dice'],
-                         base_values['dart'],
-                         base_values['bask'],
-                         base_values['foot'],
-                         base_values['bowl'],
-                         int(time.time()))
-                    )
-                elif table == 'jackpots':
-                    self.cur.execute(
-                        "INSERT INTO jackpots (id, chat_id, slots, timestamp) VALUES (?, ?, ?, ?)",
-                        (id, chat_id, 1 if parameter == 'slots' else 0, int(time.time()))
-                    )
-            
-            self.database.conn.commit()
+            self.storage.increment_counter(table, parameter, id, chat_id, 1, int(time.time()))
         except Exception as e: 
             raise UserError(e)
 
     def get_all(self, table: str, chat_id: int = None):
         try:
-            if chat_id is not None:
-                self.cur.execute(f"SELECT * FROM {table} WHERE chat_id = ?", (chat_id,))
-            else:
-                self.cur.execute(f"SELECT * FROM {table}")
-            
-            columns = [description[0] for description in self.cur.description]
             results = []
-            for row in self.cur.fetchall():
-                data = dict(zip(columns, row))
+            for data in self.storage.get_rows(table, chat_id):
                 # Заменяем None на 0 для числовых полей
                 for key in list(data.keys()):
                     if key not in ['id', 'chat_id', 'name', 'congratulate', 'timestamp'] and data[key] is None:
@@ -661,27 +437,137 @@ class Users:
                 results.append(data)
             return results
         except Exception as e: 
-            if "no such table" in str(e):
-                return []
             raise UserError(e)
 
     def get_time_filtered(self, table: str, chat_id: int, time_filter: str):
-        """time_filter: 'day' или 'week'"""
+        """Счетчики tries/wins/jackpots чата за последние 24 часа или 7 дней по логу бросков.
+
+        time_filter: 'day' или 'week'. Строки в формате таблицы table: id, chat_id,
+        колонки игр и timestamp последнего броска.
+        """
+        outcomes = {
+            'tries': ('loss', 'win', 'jackpot'),
+            'wins': ('win', 'jackpot'),
+            'jackpots': ('jackpot',),
+        }
+        if table not in outcomes:
+            raise UserError(f"Unknown counter table: {table}")
+        columns = ('slots',) if table == 'jackpots' else GAME_COLUMNS
+
         try:
             time_threshold = int(time.time()) - (86400 if time_filter == 'day' else 604800)
-            
-            self.cur.execute(f"SELECT * FROM {table} WHERE chat_id = ? AND timestamp >= ?", (chat_id, time_threshold))
-            columns = [description[0] for description in self.cur.description]
-            results = []
-            for row in self.cur.fetchall():
-                data = dict(zip(columns, row))
-                # Заменяем None на 0 для числовых полей
-                for key in list(data.keys()):
-                    if key not in ['id', 'chat_id', 'name', 'congratulate', 'timestamp'] and data[key] is None:
-                        data[key] = 0
-                results.append(data)
-            return results
+            results = {}
+            for user_id, game_type, count, last in self.storage.roll_counts(chat_id, time_threshold, outcomes[table]):
+                if game_type not in columns:
+                    continue
+                data = results.get(user_id)
+                if data is None:
+                    data = results[user_id] = dict({'id': user_id, 'chat_id': chat_id}, **{column: 0 for column in columns})
+                    data['timestamp'] = last
+                data[game_type] = count
+                data['timestamp'] = max(data['timestamp'], last)
+            return list(results.values())
         except Exception as e: 
-            if "no such table" in str(e):
-                return []
             raise UserError(e)
+
+
+class AsyncUsers:
+    """Асинхронный репозиторий поверх Users.
+
+    Каждый метод Users доступен как корутина. Чтения выполняются в пуле read-only
+    соединений, записи - в единственном потоке записи, так что ни одна корутина
+    не блокирует event loop на вводе-выводе SQLite. У движка без пулов
+    (MemoryEngine) методы выполняются прямо в event loop.
+    """
+
+    READ_METHODS = {
+        'is_admin', 'get_pending_help_messages', 'get_win_streaks',
+        'get_daily_stats', 'get_weekly_stats',
+        'fetch', 'get_all', 'get_time_filtered', 'get_pending_deletions',
+    }
+
+    # Обслуживаются из памяти прямо в event loop, без пула потоков
+    MEMORY_METHODS = {
+        'is_user_blocked', 'get_block_info', 'get_all_blocked_users',
+        'get_user_streaks', 'update_win_streak',
+    }
+
+    WRITE_METHODS = {
+        'add', 'add_admin', 'block_user', 'unblock_user', 'add_help_message',
+        'update_help_message_status', 'add_pending_deletion', 'remove_pending_deletions',
+        'reset_user', 'reset_chat', 'reset_all_stats',
+        'increment_period_stats', 'apply_stats', 'set', 'increment',
+    }
+
+    def __init__(self, users: Users):
+        self.users = users
+        self.storage = users.storage
+        self.buffer = users.buffer
+        self.leaderboards = users.leaderboards
+        self.maintenance = users.maintenance
+
+    def __getattr__(self, name: str):
+        if name in self.READ_METHODS:
+            executor = self.storage.readers
+        elif name in self.WRITE_METHODS:
+            executor = self.storage.writer
+        elif name in self.MEMORY_METHODS:
+            executor = None
+        else:
+            raise AttributeError(name)
+
+        method = getattr(self.users, name)
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with tracing.span('Users.' + name):
+                    return await self.run(executor, method, *args, **kwargs)
+            finally:
+                USERS_CALL_SECONDS.observe(time.perf_counter() - started, name)
+
+        # Кэшируем обертку, чтобы __getattr__ вызывался один раз на метод
+        setattr(self, name, call)
+        return call
+
+    async def run(self, executor, method, *args, **kwargs):
+        """Выполняет метод в пуле потоков (или сразу, если executor не задан)"""
+        if executor is None:
+            return method(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, tracing.run_in_context(functools.partial(method, *args, **kwargs)))
+
+    async def get(self, table: str, id: int, chat_id: int = None):
+        """Профили из кэша отдаются сразу, остальное читается в пуле чтения"""
+        started = time.perf_counter()
+        try:
+            if table == 'users' and chat_id is None:
+                profile = self.users.profiles.get(id)
+                if profile is not None:
+                    return profile
+            with tracing.span('Users.get'):
+                return await self.run(self.storage.readers, self.users.fetch, table, id, chat_id)
+        finally:
+            USERS_CALL_SECONDS.observe(time.perf_counter() - started, 'get')
+
+    async def record_roll(self, user_id: int, chat_id: int, game_type: str, value: int, outcome: str):
+        """Записывает бросок без ввода-вывода: счетчики уходят в буфер отложенной записи,
+        серия обновляется в памяти.
+
+        Возвращает (текущая серия, максимальная серия).
+        """
+        # Проверяем сразу: в буфере строка с неизвестной игрой сорвала бы весь сброс
+        if game_type not in GAME_COLUMNS:
+            raise UserError(f"Unknown game type: {game_type}")
+        if outcome not in ROLL_OUTCOMES:
+            raise UserError(f"Unknown roll outcome: {outcome}")
+
+        started = time.perf_counter()
+        wins = 0 if outcome == 'loss' else 1
+        jackpots = 1 if outcome == 'jackpot' else 0
+        self.buffer.add_roll(user_id, chat_id, game_type, value, outcome)
+        self.leaderboards.record(user_id, chat_id, game_type, 1, wins, jackpots)
+        result = self.users.update_win_streak(user_id, chat_id, game_type, bool(wins))
+        USERS_CALL_SECONDS.observe(time.perf_counter() - started, 'record_roll')
+        return result
@@ -0,0 +1,66 @@
+import hmac
+import logging
+
+from aiohttp import web
+from aiogram import types
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class WebhookReceiver:
+    """Прием апдейтов по вебхуку.
+
+    Проверяет секретный токен из заголовка X-Telegram-Bot-Api-Secret-Token,
+    ставит апдейт в пул воркеров и сразу отвечает 200 - обработка идет в воркерах.
+    Ответ задерживается, только если очередь чата заполнена: так Telegram
+    притормаживает доставку, как и getUpdates в режиме polling.
+    """
+
+    def __init__(self, workers, secret_token: str, path: str = '/webhook'):
+        self.workers = workers
+        self.secret_token = secret_token
+        self.path = path
+        self.accepting = True
+        self.received = 0
+        self.rejected = 0
+
+    async def handle(self, request: web.Request):
+        token = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            self.rejected += 1
+            logger.warning(f"Вебхук: неверный секретный токен от {request.remote}")
+            return web.Response(status=401)
+
+        if not self.accepting:
+            # Идет остановка - пусть Telegram доставит апдейт позже
+            return web.Response(status=503)
+
+        try:
+            update = types.Update(**await request.json())
+        except (ValueError, TypeError) as e:
+            logger.error(f"Вебхук: не удалось разобрать апдейт: {e}")
+            return web.Response(status=400)
+
+        self.received += 1
+        await self.workers.put(update)
+        return web.Response(status=200)
+
+    def make_app(self, on_startup=None, on_shutdown=None):
+        """Приложение aiohttp с приемником; on_startup/on_shutdown - корутины без аргументов"""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+
+        async def startup(app):
+            if on_startup is not None:
+                await on_startup()
+
+        async def shutdown(app):
+            # Новые апдейты больше не принимаем, принятые дорабатывает on_shutdown
+            self.accepting = False
+            if on_shutdown is not None:
+                await on_shutdown()
+
+        app.on_startup.append(startup)
+        app.on_shutdown.append(shutdown)
+        return app
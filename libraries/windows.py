@@ -0,0 +1,116 @@
+import time
+
+# Скользящие окна рейтингов: название -> длина в часах
+WINDOWS = {'24h': 24, '7d': 168}
+
+class HourRing:
+    """Кольцо часовых корзин tries/wins/jackpots одного игрока в одной игре чата.
+
+    SIZE корзин покрывают неделю. Суммы по окнам 24 часа и 7 дней поддерживаются
+    при каждом броске: корзина, которая выходит из окна, вычитается из его суммы,
+    поэтому бросок и чтение окна - O(1) (сдвиг на k часов - O(k), не больше SIZE).
+    """
+
+    SIZE = 168
+
+    __slots__ = ('tries', 'wins', 'jackpots', 'last_hour', 'day', 'week')
+
+    def __init__(self):
+        self.tries = [0] * self.SIZE
+        self.wins = [0] * self.SIZE
+        self.jackpots = [0] * self.SIZE
+        self.last_hour = None
+        # Суммы окон: [tries, wins, jackpots]
+        self.day = [0, 0, 0]
+        self.week = [0, 0, 0]
+
+    def advance(self, hour: int):
+        """Сдвигает кольцо к часу hour, вычитая корзины, вышедшие из окон"""
+        if self.last_hour is None or hour - self.last_hour >= self.SIZE:
+            self.tries = [0] * self.SIZE
+            self.wins = [0] * self.SIZE
+            self.jackpots = [0] * self.SIZE
+            self.day = [0, 0, 0]
+            self.week = [0, 0, 0]
+            self.last_hour = hour
+            return
+        if hour <= self.last_hour:
+            return
+
+        for h in range(self.last_hour + 1, hour + 1):
+            # Корзина часа h - 24 выходит из суточного окна
+            old = (h - 24) % self.SIZE
+            self.day[0] -= self.tries[old]
+            self.day[1] -= self.wins[old]
+            self.day[2] -= self.jackpots[old]
+
+            # Корзина часа h - 168 выходит из недельного окна и освобождается под час h
+            slot = h % self.SIZE
+            self.week[0] -= self.tries[slot]
+            self.week[1] -= self.wins[slot]
+            self.week[2] -= self.jackpots[slot]
+            self.tries[slot] = self.wins[slot] = self.jackpots[slot] = 0
+        self.last_hour = hour
+
+    def add(self, hour: int, tries: int, wins: int, jackpots: int):
+        self.advance(hour)
+        # Бросок с часом в прошлом (перевод часов) учитываем в текущей корзине
+        slot = self.last_hour % self.SIZE
+        self.tries[slot] += tries
+        self.wins[slot] += wins
+        self.jackpots[slot] += jackpots
+        for sums in (self.day, self.week):
+            sums[0] += tries
+            sums[1] += wins
+            sums[2] += jackpots
+
+    def window(self, hour: int, hours: int):
+        """Суммы (tries, wins, jackpots) за последние hours часов (24 или 168)"""
+        self.advance(hour)
+        return tuple(self.day if hours == 24 else self.week)
+
+class RollingWindows:
+    """Скользящие окна 24 часа и 7 дней для всех игроков по (чат, игра).
+
+    Не потокобезопасен сам по себе - вызывается под блокировкой Leaderboards.
+    """
+
+    def __init__(self):
+        self.rings = {}
+
+    @staticmethod
+    def current_hour(timestamp: float = None):
+        return int((time.time() if timestamp is None else timestamp) // 3600)
+
+    def add(self, user_id: int, chat_id: int, game: str, tries: int = 0, wins: int = 0, jackpots: int = 0,
+            timestamp: float = None):
+        rings = self.rings.setdefault((chat_id, game), {})
+        ring = rings.get(user_id)
+        if ring is None:
+            ring = rings[user_id] = HourRing()
+        ring.add(self.current_hour(timestamp), tries, wins, jackpots)
+
+    def values(self, chat_id: int, game: str, window: str):
+        """Суммы окна по игрокам: {id пользователя: (tries, wins, jackpots)}, без пустых"""
+        hour = self.current_hour()
+        hours = WINDOWS[window]
+        result = {}
+        rings = self.rings.get((chat_id, game), {})
+        for user_id, ring in list(rings.items()):
+            sums = ring.window(hour, hours)
+            if sums[0] or sums[1] or sums[2]:
+                result[user_id] = sums
+            elif not any(ring.week):
+                # За неделю бросков не было - кольцо больше не нужно
+                del rings[user_id]
+        return result
+
+    def remove(self, chat_id: int, user_id: int = None):
+        for key in [key for key in self.rings if key[0] == chat_id]:
+            if user_id is None:
+                del self.rings[key]
+            else:
+                self.rings[key].pop(user_id, None)
+
+    def clear(self):
+        self.rings = {}
@@ -0,0 +1,180 @@
+import time
+import asyncio
+import logging
+
+import aiohttp
+from aiohttp.helpers import sentinel
+from aiogram import Bot, Dispatcher
+
+logger = logging.getLogger(__name__)
+
+def update_chat_id(update):
+    """Чат, к которому относится апдейт (для колбэков - чат сообщения с кнопкой)"""
+    if update.message is not None:
+        return update.message.chat.id
+    if update.callback_query is not None:
+        if update.callback_query.message is not None:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    # Прочие типы апдейтов не привязаны к чату - раскладываем по номеру
+    return update.update_id
+
+class WorkerQueue:
+    """Очередь одного воркера и ее метрики"""
+
+    def __init__(self, size: int):
+        self.queue = asyncio.Queue(maxsize=size)
+        self.processed = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.blocked = 0
+        # Ожидание в очереди и время обработки: сумма и максимум, секунды
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.handle_total = 0.0
+        self.handle_max = 0.0
+
+    def stats(self):
+        processed = self.processed or 1
+        return {
+            'depth': self.queue.qsize(),
+            'max_depth': self.max_depth,
+            'processed': self.processed,
+            'errors': self.errors,
+            'blocked': self.blocked,
+            'avg_wait': self.wait_total / processed,
+            'max_wait': self.wait_max,
+            'avg_handle': self.handle_total / processed,
+            'max_handle': self.handle_max,
+        }
+
+class UpdateWorkers:
+    """Пул воркеров обработки апдейтов.
+
+    Апдейт попадает в очередь воркера по id чата, поэтому апдейты одного чата
+    обрабатываются строго по порядку (два броска подряд не гоняются за одну серию),
+    а разные чаты - параллельно. Очереди ограничены: put ждет, пока в очереди
+    воркера не освободится место, и этим притормаживает получение апдейтов.
+    """
+
+    def __init__(self, workers: int = 8, queue_size: int = 100):
+        self.queues = [WorkerQueue(queue_size) for _ in range(workers)]
+        self.dispatcher = None
+        self._tasks = []
+
+    def queue_for(self, update):
+        return self.queues[update_chat_id(update) % len(self.queues)]
+
+    async def put(self, update):
+        """Ставит апдейт в очередь его чата, при заполненной очереди ждет места"""
+        worker = self.queue_for(update)
+        if worker.queue.full():
+            worker.blocked += 1
+        await worker.queue.put((update, time.monotonic()))
+        worker.max_depth = max(worker.max_depth, worker.queue.qsize())
+
+    async def run(self, worker: WorkerQueue):
+        Dispatcher.set_current(self.dispatcher)
+        Bot.set_current(self.dispatcher.bot)
+        while True:
+            update, enqueued = await worker.queue.get()
+            started = time.monotonic()
+            try:
+                await self.dispatcher.process_update(update)
+            except Exception as e:
+                worker.errors += 1
+                logger.error(f"Ошибка обработки апдейта {update.update_id}: {e}")
+            finally:
+                finished = time.monotonic()
+                worker.processed += 1
+                worker.wait_total += started - enqueued
+                worker.wait_max = max(worker.wait_max, started - enqueued)
+                worker.handle_total += finished - started
+                worker.handle_max = max(worker.handle_max, finished - started)
+                worker.queue.task_done()
+
+    def start(self, dispatcher: Dispatcher):
+        """Запускает воркеры в текущем event loop"""
+        if not self._tasks:
+            self.dispatcher = dispatcher
+            loop = asyncio.get_event_loop()
+            self._tasks = [loop.create_task(self.run(worker)) for worker in self.queues]
+
+    async def stop(self, timeout: float = 10.0):
+        """Дает воркерам разобрать очереди (не дольше timeout) и останавливает их"""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(worker.queue.join() for worker in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не обработано апдейтов при остановке: {self.depth()}")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def depth(self):
+        return sum(worker.queue.qsize() for worker in self.queues)
+
+    def stats(self):
+        """Метрики по очередям: глубина, обработано, ожидание в очереди и время обработки"""
+        return [worker.stats() for worker in self.queues]
+
+class PooledDispatcher(Dispatcher):
+    """Dispatcher, который отдает апдейты из long polling в пул воркеров.
+
+    Следующий getUpdates выполняется только после того, как все апдейты пачки
+    поставлены в очереди, поэтому при перегрузке апдейты ждут на стороне Telegram,
+    а не копятся в памяти задачами.
+    """
+
+    def __init__(self, *args, workers: UpdateWorkers = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.workers = workers
+
+    async def start_polling(self, timeout=20, relax=0.1, limit=None, reset_webhook=None, fast: bool = True,
+                            error_sleep: int = 5, allowed_updates=None):
+        if self.workers is None:
+            return await super().start_polling(timeout, relax, limit, reset_webhook, fast, error_sleep,
+                                               allowed_updates)
+        if self._polling:
+            raise RuntimeError('Polling already started')
+
+        logger.info('Start polling with worker pool.')
+        Dispatcher.set_current(self)
+        Bot.set_current(self.bot)
+
+        if reset_webhook is None:
+            await self.reset_webhook(check=False)
+        if reset_webhook:
+            await self.reset_webhook(check=True)
+
+        self._polling = True
+        offset = None
+        # Таймаут запроса должен быть больше таймаута long polling, как в исходном start_polling
+        request_timeout = None
+        if self.bot.timeout is not sentinel and timeout is not None:
+            request_timeout = aiohttp.ClientTimeout(total=self.bot.timeout.total + timeout or 1)
+        try:
+            while self._polling:
+                try:
+                    with self.bot.request_timeout(request_timeout):
+                        updates = await self.bot.get_updates(
+                            limit=limit, offset=offset, timeout=timeout, allowed_updates=allowed_updates
+                        )
+                except asyncio.CancelledError:
+                    break
+                except Exception as e:
+                    logger.error(f"Ошибка получения апдейтов: {e}")
+                    await asyncio.sleep(error_sleep)
+                    continue
+
+                for update in updates:
+                    await self.workers.put(update)
+                if updates:
+                    offset = updates[-1].update_id + 1
+
+                if relax:
+                    await asyncio.sleep(relax)
+        finally:
+            self._close_waiter.set_result(None)
+            logger.warning('Polling is stopped.')
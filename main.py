@@ -1,8 +1,5 @@
-import json, os, time, logging
+import json, os, time, logging, html
 from datetime import datetime, timedelta
-import asyncio
-import schedule
-import threading
 
 # Настраиваем логирование
 logging.basicConfig(
@@ -12,10 +9,12 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 from aiogram import Bot, Dispatcher, types
-from aiogram.dispatcher.middlewares import BaseMiddleware
 from aiogram.dispatcher.handler import CancelHandler
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils import executor
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
+from aiohttp import web
+from urllib.parse import urlparse
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.types import ContentType
 from aiogram.dispatcher import FSMContext
@@ -23,8 +22,24 @@ from aiogram.dispatcher.filters.state import State, StatesGroup
 
 from handlers.messages import MessagesHandler
 from handlers.rating import RatingHandler
-from libraries.users import Users
+from libraries.render_cache import RenderCache
+from libraries.users import Users, AsyncUsers
+from libraries.scheduler import Scheduler
+from libraries.outbox import Outbox, ADMIN, BLOCK
+from libraries.deferred import DeferredDeletions
+from libraries.workers import UpdateWorkers, PooledDispatcher
+from libraries.webhook import WebhookReceiver
+from libraries.sharding import ShardCoordinator
+from libraries.callbacks import (
+    CallbackRouter, RATING_MAIN, HELP_REQUEST, ADMIN_PANEL, ADMIN_BLOCK, ADMIN_UNBLOCK, ADMIN_RESET_ALL,
+    BLOCK_SELECT, BLOCK_CONFIRM, UNBLOCK_USER, BACK_TO_MAIN
+)
+from libraries import metrics
+from libraries.tracing import Tracer, parse_sample_rates
 from database.database import Database
+from database.profiler import QueryProfiler
+from database.sqlite_engine import SQLiteEngine
+from database.memory_engine import MemoryEngine
 
 # 🔒 БЕЗОПАСНОЕ ПОЛУЧЕНИЕ ТОКЕНА
 BOT_TOKEN = os.environ.get('BOT_TOKEN')
@@ -33,12 +48,119 @@ if not BOT_TOKEN:
 
 print("✅ Bot token loaded successfully from environment variables")
 
-BOT = Bot(token=BOT_TOKEN, parse_mode='HTML')
+# 🔥 АДРЕС BOT API: СВОЙ СЕРВЕР ИЛИ ЛОКАЛЬНАЯ ЗАГЛУШКА ДЛЯ ТЕСТОВ (ПО УМОЛЧАНИЮ api.telegram.org)
+BOT_API_URL = os.environ.get('BOT_API_URL')
+
+# 🔥 РЕЖИМ ВЕБХУКА: ЕСЛИ ЗАДАН WEBHOOK_URL, АПДЕЙТЫ ПРИХОДЯТ POST-ЗАПРОСАМИ ВМЕСТО LONG POLLING
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET')
+WEBHOOK_HOST = os.environ.get('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', 8080))
+if WEBHOOK_URL and not WEBHOOK_SECRET:
+    raise ValueError("❌ WEBHOOK_SECRET is required in webhook mode!")
+
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+# 🔥 МЕТРИКИ PROMETHEUS: ЕСЛИ ЗАДАН METRICS_PORT, ОТДАЮТСЯ НА /metrics
+METRICS_PORT = os.environ.get('METRICS_PORT')
+METRICS_HOST = os.environ.get('METRICS_HOST', '0.0.0.0')
+
+# 🔥 ШАРДИРОВАНИЕ: ПРОЦЕСС-ШАРД ЗАПУСКАЕТ shards.py, ЗАДАВАЯ SHARD_INDEX И ОСТАЛЬНОЕ
+# Шард получает апдейты своих чатов от фронта на /update и работает со своей базой DATABASE_FILE
+SHARD_INDEX = int(os.environ['SHARD_INDEX']) if os.environ.get('SHARD_INDEX') else None
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', 1))
+SHARD_PORT = int(os.environ.get('SHARD_PORT', 8100))
+SHARD_SECRET = os.environ.get('SHARD_SECRET')
+SHARD_URLS = [url for url in os.environ.get('SHARD_URLS', '').split(',') if url]
+DATABASE_FILE = os.environ.get('DATABASE_FILE', 'data.db')
+
+# 🔥 ДВИЖОК ХРАНЕНИЯ: sqlite (ПО УМОЛЧАНИЮ) ИЛИ memory - ВСЕ В ПАМЯТИ ПРОЦЕССА, БЕЗ ФАЙЛОВ
+STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'sqlite')
+if STORAGE_ENGINE not in ('sqlite', 'memory'):
+    raise ValueError(f"❌ Unknown STORAGE_ENGINE: {STORAGE_ENGINE}")
+
+# 🔥 ТРАССИРОВКА АПДЕЙТОВ: ЕСЛИ ЗАДАН TRACE_FILE, СПАНЫ ПИШУТСЯ ТУДА В OTLP JSON
+# Доля трассируемых апдейтов по типу: TRACE_SAMPLE=dice=0.01,command=1,callback_query=1,default=0.1
+TRACE_FILE = os.environ.get('TRACE_FILE')
+TRACE_SAMPLE = os.environ.get('TRACE_SAMPLE', 'default=0.1')
+
+BOT = Bot(
+    token=BOT_TOKEN, parse_mode='HTML',
+    server=TelegramAPIServer.from_base(BOT_API_URL) if BOT_API_URL else TELEGRAM_PRODUCTION
+)
+metrics.instrument_bot(BOT)
 STORAGE = MemoryStorage()
-DP = Dispatcher(BOT, storage=STORAGE)
-
-DATABASE = Database('data.db')
-USERS = Users(DATABASE)
+# 🔥 ПУЛ ВОРКЕРОВ: ПОРЯДОК ВНУТРИ ЧАТА, ПАРАЛЛЕЛЬНО МЕЖДУ ЧАТАМИ
+WORKERS = UpdateWorkers(
+    workers=int(os.environ.get('UPDATE_WORKERS', 8)),
+    queue_size=int(os.environ.get('UPDATE_QUEUE_SIZE', 100))
+)
+DP = PooledDispatcher(BOT, storage=STORAGE, workers=WORKERS)
+# 🔥 ВСЕ КОЛБЭКИ ИДУТ ЧЕРЕЗ ОДИН РОУТЕР: ПОИСК ХЕНДЛЕРА ПО ПРЕФИКСУ ЗА O(1)
+ROUTER = CallbackRouter()
+ROUTER.register(DP)
+TRACER = Tracer(TRACE_FILE, parse_sample_rates(TRACE_SAMPLE)) if TRACE_FILE else None
+if TRACER is not None:
+    TRACER.instrument(DP)
+
+# 🔥 ПРОФИЛИРОВАНИЕ SQL ПО ЖЕЛАНИЮ: SQL_PROFILE=1, ПОРОГ МЕДЛЕННОГО ЗАПРОСА SQL_SLOW_MS
+PROFILER = QueryProfiler(slow_ms=float(os.environ.get('SQL_SLOW_MS', 50))) if os.environ.get('SQL_PROFILE') else None
+if STORAGE_ENGINE == 'sqlite':
+    DATABASE = Database(DATABASE_FILE, profiler=PROFILER, traced=TRACER is not None)
+    ENGINE = SQLiteEngine(DATABASE)
+else:
+    DATABASE = None
+    ENGINE = MemoryEngine()
+USERS = AsyncUsers(Users(ENGINE, profile_cache_size=int(os.environ.get('PROFILE_CACHE_SIZE', 10000))))
+# 🔥 КЭШ ОТРИСОВАННЫХ РЕЙТИНГОВ (ОТДАЕТСЯ В RatingHandler, ЧТОБЫ ВЫГРУЖАТЬ ЕГО ПОПАДАНИЯ)
+RENDER_CACHE = RenderCache()
+SCHEDULER = Scheduler()
+# 🔥 ОЧЕРЕДЬ ИСХОДЯЩИХ СООБЩЕНИЙ С ЛИМИТАМИ TELEGRAM
+# Общий лимит бота (30 в секунду) делится между шардами, лимиты чатов - нет: чат живет в одном шарде
+OUTBOX = Outbox(BOT, global_rate=30 / SHARD_COUNT)
+# 🔥 ОТЛОЖЕННОЕ УДАЛЕНИЕ ПРЕДУПРЕЖДЕНИЙ, ПЕРЕЖИВАЕТ ПЕРЕЗАПУСК
+OUTBOX.deferred = DeferredDeletions(USERS, OUTBOX)
+
+if DATABASE is not None:
+    metrics.count_commits(DATABASE)
+metrics.REGISTRY.register(metrics.Gauge(
+    'bot_worker_queue_depth', 'Апдейтов в очереди воркера',
+    lambda: {(index,): stats['depth'] for index, stats in enumerate(WORKERS.stats())}, ('worker',)
+))
+metrics.REGISTRY.register(metrics.Gauge(
+    'bot_outbox_depth', 'Сообщений в очереди исходящих',
+    lambda: {(name,): depth for name, depth in OUTBOX.depth().items()}, ('priority',)
+))
+metrics.REGISTRY.register(metrics.Gauge(
+    'bot_outbox_dropped', 'Выброшено поздравлений с запуска (очередь чата полна или устарели)',
+    lambda: {(reason,): count for reason, count in OUTBOX.dropped.items()}, ('reason',)
+))
+# 🔥 ПОПАДАНИЯ В КЭШИ ОТРИСОВАННЫХ РЕЙТИНГОВ И ПРОФИЛЕЙ
+CACHES = {'render': RENDER_CACHE, 'profile': USERS.users.profiles}
+metrics.REGISTRY.register(metrics.Gauge(
+    'bot_cache_hits', 'Попаданий в кэш с запуска',
+    lambda: {(name,): cache.hits for name, cache in CACHES.items()}, ('cache',)
+))
+metrics.REGISTRY.register(metrics.Gauge(
+    'bot_cache_misses', 'Промахов кэша с запуска',
+    lambda: {(name,): cache.misses for name, cache in CACHES.items()}, ('cache',)
+))
+metrics.REGISTRY.register(metrics.Gauge(
+    'bot_cache_hit_ratio', 'Доля попаданий в кэш',
+    lambda: {(name,): round(cache.hit_rate(), 4) for name, cache in CACHES.items()}, ('cache',)
+))
+METRICS_RUNNER = None
+
+# 🔥 КООРДИНАЦИЯ ШАРДОВ: ДЕЙСТВИЯ НАД ВСЕМИ ЧАТАМИ РАССЫЛАЮТСЯ ОСТАЛЬНЫМ ШАРДАМ
+# Список админов (ADMIN_IDS ниже) одинаково заводится в базе каждого шарда при запуске
+COORDINATOR = ShardCoordinator(SHARD_URLS, SHARD_INDEX, SHARD_SECRET) if SHARD_INDEX is not None else None
+
+async def set_congratulate(user_id: int, value: bool):
+    await USERS.set('users', user_id, None, 'congratulate', value)
+
+if COORDINATOR is not None:
+    COORDINATOR.register('reset_all_stats', USERS.reset_all_stats)
+    COORDINATOR.register('set_congratulate', set_congratulate)
 
 # 🔥 ИСПРАВЛЕНИЕ: Добавляем оба варианта эмодзи футбола
 GAMES = {
@@ -52,7 +174,7 @@ GAMES = {
 }
 
 # 🔥 ФУНКЦИЯ ДЛЯ ОБНОВЛЕНИЯ ПЕРИОДИЧЕСКОЙ СТАТИСТИКИ
-def check_and_reset_periodic_stats():
+async def check_and_reset_periodic_stats():
     """Проверяет и обновляет периодическую статистику при смене дня/недели"""
     try:
         current_date = datetime.now().strftime("%Y-%m-%d")
@@ -60,36 +182,33 @@ def check_and_reset_periodic_stats():
         
         logger.info(f"Проверка периодической статистики. Дата: {current_date}, Начало недели: {current_week_start}")
         
-        # Здесь можно добавить логику для очистки устаревших данных
-        # если это необходимо для вашей реализации
-        
-        # Для тестирования - логируем время
-        logger.info(f"Текущее время: {datetime.now().strftime('%H:%M:%S')}")
+        # Архивируем старые дни и чистим устаревшие данные порциями в потоке записи
+        await USERS.maintenance.run_async()
         
     except Exception as e:
         logger.error(f"Ошибка при проверке периодической статистики: {e}")
 
-# 🔥 ФУНКЦИЯ ДЛЯ ЗАПУСКА ПЛАНИРОВЩИКА
-def run_scheduler():
-    """Запускает планировщик для периодических задач"""
-    # Проверяем каждый час, чтобы не пропустить полночь
-    schedule.every().hour.do(check_and_reset_periodic_stats)
-    
-    # Также проверяем каждый понедельник в 00:00 для недельной статистики
-    schedule.every().monday.at("00:00").do(check_and_reset_periodic_stats)
-    
-    while True:
-        schedule.run_pending()
-        time.sleep(3600)  # Проверяем каждый час
+# 🔥 ЗАДАЧИ ПЛАНИРОВЩИКА: ЗАПУСК РОВНО В ПОЛНОЧЬ (В ПОНЕДЕЛЬНИК - ЭТО И СМЕНА НЕДЕЛИ)
+# Сдвиг до минуты, чтобы обслуживание не совпадало с первыми бросками новых суток
+SCHEDULER.add('periodic_stats', check_and_reset_periodic_stats, 'day', jitter=60)
+
+async def log_worker_stats():
+    """Раз в час пишет в лог метрики очередей воркеров"""
+    for index, stats in enumerate(WORKERS.stats()):
+        logger.info(
+            f"Воркер {index}: в очереди {stats['depth']} (макс. {stats['max_depth']}), "
+            f"обработано {stats['processed']}, ошибок {stats['errors']}, ожиданий места {stats['blocked']}, "
+            f"ожидание {stats['avg_wait'] * 1000:.1f}/{stats['max_wait'] * 1000:.1f} мс, "
+            f"обработка {stats['avg_handle'] * 1000:.1f}/{stats['max_handle'] * 1000:.1f} мс"
+        )
 
-# 🔥 ЗАПУСКАЕМ ПЛАНИРОВЩИК В ОТДЕЛЬНОМ ПОТОКЕ
-scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-scheduler_thread.start()
+SCHEDULER.add('worker_stats', log_worker_stats, 'hour')
 
 # 🔥 ИСПРАВЛЕНИЕ: Добавляем Саню в админы
 ADMIN_IDS = [1773287874, 1995856157]  
 for admin_id in ADMIN_IDS:
-    USERS.add_admin(admin_id)
+    # Синхронно: event loop еще не запущен
+    USERS.users.add_admin(admin_id)
 
 # 🔥 СПИСОК ИЗВЕСТНЫХ УЧАСТНИКОВ
 KNOWN_USERS = {
@@ -103,7 +222,7 @@ KNOWN_USERS = {
 }
 
 # 🔥 НОВЫЙ МИДЛВАРЬ ДЛЯ РУЧНОЙ БЛОКИРОВКИ ПОЛЬЗОВАТЕЛЕЙ
-class BlockedUsersMiddleware(BaseMiddleware):
+class BlockedUsersMiddleware(metrics.TimedMiddleware):
     async def on_pre_process_message(self, message: types.Message, data: dict):
         user_id = message.from_user.id
         chat_id = message.chat.id
@@ -112,38 +231,26 @@ class BlockedUsersMiddleware(BaseMiddleware):
         if message.text and message.text.lower() == '/help':
             return
         
-        # Проверяем ручную блокировку в базе данных
-        if USERS.is_user_blocked(user_id, chat_id):
+        # Проверяем ручную блокировку (индекс блокировок в памяти)
+        block_info = await USERS.get_block_info(user_id, chat_id)
+        if block_info:
             logger.warning(f"🚫 РУЧНАЯ БЛОКИРОВКА сообщения: UserID={user_id}, ChatID={chat_id}")
             
             # Для команд /start и /casino отправляем сообщение о блокировке
             if message.text and message.text.lower() in ['/start', '/casino']:
-                block_info = USERS.get_block_info(user_id, chat_id)
-                if block_info:
-                    from datetime import datetime
-                    end_time = datetime.strptime(block_info['end'], '%Y-%m-%d %H:%M:%S')
-                    remaining = end_time - datetime.now()
-                    minutes_left = int(remaining.total_seconds() / 60)
-                    
-                    # 🔥 УПРОЩЕННОЕ СООБЩЕНИЕ О БЛОКИРОВКЕ
-                    warning_msg = await BOT.send_message(
-                        chat_id,
-                        f'🚫 Пользователь @{message.from_user.username if message.from_user.username else message.from_user.full_name} заблокирован!\n'
-                        f'⏳ <b>Разблокировка через:</b> {minutes_left} минут',
-                        message_thread_id=message.message_thread_id if hasattr(message, 'message_thread_id') else None
-                    )
-                    
-                    await asyncio.sleep(5)
-                    try:
-                        await warning_msg.delete()
-                    except:
-                        pass
+                minutes_left = int((block_info['end'] - time.time()) / 60)
+                
+                # 🔥 УПРОЩЕННОЕ СООБЩЕНИЕ О БЛОКИРОВКЕ, УДАЛЯЕТСЯ ЧЕРЕЗ 5 СЕКУНД
+                OUTBOX.send_message(
+                    chat_id,
+                    f'🚫 Пользователь @{message.from_user.username if message.from_user.username else message.from_user.full_name} заблокирован!\n'
+                    f'⏳ <b>Разблокировка через:</b> {minutes_left} минут',
+                    priority=BLOCK, delete_after=5,
+                    message_thread_id=message.message_thread_id if hasattr(message, 'message_thread_id') else None
+                )
             
             # Удаляем сообщение
-            try:
-                await message.delete()
-            except:
-                pass
+            OUTBOX.delete_message(chat_id, message.message_id)
             
             # Полностью прерываем обработку сообщения
             raise CancelHandler()
@@ -153,18 +260,18 @@ class BlockedUsersMiddleware(BaseMiddleware):
         chat_id = callback_query.message.chat.id
         
         # Исключаем кнопку помощи из блокировки
-        if callback_query.data == 'help_send_request':
+        if callback_query.data in (HELP_REQUEST.pack(), HELP_REQUEST.legacy):
             return
             
-        if USERS.is_user_blocked(user_id, chat_id):
+        if await USERS.is_user_blocked(user_id, chat_id):
             logger.warning(f"🚫 РУЧНАЯ БЛОКИРОВКА callback: UserID={user_id}")
             await callback_query.answer("❌ Вы заблокированы в этом чате", show_alert=True)
             raise CancelHandler()
 
-class UserRegistrationMiddleware(BaseMiddleware):
+class UserRegistrationMiddleware(metrics.TimedMiddleware):
     async def on_pre_process_message(self, message: types.Message, data: dict):
-        if not USERS.get('users', message.from_user.id):
-            USERS.add(message.from_user.id, message.from_user.full_name)
+        if not await USERS.get('users', message.from_user.id):
+            await USERS.add(message.from_user.id, message.from_user.full_name)
 
 # 🔥 РЕГИСТРИРУЕМ МИДЛВАРИ В ПРАВИЛЬНОМ ПОРЯДКЕ
 DP.middleware.setup(BlockedUsersMiddleware())  # ПЕРВЫЙ - ручная блокировка
@@ -184,11 +291,11 @@ async def main_menu(message: types.Message):
     )
 
     keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton('🏆 Рейтинги', callback_data='rating_main'))
+    keyboard.add(InlineKeyboardButton('🏆 Рейтинги', callback_data=RATING_MAIN.pack()))
     
     # Добавляем кнопку для админов
-    if USERS.is_admin(user_id):
-        keyboard.add(InlineKeyboardButton('⚙️ Админ', callback_data='admin'))
+    if await USERS.is_admin(user_id):
+        keyboard.add(InlineKeyboardButton('⚙️ Админ', callback_data=ADMIN_PANEL.pack()))
 
     await BOT.send_message(
         chat_id,
@@ -234,10 +341,10 @@ async def info_command(message: types.Message):
 И не забывай: я помню ВСЁ. Каждые сутки, недели - ни одна попытка не скроется от моих глаз."""
 
     keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton('🏆 Рейтинги', callback_data='rating_main'))
+    keyboard.add(InlineKeyboardButton('🏆 Рейтинги', callback_data=RATING_MAIN.pack()))
     
-    if USERS.is_admin(message.from_user.id):
-        keyboard.add(InlineKeyboardButton('⚙️ Админ', callback_data='admin'))
+    if await USERS.is_admin(message.from_user.id):
+        keyboard.add(InlineKeyboardButton('⚙️ Админ', callback_data=ADMIN_PANEL.pack()))
 
     await BOT.send_message(
         message.chat.id, text,
@@ -255,7 +362,7 @@ async def help_command(message: types.Message):
     keyboard = InlineKeyboardMarkup(row_width=1)
     keyboard.add(
         InlineKeyboardButton('🚫 Я не согласен с блокировкой, рассмотрите эту заявку', 
-                           callback_data='help_send_request')
+                           callback_data=HELP_REQUEST.pack())
     )
     
     await BOT.send_message(
@@ -269,13 +376,13 @@ async def help_command(message: types.Message):
     )
 
 # Обработчик кнопки помощи (заявка на рассмотрение)
-@DP.callback_query_handler(lambda c: c.data == 'help_send_request')
+@ROUTER.handler(HELP_REQUEST)
 async def help_send_request_callback(callback: types.CallbackQuery):
     user_id = callback.from_user.id
     chat_id = callback.message.chat.id
     
     # Проверяем, заблокирован ли пользователь
-    if not USERS.is_user_blocked(user_id, chat_id):
+    if not await USERS.is_user_blocked(user_id, chat_id):
         await callback.answer("❌ Эта кнопка доступна только заблокированным пользователям", show_alert=True)
         return
     
@@ -283,49 +390,47 @@ async def help_send_request_callback(callback: types.CallbackQuery):
     username = f"@{callback.from_user.username}" if callback.from_user.username else "нет username"
     
     # Получаем информацию о блокировке
-    block_info = USERS.get_block_info(user_id, chat_id)
+    block_info = await USERS.get_block_info(user_id, chat_id)
     block_reason = block_info['reason'] if block_info else "Нарушение правил"
     
     # Сохраняем заявку в базу данных
     message_text = f"🚫 Заявка на рассмотрение блокировки\nПользователь: {user_name}\nUsername: {username}\nПричина блокировки: {block_reason}\n\nПользователь не согласен с блокировкой и просит рассмотреть заявку."
-    message_id = USERS.add_help_message(user_id, chat_id, message_text)
+    message_id = await USERS.add_help_message(user_id, chat_id, message_text)
     
     if message_id:
         await callback.answer("✅ Ваша заявка отправлена администратору!", show_alert=True)
         
-        # Уведомляем всех админов
+        # Уведомляем всех админов (ошибки отправки логирует очередь исходящих)
         for admin_id in ADMIN_IDS:
-            try:
-                await BOT.send_message(
-                    admin_id,
-                    f"🚨 <b>НОВАЯ ЗАЯВКА НА РАССМОТРЕНИЕ БЛОКИРОВКИ!</b>\n\n"
-                    f"👤 <b>Пользователь:</b> {user_name}\n"
-                    f"📱 <b>Username:</b> {username}\n"
-                    f"🆔 <b>ID:</b> {user_id}\n"
-                    f"💬 <b>Причина блокировки:</b> {block_reason}\n\n"
-                    f"⏰ <b>Время:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-                    f"<i>Пользователь не согласен с блокировкой и просит рассмотреть заявку.</i>"
-                )
-            except Exception as e:
-                print(f"Ошибка при отправке уведомления админу {admin_id}: {e}")
+            OUTBOX.send_message(
+                admin_id,
+                f"🚨 <b>НОВАЯ ЗАЯВКА НА РАССМОТРЕНИЕ БЛОКИРОВКИ!</b>\n\n"
+                f"👤 <b>Пользователь:</b> {user_name}\n"
+                f"📱 <b>Username:</b> {username}\n"
+                f"🆔 <b>ID:</b> {user_id}\n"
+                f"💬 <b>Причина блокировки:</b> {block_reason}\n\n"
+                f"⏰ <b>Время:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+                f"<i>Пользователь не согласен с блокировкой и просит рассмотреть заявку.</i>",
+                priority=ADMIN
+            )
     else:
         await callback.answer("❌ Ошибка при отправке заявки", show_alert=True)
 
 # 🔥 ПРОСТАЯ АДМИН ПАНЕЛЬ (упрощенная)
-@DP.callback_query_handler(lambda c: c.data == 'admin')
+@ROUTER.handler(ADMIN_PANEL)
 async def admin_panel(callback: types.CallbackQuery):
-    if not USERS.is_admin(callback.from_user.id):
+    if not await USERS.is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав администратора", show_alert=True)
         return
 
     keyboard = InlineKeyboardMarkup(row_width=2)
     keyboard.add(
-        InlineKeyboardButton('👥 Заблокировать', callback_data='admin-block-user'),
-        InlineKeyboardButton('✅ Разблокировать', callback_data='admin-unblock-user')
+        InlineKeyboardButton('👥 Заблокировать', callback_data=ADMIN_BLOCK.pack()),
+        InlineKeyboardButton('✅ Разблокировать', callback_data=ADMIN_UNBLOCK.pack())
     )
     keyboard.add(
-        InlineKeyboardButton('♻️ Сбросить рейтинги', callback_data='admin-reset-all'),
-        InlineKeyboardButton('🔙 Назад', callback_data='back-to-main')
+        InlineKeyboardButton('♻️ Сбросить рейтинги', callback_data=ADMIN_RESET_ALL.pack()),
+        InlineKeyboardButton('🔙 Назад', callback_data=BACK_TO_MAIN.pack())
     )
 
     await callback.message.edit_text(
@@ -336,9 +441,9 @@ async def admin_panel(callback: types.CallbackQuery):
     await callback.answer()
 
 # Выбор пользователя для блокировки
-@DP.callback_query_handler(lambda c: c.data == 'admin-block-user')
+@ROUTER.handler(ADMIN_BLOCK)
 async def admin_block_user(callback: types.CallbackQuery):
-    if not USERS.is_admin(callback.from_user.id):
+    if not await USERS.is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав администратора", show_alert=True)
         return
     
@@ -346,9 +451,9 @@ async def admin_block_user(callback: types.CallbackQuery):
     
     # Добавляем кнопки для каждого известного пользователя
     for user_id, name in KNOWN_USERS.items():
-        keyboard.add(InlineKeyboardButton(f'👤 {name}', callback_data=f'block_select_user-{user_id}'))
+        keyboard.add(InlineKeyboardButton(f'👤 {name}', callback_data=BLOCK_SELECT.pack(user_id)))
     
-    keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data='admin'))
+    keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data=ADMIN_PANEL.pack()))
     
     await callback.message.edit_text(
         "👥 <b>Выберите пользователя для блокировки:</b>",
@@ -357,29 +462,28 @@ async def admin_block_user(callback: types.CallbackQuery):
     await callback.answer()
 
 # Выбор времени блокировки
-@DP.callback_query_handler(lambda c: c.data.startswith('block_select_user-'))
-async def admin_block_select_time(callback: types.CallbackQuery):
-    if not USERS.is_admin(callback.from_user.id):
+@ROUTER.handler(BLOCK_SELECT)
+async def admin_block_select_time(callback: types.CallbackQuery, user_id: int):
+    if not await USERS.is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав администратора", show_alert=True)
         return
     
-    user_id = int(callback.data.split('-')[1])
     user_name = KNOWN_USERS.get(user_id, f"ID {user_id}")
     
     keyboard = InlineKeyboardMarkup(row_width=2)
     keyboard.add(
-        InlineKeyboardButton('⏰ 15 минут', callback_data=f'block_confirm-{user_id}-15'),
-        InlineKeyboardButton('⏰ 30 минут', callback_data=f'block_confirm-{user_id}-30')
+        InlineKeyboardButton('⏰ 15 минут', callback_data=BLOCK_CONFIRM.pack(user_id, 15)),
+        InlineKeyboardButton('⏰ 30 минут', callback_data=BLOCK_CONFIRM.pack(user_id, 30))
     )
     keyboard.add(
-        InlineKeyboardButton('⏰ 1 час', callback_data=f'block_confirm-{user_id}-60'),
-        InlineKeyboardButton('⏰ 3 часа', callback_data=f'block_confirm-{user_id}-180')
+        InlineKeyboardButton('⏰ 1 час', callback_data=BLOCK_CONFIRM.pack(user_id, 60)),
+        InlineKeyboardButton('⏰ 3 часа', callback_data=BLOCK_CONFIRM.pack(user_id, 180))
     )
     keyboard.add(
-        InlineKeyboardButton('⏰ 6 часов', callback_data=f'block_confirm-{user_id}-360'),
-        InlineKeyboardButton('⏰ 12 часов', callback_data=f'block_confirm-{user_id}-720')
+        InlineKeyboardButton('⏰ 6 часов', callback_data=BLOCK_CONFIRM.pack(user_id, 360)),
+        InlineKeyboardButton('⏰ 12 часов', callback_data=BLOCK_CONFIRM.pack(user_id, 720))
     )
-    keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data='admin-block-user'))
+    keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data=ADMIN_BLOCK.pack()))
     
     await callback.message.edit_text(
         f"👤 <b>Пользователь:</b> {user_name}\n"
@@ -389,25 +493,22 @@ async def admin_block_select_time(callback: types.CallbackQuery):
     await callback.answer()
 
 # Подтверждение и выполнение блокировки
-@DP.callback_query_handler(lambda c: c.data.startswith('block_confirm-'))
-async def admin_block_confirm(callback: types.CallbackQuery):
-    if not USERS.is_admin(callback.from_user.id):
+@ROUTER.handler(BLOCK_CONFIRM)
+async def admin_block_confirm(callback: types.CallbackQuery, user_id: int, minutes: int):
+    if not await USERS.is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав администратора", show_alert=True)
         return
     
-    data_parts = callback.data.split('-')
-    user_id = int(data_parts[1])
-    minutes = int(data_parts[2])
     user_name = KNOWN_USERS.get(user_id, f"ID {user_id}")
     
     # Предполагаем, что блокировка в основном чате
     chat_id = callback.message.chat.id
     
     # Блокируем пользователя
-    success = USERS.block_user(user_id, chat_id, "Нарушение правил", minutes)
+    success = await USERS.block_user(user_id, chat_id, "Нарушение правил", minutes)
     
     keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton('🔙 Назад в админку', callback_data='admin'))
+    keyboard.add(InlineKeyboardButton('🔙 Назад в админку', callback_data=ADMIN_PANEL.pack()))
     
     if success:
         await callback.message.edit_text(
@@ -418,33 +519,31 @@ async def admin_block_confirm(callback: types.CallbackQuery):
         )
         
         # Уведомляем пользователя без указания ID
-        try:
-            await BOT.send_message(
-                user_id,
-                f"🚫 <b>Вы были заблокированы в казино-боте!</b>\n\n"
-                f"⏳ <b>Длительность:</b> {minutes} минут\n\n"
-                f"Если вы считаете, что блокировка несправедлива, "
-                f"используйте команду /help в чате, чтобы написать администратору."
-            )
-        except:
-            pass
+        OUTBOX.send_message(
+            user_id,
+            f"🚫 <b>Вы были заблокированы в казино-боте!</b>\n\n"
+            f"⏳ <b>Длительность:</b> {minutes} минут\n\n"
+            f"Если вы считаете, что блокировка несправедлива, "
+            f"используйте команду /help в чате, чтобы написать администратору.",
+            priority=ADMIN
+        )
     
     await callback.answer()
 
 # Выбор пользователя для разблокировки
-@DP.callback_query_handler(lambda c: c.data == 'admin-unblock-user')
+@ROUTER.handler(ADMIN_UNBLOCK)
 async def admin_unblock_user(callback: types.CallbackQuery):
-    if not USERS.is_admin(callback.from_user.id):
+    if not await USERS.is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав администратора", show_alert=True)
         return
     
     # Получаем список заблокированных пользователей в текущем чате
     chat_id = callback.message.chat.id
-    blocked_users = USERS.get_all_blocked_users(chat_id)
+    blocked_users = await USERS.get_all_blocked_users(chat_id)
     
     if not blocked_users:
         keyboard = InlineKeyboardMarkup()
-        keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data='admin'))
+        keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data=ADMIN_PANEL.pack()))
         
         await callback.message.edit_text(
             "📭 <b>В этом чате нет заблокированных пользователей</b>",
@@ -461,10 +560,10 @@ async def admin_unblock_user(callback: types.CallbackQuery):
         
         keyboard.add(InlineKeyboardButton(
             f'✅ {user_name}', 
-            callback_data=f'unblock_user-{user_id}'
+            callback_data=UNBLOCK_USER.pack(user_id)
         ))
     
-    keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data='admin'))
+    keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data=ADMIN_PANEL.pack()))
     
     await callback.message.edit_text(
         "✅ <b>Выберите пользователя для разблокировки:</b>",
@@ -473,20 +572,19 @@ async def admin_unblock_user(callback: types.CallbackQuery):
     await callback.answer()
 
 # Выполнение разблокировки
-@DP.callback_query_handler(lambda c: c.data.startswith('unblock_user-'))
-async def admin_unblock_execute(callback: types.CallbackQuery):
-    if not USERS.is_admin(callback.from_user.id):
+@ROUTER.handler(UNBLOCK_USER)
+async def admin_unblock_execute(callback: types.CallbackQuery, user_id: int):
+    if not await USERS.is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав администратора", show_alert=True)
         return
     
-    user_id = int(callback.data.split('-')[1])
     user_name = KNOWN_USERS.get(user_id, "Пользователь")
     
     # Разблокируем пользователя во всех чатах (или в текущем)
     chat_id = callback.message.chat.id
     
     # Получаем все блокировки этого пользователя в текущем чате
-    blocked_users = USERS.get_all_blocked_users(chat_id)
+    blocked_users = await USERS.get_all_blocked_users(chat_id)
     user_blocked = any(user['user_id'] == user_id for user in blocked_users)
     
     if not user_blocked:
@@ -494,10 +592,10 @@ async def admin_unblock_execute(callback: types.CallbackQuery):
         return
     
     # Разблокируем пользователя
-    success = USERS.unblock_user(user_id, chat_id)
+    success = await USERS.unblock_user(user_id, chat_id)
     
     keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton('🔙 Назад в админку', callback_data='admin'))
+    keyboard.add(InlineKeyboardButton('🔙 Назад в админку', callback_data=ADMIN_PANEL.pack()))
     
     if success:
         await callback.message.edit_text(
@@ -507,27 +605,28 @@ async def admin_unblock_execute(callback: types.CallbackQuery):
         )
         
         # Уведомляем пользователя
-        try:
-            await BOT.send_message(
-                user_id,
-                "✅ <b>Вы были разблокированы!</b>\n\n"
-                "Администратор снял с вас блокировку. Теперь вы можете снова использовать бота."
-            )
-        except:
-            pass
+        OUTBOX.send_message(
+            user_id,
+            "✅ <b>Вы были разблокированы!</b>\n\n"
+            "Администратор снял с вас блокировку. Теперь вы можете снова использовать бота.",
+            priority=ADMIN
+        )
     
     await callback.answer()
 
-@DP.callback_query_handler(lambda c: c.data == 'admin-reset-all')
+@ROUTER.handler(ADMIN_RESET_ALL)
 async def admin_reset_all_ratings(callback: types.CallbackQuery):
-    if not USERS.is_admin(callback.from_user.id):
+    if not await USERS.is_admin(callback.from_user.id):
         await callback.answer("❌ У вас нет прав администратора", show_alert=True)
         return
 
-    success = USERS.reset_all_stats()
+    success = await USERS.reset_all_stats()
+    if COORDINATOR is not None:
+        # Остальные шарды сбрасывают свои чаты; успех - только если сбросили все
+        success = await COORDINATOR.broadcast('reset_all_stats') == SHARD_COUNT - 1 and success
 
     keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data='admin'))
+    keyboard.add(InlineKeyboardButton('🔙 Назад', callback_data=ADMIN_PANEL.pack()))
     
     if success:
         await callback.message.edit_text(
@@ -544,7 +643,7 @@ async def admin_reset_all_ratings(callback: types.CallbackQuery):
     
     await callback.answer()
 
-@DP.callback_query_handler(lambda c: c.data == 'back-to-main')
+@ROUTER.handler(BACK_TO_MAIN)
 async def back_to_main(callback: types.CallbackQuery):
     message = types.Message(
         message_id=callback.message.message_id,
@@ -557,9 +656,12 @@ async def back_to_main(callback: types.CallbackQuery):
 
 @DP.message_handler(commands=['congratulate'])
 async def congratulate(message: types.Message):
-    user = USERS.get('users', message.from_user.id)
+    user = await USERS.get('users', message.from_user.id)
     if user:
-        USERS.set('users', message.from_user.id, None, 'congratulate', False if user['congratulate'] else True)
+        await set_congratulate(message.from_user.id, False if user['congratulate'] else True)
+        if COORDINATOR is not None:
+            # Профиль игрока есть в каждом шарде, где он играл
+            await COORDINATOR.broadcast('set_congratulate', user_id=message.from_user.id, value=not user['congratulate'])
 
         await BOT.send_message(
             message.chat.id,
@@ -578,20 +680,21 @@ async def my_streak(message: types.Message):
     games_list = ['slots', 'dice', 'foot', 'bowl', 'bask', 'dart']
     has_streaks = False
     
+    game_names = {
+        'slots': '🎰 Слоты',
+        'dice': '🎲 Кубик',
+        'foot': '⚽️ Футбол',
+        'bowl': '🎳 Боулинг',
+        'bask': '🏀 Баскетбол',
+        'dart': '🎯 Дартс'
+    }
+    
+    # Один запрос по первичному ключу вместо перебора рейтингов всех игр
+    user_streaks = await USERS.get_user_streaks(user_id, chat_id)
     for game in games_list:
-        streaks_data = USERS.get_win_streaks(chat_id, game)
-        for streak in streaks_data:
-            if streak['id'] == user_id and streak['max_streak'] > 0:
-                game_names = {
-                    'slots': '🎰 Слоты',
-                    'dice': '🎲 Кубик',
-                    'foot': '⚽️ Футбол',
-                    'bowl': '🎳 Боулинг',
-                    'bask': '🏀 Баскетбол',
-                    'dart': '🎯 Дартс'
-                }
-                text_lines.append(f"{game_names.get(game, game)}: <b>{streak['max_streak']}</b>")
-                has_streaks = True
+        if user_streaks.get(game, 0) > 0:
+            text_lines.append(f"{game_names.get(game, game)}: <b>{user_streaks[game]}</b>")
+            has_streaks = True
     
     if not has_streaks:
         text_lines.append("\n📊 <i>У вас пока нет серий побед</i>")
@@ -602,12 +705,113 @@ async def my_streak(message: types.Message):
         message_thread_id=message.message_thread_id if hasattr(message, 'message_thread_id') else None
     )
 
+# Самые дорогие SQL-запросы (только для админов): /sqltop [N] [total|count|max|rows]
+@DP.message_handler(commands=['sqltop'])
+async def sql_top(message: types.Message):
+    if not await USERS.is_admin(message.from_user.id):
+        return
+
+    if PROFILER is None:
+        text = "📊 Профилирование SQL выключено. Запустите бота с SQL_PROFILE=1"
+    else:
+        args = message.get_args().split()
+        limit = min(int(args[0]), 20) if args and args[0].isdigit() else 10
+        order = args[1] if len(args) > 1 and args[1] in ('total', 'count', 'max', 'rows') else 'total'
+
+        text_lines = [f"📊 <b>Топ-{limit} SQL-запросов по {order}</b> (медленных: {PROFILER.slow})\n"]
+        length = len(text_lines[0])
+        for place, stats in enumerate(PROFILER.top(limit, order), 1):
+            line = (
+                f"<b>{place}.</b> {stats.total * 1000:.1f} мс, вызовов {stats.count}, "
+                f"ср. {stats.total * 1000 / max(stats.count, 1):.2f} мс, макс. {stats.max * 1000:.1f} мс, строк {stats.rows}\n"
+                f"<code>{html.escape(stats.sql[:300])}</code>"
+            )
+            # Сообщение Telegram - не больше 4096 символов
+            length += len(line) + 1
+            if length > 4000:
+                break
+            text_lines.append(line)
+        text = '\n'.join(text_lines)
+
+    await BOT.send_message(
+        message.chat.id, text,
+        message_thread_id=message.message_thread_id if hasattr(message, 'message_thread_id') else None
+    )
+
+# 🔥 ЗАПУСК И ОСТАНОВКА ФОНОВЫХ ЗАДАЧ
+async def on_startup(dp: Dispatcher):
+    global METRICS_RUNNER
+    if METRICS_PORT and METRICS_RUNNER is None:
+        METRICS_RUNNER = await metrics.start_server(METRICS_HOST, int(METRICS_PORT))
+    USERS.buffer.start()
+    WORKERS.start(dp)
+    SCHEDULER.start()
+    OUTBOX.start()
+    await OUTBOX.deferred.start()
+
+async def on_shutdown(dp: Dispatcher):
+    # Сначала перестаем получать апдейты и дорабатываем уже принятые
+    dp.stop_polling()
+    await WORKERS.stop()
+    await SCHEDULER.stop()
+    await OUTBOX.deferred.stop()
+    # Дожидаемся отправки поставленных в очередь сообщений
+    await OUTBOX.stop()
+    # Гарантированно записываем накопленную статистику перед выходом
+    await USERS.buffer.stop()
+    ENGINE.close()
+    if METRICS_RUNNER is not None:
+        await METRICS_RUNNER.cleanup()
+    if TRACER is not None:
+        TRACER.close()
+
+def start_webhook():
+    """Запускает прием апдейтов по вебхуку; Ctrl+C останавливает прием и дорабатывает очереди"""
+    receiver = WebhookReceiver(WORKERS, WEBHOOK_SECRET, path=urlparse(WEBHOOK_URL).path or '/webhook')
+
+    async def on_webhook_startup():
+        await on_startup(DP)
+        await BOT.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=ALLOWED_UPDATES)
+
+    async def on_webhook_shutdown():
+        # Вебхук не удаляем: пока бот перезапускается, Telegram копит апдейты у себя
+        await on_shutdown(DP)
+        await (await BOT.get_session()).close()
+
+    web.run_app(
+        receiver.make_app(on_webhook_startup, on_webhook_shutdown),
+        host=WEBHOOK_HOST, port=WEBHOOK_PORT
+    )
+
+def start_shard():
+    """Запускает процесс-шард: апдейты от фронта (shards.py) на /update, команды других шардов на /shard/command"""
+    receiver = WebhookReceiver(WORKERS, SHARD_SECRET, path='/update')
+
+    async def on_shard_shutdown():
+        await on_shutdown(DP)
+        await (await BOT.get_session()).close()
+
+    app = receiver.make_app(lambda: on_startup(DP), on_shard_shutdown)
+    app.router.add_post('/shard/command', COORDINATOR.handle)
+    logger.info(f"Шард {SHARD_INDEX} из {SHARD_COUNT}: хранилище {ENGINE.name} {DATABASE_FILE}, порт {SHARD_PORT}")
+    web.run_app(app, host='127.0.0.1', port=SHARD_PORT, print=None)
+
 if __name__ == '__main__':
-    MessagesHandler(DP, BOT, GAMES, USERS)
-    RatingHandler(DP, BOT, USERS)
+    MessagesHandler(DP, BOT, GAMES, USERS, OUTBOX)
+    RatingHandler(ROUTER, BOT, USERS, RENDER_CACHE)
+    # Замер времени всех хендлеров, включая зарегистрированные выше в этом файле
+    metrics.instrument_handlers(DP)
 
     print("🤖 Бот запущен и работает...")
     print("Для остановки нажми Ctrl+C")
     
-    executor.start_polling(DP, skip_updates=False, allowed_updates=["message", "callback_query"])
+    if SHARD_INDEX is not None:
+        start_shard()
+    elif WEBHOOK_URL:
+        start_webhook()
+    else:
+        executor.start_polling(
+            DP, skip_updates=False, allowed_updates=ALLOWED_UPDATES,
+            on_startup=on_startup, on_shutdown=on_shutdown
+        )
 
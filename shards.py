@@ -0,0 +1,184 @@
+"""Шардированный запуск бота: фронт и несколько процессов-шардов по ядрам процессора.
+
+Фронт получает апдейты (long polling или вебхук, если задан WEBHOOK_URL) и раскладывает
+их по chat_id в SHARDS процессов main.py. Каждый шард обрабатывает только свои чаты:
+свои хендлеры, кэши и файл базы data-<номер>.db. Действия админа над всеми чатами
+(сброс всех рейтингов) шард рассылает остальным через ShardCoordinator.
+
+Запуск:
+    BOT_TOKEN=... SHARDS=4 python shards.py
+
+Число шардов нельзя менять без переноса баз: чат привязан к шарду по chat_id % SHARDS.
+"""
+import os
+import sys
+import json
+import hmac
+import signal
+import asyncio
+import logging
+import secrets
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+from aiogram import Bot
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
+from aiohttp import web
+from urllib.parse import urlparse
+
+from libraries.sharding import ShardRouter
+from libraries.webhook import SECRET_HEADER
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+BOT_TOKEN = os.environ.get('BOT_TOKEN')
+if not BOT_TOKEN:
+    raise ValueError("❌ BOT_TOKEN not found in environment variables!")
+
+BOT_API_URL = os.environ.get('BOT_API_URL')
+SHARDS = int(os.environ.get('SHARDS', os.cpu_count() or 1))
+SHARD_BASE_PORT = int(os.environ.get('SHARD_BASE_PORT', 8100))
+SHARD_QUEUE_SIZE = int(os.environ.get('SHARD_QUEUE_SIZE', 1000))
+# Секрет между фронтом и шардами, новый при каждом запуске
+SHARD_SECRET = secrets.token_hex(16)
+
+WEBHOOK_URL = os.environ.get('WEBHOOK_URL')
+WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET')
+WEBHOOK_HOST = os.environ.get('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', 8080))
+if WEBHOOK_URL and not WEBHOOK_SECRET:
+    raise ValueError("❌ WEBHOOK_SECRET is required in webhook mode!")
+
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+def shard_env(index: int, urls: list):
+    """Окружение процесса-шарда: свой порт, база и порт метрик"""
+    env = dict(
+        os.environ,
+        SHARD_INDEX=str(index), SHARD_COUNT=str(SHARDS), SHARD_PORT=str(SHARD_BASE_PORT + index),
+        SHARD_SECRET=SHARD_SECRET, SHARD_URLS=','.join(urls),
+        DATABASE_FILE=os.environ.get('DATABASE_FILE', 'data-{shard}.db').format(shard=index),
+    )
+    # Вебхук у Telegram регистрирует фронт, шарды слушают только локальный порт
+    env.pop('WEBHOOK_URL', None)
+    if os.environ.get('METRICS_PORT'):
+        env['METRICS_PORT'] = str(int(os.environ['METRICS_PORT']) + index)
+    if os.environ.get('TRACE_FILE'):
+        env['TRACE_FILE'] = f"{os.environ['TRACE_FILE']}.{index}"
+    return env
+
+class Supervisor:
+    """Запускает процессы-шарды, перезапускает упавшие и останавливает их по SIGINT"""
+
+    def __init__(self, urls: list):
+        self.urls = urls
+        self.processes = [None] * len(urls)
+        self.stopping = False
+        self._tasks = []
+
+    async def spawn(self, index: int):
+        self.processes[index] = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(ROOT, 'main.py'), env=shard_env(index, self.urls),
+            # Своя группа процессов: Ctrl+C в терминале получает только фронт и останавливает шарды по порядку
+            start_new_session=True
+        )
+
+    async def watch(self, index: int):
+        while True:
+            await self.spawn(index)
+            code = await self.processes[index].wait()
+            if self.stopping:
+                return
+            logger.error(f"Шард {index} завершился с кодом {code}, перезапуск")
+            await asyncio.sleep(1)
+
+    def start(self):
+        loop = asyncio.get_event_loop()
+        self._tasks = [loop.create_task(self.watch(index)) for index in range(len(self.urls))]
+
+    async def stop(self, timeout: float = 60):
+        """SIGINT всем шардам: каждый дорабатывает свои очереди и сбрасывает буфер статистики"""
+        self.stopping = True
+        for process in self.processes:
+            if process is not None and process.returncode is None:
+                process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(asyncio.gather(*self._tasks), timeout)
+        except asyncio.TimeoutError:
+            logger.error("Шарды не остановились вовремя, завершаем принудительно")
+            for process in self.processes:
+                if process.returncode is None:
+                    process.kill()
+
+async def poll(bot: Bot, router: ShardRouter, stop: asyncio.Event):
+    """Long polling без разбора апдейтов: фронт только читает chat_id и пересылает JSON"""
+    params = {'timeout': 20, 'allowed_updates': json.dumps(ALLOWED_UPDATES)}
+    while not stop.is_set():
+        try:
+            updates = await bot.request('getUpdates', params)
+        except Exception as e:
+            logger.error(f"Ошибка getUpdates: {e}")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            await router.route(update)
+            params['offset'] = update['update_id'] + 1
+
+def webhook_app(router: ShardRouter):
+    async def handle(request: web.Request):
+        token = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(token.encode(), WEBHOOK_SECRET.encode()):
+            return web.Response(status=401)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        await router.route(update)
+        return web.Response(status=200)
+
+    app = web.Application()
+    app.router.add_post(urlparse(WEBHOOK_URL).path or '/webhook', handle)
+    return app
+
+async def run():
+    urls = [f'http://127.0.0.1:{SHARD_BASE_PORT + index}' for index in range(SHARDS)]
+    bot = Bot(token=BOT_TOKEN, server=TelegramAPIServer.from_base(BOT_API_URL) if BOT_API_URL else TELEGRAM_PRODUCTION)
+    router = ShardRouter(urls, SHARD_SECRET, queue_size=SHARD_QUEUE_SIZE)
+    supervisor = Supervisor(urls)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    supervisor.start()
+    router.start()
+    logger.info(f"Фронт: {SHARDS} шардов на портах {SHARD_BASE_PORT}-{SHARD_BASE_PORT + SHARDS - 1}")
+
+    runner = None
+    if WEBHOOK_URL:
+        runner = web.AppRunner(webhook_app(router), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+        await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET, allowed_updates=ALLOWED_UPDATES)
+        await stop.wait()
+        # Вебхук не удаляем: пока бот перезапускается, Telegram копит апдейты у себя
+        await runner.cleanup()
+    else:
+        polling = loop.create_task(poll(bot, router, stop))
+        await stop.wait()
+        polling.cancel()
+        await asyncio.gather(polling, return_exceptions=True)
+
+    # Сначала доставляем принятые апдейты, потом останавливаем шарды
+    await router.stop()
+    await supervisor.stop()
+    logger.info(f"Фронт остановлен: {router.stats()}")
+    await (await bot.get_session()).close()
+
+if __name__ == '__main__':
+    asyncio.run(run())